@@ -0,0 +1,166 @@
+from flask import Blueprint, request, jsonify, current_app, g
+from werkzeug.exceptions import HTTPException
+from modules.api_auth import rate_limit
+from modules.db import db, deferred_commits
+from modules.models import Case
+from modules.schemas import CaseSchema
+from modules.utils import remove_files
+import base64
+import io
+
+batch_bp = Blueprint('batch', __name__)
+
+case_schema = CaseSchema()
+
+MAX_BATCH_ITEMS = 100
+
+def _run_item(item):
+    """Runs one sub-request through the URL map and its view. Returns (status, body)."""
+    method = (item.get('method') or 'GET').upper()
+    path = item.get('path') or ''
+    if not path.startswith('/api/') or path.startswith('/api/batch'):
+        return 400, {'error': 'path must be an /api/ endpoint other than /api/batch'}
+
+    kwargs = {'method': method}
+    if item.get('files') or item.get('form'):
+        data = dict(item.get('form') or {})
+        for field, f in (item.get('files') or {}).items():
+            data[field] = (io.BytesIO(base64.b64decode(f['content_base64'])), f['filename'])
+        kwargs.update(data=data, content_type='multipart/form-data')
+    elif 'body' in item:
+        kwargs['json'] = item['body']
+
+    app = current_app._get_current_object()
+    # Shares the app context, so the DB session, g and the logged-in user are the batch's own
+    with app.test_request_context(path, **kwargs):
+        # dispatch_request() skips the before_request hooks, so the rate limit is taken here
+        limited = rate_limit(g.api_principal) if 'api_principal' in g else None
+        if limited is not None:
+            return limited.status_code, limited.get_json()
+        try:
+            response = app.make_response(app.dispatch_request())
+        except HTTPException as e:
+            response = e.get_response()
+            if response.mimetype != 'application/json':
+                return e.code, {'error': e.description}
+        except Exception as e:
+            current_app.logger.exception("Batch call %s %s failed", method, path)
+            return 500, {'error': str(e)}
+        body = response.get_json(silent=True)
+        if body is None and response.status_code >= 400:
+            body = {'error': response.get_data(as_text=True)}
+        return response.status_code, body
+
+def _run_items(items, mode):
+    """Runs the calls of a batch. Returns (results, index of the call that failed an atomic batch or None)."""
+    results = []
+    failed = None
+    if mode == 'per_item':
+        for item in items:
+            g.saved_files = set()
+            status, body = _run_item(item)
+            results.append({'status': status, 'body': body})
+            if status >= 400:
+                # A failed call may leave its flush pending; the next calls need a clean session
+                db.session.rollback()
+                remove_files(g.saved_files)
+    else:
+        # Views commit as usual; inside the batch those commits only flush
+        g.saved_files = set()
+        with deferred_commits(db.session()):
+            for index, item in enumerate(items):
+                status, body = _run_item(item)
+                results.append({'status': status, 'body': body})
+                if status >= 400:
+                    failed = index
+                    break
+        if failed is None:
+            db.session.commit()
+        else:
+            db.session.rollback()
+            remove_files(g.saved_files)
+            results.extend({'status': None, 'body': None, 'skipped': True} for _ in items[failed + 1:])
+    g.pop('saved_files', None)
+    return results, failed
+
+@batch_bp.route('/', methods=['POST'])
+def run_batch():
+    """
+    Run several API calls in one round trip
+    ---
+    tags:
+      - Batch
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            mode:
+              type: string
+              enum: [atomic, per_item]
+              description: atomic (default) runs every call in one transaction and stops at the first failure; per_item commits each call on its own
+            requests:
+              type: array
+              items:
+                type: object
+                properties:
+                  method:
+                    type: string
+                    example: PUT
+                  path:
+                    type: string
+                    example: /api/cases/1
+                  body:
+                    type: object
+                  form:
+                    type: object
+                  files:
+                    type: object
+                    description: "field -> {filename, content_base64}, sent as multipart with `form`"
+            dump_case:
+              type: integer
+              description: Return this case once after all calls and omit the bodies of successful calls
+    responses:
+      200:
+        description: Per-call status and body, in request order
+      400:
+        description: A call failed in atomic mode; nothing was saved
+    """
+    data = request.get_json() or {}
+    items = data.get('requests') or []
+    mode = data.get('mode', 'atomic')
+    dump_case = data.get('dump_case')
+    if mode not in ('atomic', 'per_item'):
+        return jsonify({'error': 'mode must be atomic or per_item'}), 400
+    if not items or len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'requests must hold 1 to {MAX_BATCH_ITEMS} calls'}), 400
+    if dump_case is not None:
+        if not str(dump_case).isdigit():
+            return jsonify({'error': 'dump_case must be a case id'}), 400
+        dump_case = int(dump_case)
+
+    # The calls' bodies are dropped below, so the views need not dump the case for each of them
+    g.batch_dump_case = dump_case
+    try:
+        results, failed = _run_items(items, mode)
+    finally:
+        g.pop('batch_dump_case', None)
+
+    if dump_case is not None:
+        for result in results:
+            if result['status'] is not None and result['status'] < 400:
+                result['body'] = None
+
+    response = {'results': results}
+    if failed is not None:
+        error = (results[failed]['body'] or {}).get('error') if isinstance(results[failed]['body'], dict) else None
+        response['error'] = error or f'Call {failed + 1} failed'
+        response['failed_index'] = failed
+        return jsonify(response), 400
+
+    if dump_case is not None:
+        case = db.session.get(Case, dump_case)
+        response['case'] = case_schema.dump(case) if case else None
+    return jsonify(response)
@@ -1,9 +1,24 @@
-from flask import Blueprint, request, jsonify
-from modules.db import db
+from flask import Blueprint, request, jsonify, current_app, Response
+from modules.db import db, lock_rows
+from modules.cache import get_cache
 from modules.models import Case, Person, Ownership, Document, LeaseContract
 from modules.schemas import CaseSchema, PersonSchema, OwnershipSchema
-from modules.utils import jalali_to_gregorian, save_file, get_shamsi_timestamp_now
+from modules.subdivision import subdivide, SubdivisionError
+from modules.archive import archive_cases, restore_cases
+from modules.extraction import matching_document_ids
+from modules.processing import enqueue_processing, initial_status
+from modules.uploads import UploadRejected, limits_for
+from modules.storage import get_storage, content_disposition
+from modules.document_zip import case_documents, stream_zip, safe_name
+from modules.replicas import replica_reads
+from modules.tenancy import visible
+from modules.utils import (jalali_to_gregorian, get_shamsi_timestamp_now, to_rials, stage_files, remove_files,
+                           batch_drops_body)
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime
 import jdatetime
 
@@ -12,6 +27,17 @@ cases_bp = Blueprint('cases', __name__)
 case_schema = CaseSchema()
 cases_schema = CaseSchema(many=True)
 person_schema = PersonSchema()
+# Flat rows for list views: no nested owners/documents/children
+case_summaries_schema = CaseSchema(many=True, only=('id', 'case_number', 'classification_number', 'address', 'status'))
+
+MAX_PAGE_SIZE = 500
+
+class OwnerTransferError(ValueError):
+    pass
+
+@cases_bp.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({'error': 'Upload is too large'}), 413
 
 @cases_bp.route('/', methods=['POST'])
 def create_case():
@@ -42,6 +68,11 @@ def create_case():
             توضیحات:
               type: string
               example: "New case description"
+      - name: view
+        in: query
+        type: string
+        enum: [full, summary]
+        description: summary returns only the new ids instead of the full nested case
     responses:
       201:
         description: Case created successfully
@@ -83,23 +114,51 @@ def create_case():
     data.pop('doc_descriptions', None)
     data.pop('documents', None) # Just in case
 
+    storage = get_storage()
+    staged = []
     try:
         new_case = case_schema.load(data, session=db.session)
-        db.session.add(new_case)
-        db.session.flush()
+        if new_case.parent_id is not None and not visible(Case, new_case.parent_id):
+            return jsonify({'error': 'Parent case not found'}), 404
+
+        # Stage uploaded files to disk (in parallel) before any row is written,
+        # so the write transaction is not held open during file I/O
+        doc_rows = []
+        if request.files:
+            # Since FormData append works by key, getting lists works if multiple items have same key.
+            # However, mapping file to title requires order preservation which getlist usually does.
+            files = request.files.getlist('documents') # The key used in verify script
+            titles = request.form.getlist('doc_titles')
+            categories = request.form.getlist('doc_categories')
+            descriptions = request.form.getlist('doc_descriptions')
+
+            shamsi_ts = get_shamsi_timestamp_now()
+            uploads = []
+            for i, file in enumerate(files):
+                if file and file.filename:
+                    title = titles[i] if i < len(titles) else file.filename
+                    category = categories[i] if i < len(categories) else 'Other'
+                    description = descriptions[i] if i < len(descriptions) else None
+                    # Generate custom filename
+                    uploads.append((file, f"{new_case.case_number}_{title}_{shamsi_ts}",
+                                    limits_for(category, current_app.config)))
+                    doc_rows.append((title, category, description))
+            staged = stage_files(uploads, storage, current_app.config.get('UPLOAD_STAGING_WORKERS', 4))
+
+        # Resolve owner and tenant with a single query
+        wanted_ids = [nid for nid in (owner_national_id, tenant_national_id if has_contract else None) if nid]
+        people = get_cache().get_many(Person, 'national_id', wanted_ids) if wanted_ids else {}
+
+        def resolve_person(national_id, **fields):
+            person = people.get(national_id)
+            if not person:
+                person = Person(national_id=national_id, **fields)
+                people[national_id] = person
+            return person
 
         # Handle initial owner if provided
         if owner_national_id:
-            person = Person.query.filter_by(national_id=owner_national_id).first()
-            if not person:
-                person = Person(
-                    full_name=owner_name,
-                    national_id=owner_national_id,
-                    phone=owner_phone,
-                    alt_phone=owner_alt_phone
-                )
-                db.session.add(person)
-                db.session.flush()
+            person = resolve_person(owner_national_id, full_name=owner_name, phone=owner_phone, alt_phone=owner_alt_phone)
 
             start_date = jalali_to_gregorian(owner_start_date_str) if owner_start_date_str else jdatetime.date.today().togregorian()
             end_date = jalali_to_gregorian(owner_end_date_str) if owner_end_date_str else None
@@ -107,87 +166,67 @@ def create_case():
             if end_date and end_date < datetime.utcnow().date():
                  is_current_owner = False
 
-            ownership = Ownership(
-                case_id=new_case.id,
-                person_id=person.id,
+            new_case.ownerships.append(Ownership(
+                person=person,
                 start_date=start_date,
                 end_date=end_date,
                 is_current=is_current_owner
-            )
-            db.session.add(ownership)
+            ))
 
         # Handle Contract
         if has_contract and tenant_national_id:
-            tenant = Person.query.filter_by(national_id=tenant_national_id).first()
-            if not tenant:
-                tenant = Person(
-                    full_name=tenant_name,
-                    national_id=tenant_national_id,
-                    phone=tenant_phone
-                )
-                db.session.add(tenant)
-                db.session.flush()
+            tenant = resolve_person(tenant_national_id, full_name=tenant_name, phone=tenant_phone)
 
             c_start = jalali_to_gregorian(contract_start_str) if contract_start_str else datetime.utcnow().date()
             c_end = jalali_to_gregorian(contract_end_str) if contract_end_str else datetime.utcnow().date()
 
-            contract = LeaseContract(
-                case_id=new_case.id,
-                tenant_id=tenant.id,
+            new_case.contracts.append(LeaseContract(
+                tenant=tenant,
                 start_date=c_start,
                 end_date=c_end,
-                base_rent=float(contract_rent) if contract_rent else 0,
+                base_rent=to_rials(contract_rent) or 0,
                 payment_period=contract_period
-            )
-            db.session.add(contract)
+            ))
 
         # Handle Documents
-        if request.files:
-            # files = request.files.getlist('documents[]') # For FormData
-            # titles = request.form.getlist('doc_titles[]')
-            # categories = request.form.getlist('doc_categories[]')
-
-            # Since FormData append works by key, getting lists works if multiple items have same key.
-            # However, mapping file to title requires order preservation which getlist usually does.
-
-            files = request.files.getlist('documents') # The key used in verify script
-            titles = request.form.getlist('doc_titles')
-            categories = request.form.getlist('doc_categories')
-            descriptions = request.form.getlist('doc_descriptions')
-
-            # Fallback for JS FormData array naming convention documents[i][file] which is harder to parse with getlist directly
-            # The plan assumes we use simple arrays: documents[], doc_titles[], doc_categories[]
-
-            for i, file in enumerate(files):
-                if file and file.filename:
-                    title = titles[i] if i < len(titles) else file.filename
-                    category = categories[i] if i < len(categories) else 'Other'
-                    description = descriptions[i] if i < len(descriptions) else None
-
-                    # Generate custom filename
-                    shamsi_ts = get_shamsi_timestamp_now()
-                    custom_name = f"{new_case.case_number}_{title}_{shamsi_ts}"
-
-                    filename = save_file(file, custom_name=custom_name)
-
-                    doc = Document(
-                        case_id=new_case.id,
-                        title=title,
-                        description=description,
-                        file_path=filename,
-                        category=category
-                    )
-                    db.session.add(doc)
-
+        for (title, category, description), stored in zip(doc_rows, staged):
+            new_case.documents.append(Document(
+                title=title,
+                description=description,
+                file_path=stored.filename,
+                category=category,
+                file_size=stored.size,
+                checksum=stored.checksum,
+                mime_type=stored.mime_type,
+                processing_status=initial_status(current_app.config, stored.mime_type)
+            ))
+
+        # Everything is inserted by the single flush in commit
+        db.session.add(new_case)
         db.session.commit()
-        return case_schema.dump(new_case), 201
+        enqueue_processing([d.id for d in new_case.documents])
+    except UploadRejected as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
+        remove_files([s.filename for s in staged], storage)
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 400
 
+    if request.args.get('view') == 'summary' or batch_drops_body():
+        return jsonify({
+            'شناسه': new_case.id,
+            'شماره_پرونده': new_case.case_number,
+            'شناسه_مالکیت_ها': [o.id for o in new_case.ownerships],
+            'شناسه_قراردادها': [c.id for c in new_case.contracts],
+            'شناسه_اسناد': [d.id for d in new_case.documents],
+        }), 201
+    return case_schema.dump(new_case), 201
+
 @cases_bp.route('/', methods=['GET'])
+@replica_reads
 def get_cases():
     """
     List all Cases with optional search
@@ -198,49 +237,193 @@ def get_cases():
       - name: search
         in: query
         type: string
-        description: Search term for case number, owner name, address, etc.
+        description: Search term for case number, owner name, address, document text, etc.
+      - name: limit
+        in: query
+        type: integer
+        description: Page size (max 500). When given, the response is a page object {items, offset, limit, total}
+      - name: offset
+        in: query
+        type: integer
+        description: Index of the first case of the page. total is only computed for offset 0
+      - name: view
+        in: query
+        type: string
+        enum: [full, summary]
+        description: summary returns only the list columns, without nested relations
+      - name: archived
+        in: query
+        type: integer
+        description: 1 lists archived cases instead of live ones
     responses:
       200:
-        description: List of cases
+        description: List of cases, or a page of cases when limit is given
     """
     search_term = request.args.get('search')
+    limit = request.args.get('limit', type=int)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    schema = case_summaries_schema if request.args.get('view') == 'summary' else cases_schema
     query = Case.query
+    if request.args.get('archived') == '1':
+        query = query.execution_options(include_archived=True).filter(Case.archived_at.isnot(None))
 
     if search_term:
         search = f"%{search_term}%"
+        conditions = [
+            Case.case_number.like(search),
+            Case.classification_number.like(search),
+            Case.description.like(search),
+            Case.address.like(search),
+            Person.full_name.like(search),
+            Person.national_id.like(search),
+            Document.title.like(search),
+            Document.description.like(search)
+        ]
+        # Document contents, through the full-text index
+        matching_documents = matching_document_ids(search_term)
+        if matching_documents is not None:
+            conditions.append(Document.id.in_(matching_documents))
         query = query.outerjoin(Case.ownerships).outerjoin(Ownership.person).outerjoin(Case.documents).filter(
-            or_(
-                Case.case_number.like(search),
-                Case.classification_number.like(search),
-                Case.description.like(search),
-                Case.address.like(search),
-                Person.full_name.like(search),
-                Person.national_id.like(search),
-                Document.title.like(search),
-                Document.description.like(search)
-            )
+            or_(*conditions)
         ).distinct()
 
-    cases = query.all()
-    return jsonify(cases_schema.dump(cases))
+    if limit is None:
+        return jsonify(schema.dump(query.all()))
+
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    page = {
+        'items': schema.dump(query.order_by(Case.id).offset(offset).limit(limit).all()),
+        'offset': offset,
+        'limit': limit,
+    }
+    if offset == 0:
+        # Clients keep the total from the first page
+        page['total'] = query.with_entities(db.func.count(db.distinct(Case.id))).order_by(None).scalar()
+    return jsonify(page)
 
 @cases_bp.route('/<int:case_id>', methods=['GET'])
 def get_case(case_id):
     case = Case.query.get_or_404(case_id)
+    if batch_drops_body():
+        return {'شناسه': case.id}
     return case_schema.dump(case)
 
 @cases_bp.route('/<int:case_id>', methods=['PUT'])
 def update_case(case_id):
     case = Case.query.get_or_404(case_id)
-    data = request.get_json()
+    data = dict(request.get_json() or {})
+
+    # Optional optimistic check: the version the client edited
+    expected_version = data.pop('نسخه', None)
+    if expected_version is not None and expected_version != case.version:
+        return jsonify({'error': 'Case was changed by someone else', 'current': case_schema.dump(case)}), 409
 
     try:
         updated_case = case_schema.load(data, session=db.session, instance=case, partial=True)
+        if updated_case.parent_id is not None and not visible(Case, updated_case.parent_id):
+            db.session.rollback()
+            return jsonify({'error': 'Parent case not found'}), 404
         db.session.commit()
+        if batch_drops_body():
+            return {'شناسه': updated_case.id}
         return case_schema.dump(updated_case)
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Case was changed by someone else, please retry'}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@cases_bp.route('/<int:case_id>', methods=['DELETE'])
+def delete_case(case_id):
+    """
+    Archive (soft delete) a case with its ownerships, documents, contracts and invoices
+    ---
+    tags:
+      - Cases
+    parameters:
+      - name: case_id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Case archived; it can be brought back with /restore
+      404:
+        description: No live case with this id
+    """
+    Case.query.get_or_404(case_id)
+    archive_cases([case_id])
+    db.session.commit()
+    return jsonify({'شناسه': case_id, 'بایگانی_شده': True})
+
+@cases_bp.route('/<int:case_id>/restore', methods=['POST'])
+def restore_case(case_id):
+    """
+    Restore an archived case and everything archived with it
+    ---
+    tags:
+      - Cases
+    parameters:
+      - name: case_id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: The restored case
+      400:
+        description: Case is not archived
+      404:
+        description: Case not found
+    """
+    archived_at = db.session.execute(
+        db.select(Case.archived_at).where(Case.id == case_id).execution_options(include_archived=True)
+    ).first()
+    if archived_at is None:
+        return jsonify({'error': 'Case not found'}), 404
+    if archived_at[0] is None:
+        return jsonify({'error': 'Case is not archived'}), 400
+    restore_cases([case_id])
+    db.session.commit()
+    if batch_drops_body():
+        return {'شناسه': case_id}
+    return case_schema.dump(db.session.get(Case, case_id))
+
+@cases_bp.route('/<int:case_id>/documents.zip', methods=['GET'])
+@replica_reads
+def download_case_documents(case_id):
+    """
+    Download all documents of a case as one ZIP, built while it is sent
+    ---
+    tags:
+      - Cases
+    produces:
+      - application/zip
+    parameters:
+      - name: case_id
+        in: path
+        type: integer
+        required: true
+      - name: include_children
+        in: query
+        type: integer
+        description: 1 also includes every subdivided child case, one folder per case
+    responses:
+      200:
+        description: ZIP archive
+      404:
+        description: Case not found
+    """
+    found = case_documents(case_id, request.args.get('include_children') == '1')
+    if found is None:
+        return jsonify({'error': 'Case not found'}), 404
+    case_number, entries = found
+
+    filename = f"{safe_name(case_number, fallback=str(case_id))}.zip"
+    response = Response(stream_zip(entries, get_storage()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = content_disposition(filename, fallback=f"case-{case_id}")
+    return response
+
 @cases_bp.route('/<int:case_id>/owners', methods=['POST'])
 def add_owner(case_id):
     """
@@ -271,24 +454,110 @@ def add_owner(case_id):
       400:
         description: Error
     """
-    case = Case.query.get_or_404(case_id)
+    Case.query.get_or_404(case_id)
     data = request.get_json()
 
+    try:
+        _transfer_owner([case_id], data)
+        db.session.commit()
+    except OwnerTransferError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Ownership was changed by another request, please retry'}), 409
+
+    # Return updated case
+    if batch_drops_body():
+        return {'شناسه': case_id}
+    return case_schema.dump(db.session.get(Case, case_id))
+
+@cases_bp.route('/transfer-owner', methods=['POST'])
+def transfer_owner_bulk():
+    """
+    Transfer ownership of many cases to one person in a single transaction
+    ---
+    tags:
+      - Cases
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            case_ids:
+              type: array
+              items:
+                type: integer
+            include_children:
+              type: boolean
+              description: Also transfer the direct children (subdivided units) of each case
+            نام_و_نام_خانوادگی:
+              type: string
+            کد_ملی:
+              type: string
+            تلفن_همراه:
+              type: string
+            start_date:
+              type: string
+              example: "1403/01/01"
+    responses:
+      200:
+        description: Ownership transferred for every case
+      400:
+        description: Error
+      404:
+        description: Some cases do not exist
+      409:
+        description: Concurrent ownership change, nothing was transferred
+    """
+    data = request.get_json() or {}
+    raw_ids = data.get('case_ids') or []
+    if not isinstance(raw_ids, list) or not all(isinstance(i, (int, str)) and str(i).isdigit() for i in raw_ids):
+        return jsonify({'error': 'case_ids must be a list of case ids'}), 400
+    case_ids = {int(i) for i in raw_ids}
+    if not case_ids:
+        return jsonify({'error': 'case_ids required'}), 400
+
+    found = {row[0] for row in db.session.query(Case.id).filter(Case.id.in_(case_ids))}
+    missing = sorted(case_ids - found)
+    if missing:
+        return jsonify({'error': 'Cases not found', 'missing': missing}), 404
+    if data.get('include_children'):
+        found.update(row[0] for row in db.session.query(Case.id).filter(Case.parent_id.in_(found)))
+
+    try:
+        _transfer_owner(sorted(found), data)
+        db.session.commit()
+    except OwnerTransferError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Ownership was changed by another request, please retry'}), 409
+
+    return jsonify({'شناسه_پرونده_ها': sorted(found), 'تعداد': len(found)})
+
+def _transfer_owner(case_ids, data):
+    """
+    Makes the person described by `data` the owner of `case_ids` without committing.
+
+    The cases are locked first, so concurrent transfers of the same case run
+    one after another and each one sees the ownership the previous one left.
+    The new person (if any), the archived ownerships and the new ones all go
+    into the caller's transaction.
+    """
     national_id = data.get('کد_ملی')
     if not national_id:
-         return jsonify({'error': 'کد_ملی required'}), 400
+        raise OwnerTransferError('کد_ملی required')
 
-    person = Person.query.filter_by(national_id=national_id).first()
+    lock_rows(Case, case_ids)
 
-    # If person doesn't exist, create them
+    person = get_cache().get(Person, 'national_id', national_id)
     if not person:
-        # Check if we have enough info to create person
         if not data.get('نام_و_نام_خانوادگی'):
-             return jsonify({'error': 'Person not found and name not provided'}), 400
-
-        # Extract person data from request (assuming flat structure or nested? let's assume flat for simplicity or use schema)
-        # Using schema would be cleaner but might fail if extra fields.
-        # Let's construct dict.
+            raise OwnerTransferError('Person not found and name not provided')
         person_data = {
             'نام_و_نام_خانوادگی': data.get('نام_و_نام_خانوادگی'),
             'کد_ملی': national_id,
@@ -297,47 +566,34 @@ def add_owner(case_id):
         }
         try:
             person = person_schema.load(person_data, session=db.session)
-            db.session.add(person)
-            db.session.commit()
         except Exception as e:
-            return jsonify({'error': f"Error creating person: {str(e)}"}), 400
+            raise OwnerTransferError(f"Error creating person: {str(e)}")
+        db.session.add(person)
 
-    # Handle dates
     start_date_str = data.get('start_date')
     end_date_str = data.get('end_date')
-    is_current = data.get('is_current', True)
-
     start_date = jalali_to_gregorian(start_date_str) if start_date_str else datetime.utcnow().date()
     end_date = jalali_to_gregorian(end_date_str) if end_date_str else None
+    is_current = not (end_date and end_date < datetime.utcnow().date())
 
-    if end_date and end_date < datetime.utcnow().date():
-        is_current = False
-    else:
-        is_current = True
-
-    # Logic: If we are adding a CURRENT owner, we must archive previous current owners.
-    # If we are adding a HISTORICAL owner (is_current=False), we don't touch others.
-
+    # Adding a CURRENT owner archives the previous current owners.
+    # Adding a HISTORICAL owner (ended in the past) leaves them alone.
     if is_current:
-        current_ownerships = Ownership.query.filter_by(case_id=case.id, is_current=True).all()
+        current_ownerships = (Ownership.query
+                              .filter(Ownership.case_id.in_(case_ids), Ownership.is_current == True)
+                              .execution_options(populate_existing=True)
+                              .all())
         for o in current_ownerships:
             o.is_current = False
-            # If no end date was set, set it to now (or new start date)
             if not o.end_date:
                 o.end_date = start_date
+        # Archive before inserting, or the new rows would hit the one-current-owner index
+        db.session.flush()
 
-    new_ownership = Ownership(
-        case_id=case.id,
-        person_id=person.id,
-        start_date=start_date,
-        end_date=end_date,
-        is_current=is_current
-    )
-    db.session.add(new_ownership)
-    db.session.commit()
-
-    # Return updated case
-    return case_schema.dump(case)
+    db.session.add_all([
+        Ownership(case_id=case_id, person=person, start_date=start_date, end_date=end_date, is_current=is_current)
+        for case_id in case_ids
+    ])
 
 @cases_bp.route('/<int:case_id>/subdivide', methods=['POST'])
 def subdivide_case(case_id):
@@ -372,51 +628,48 @@ def subdivide_case(case_id):
                     type: array
                     items:
                       type: integer
+            clone_ownership:
+              type: boolean
+              description: Make the parent's current owner the owner of every child
+      - name: view
+        in: query
+        type: string
+        enum: [full, summary]
+        description: summary returns only the new child ids
     responses:
       201:
         description: Sub-cases created successfully
+      400:
+        description: Invalid or already used case numbers
     """
     parent_case = Case.query.get_or_404(case_id)
     data = request.get_json()
 
-    children_data = data.get('children', [])
-    reason = data.get('reason', 'Subdivision')
-
-    created_children = []
-
     try:
-        for child_info in children_data:
-            # Create child case
-            child = Case(
-                parent_id=parent_case.id,
-                case_number=child_info.get('شماره_پرونده'),
-                classification_number=child_info.get('شماره_کلاسه'),
-                status='active',
-                address=child_info.get('آدرس', parent_case.address),
-                description=f"Subdivided from {parent_case.case_number}. Reason: {reason}. {child_info.get('توضیحات', '')}"
-            )
-            db.session.add(child)
-            # Flush to get ID if needed immediately, but loop is fine
-
-            # Transfer docs? Need explicit IDs or logic.
-            # Assuming simple copy of metadata pointing to same file
-            transfer_docs = child_info.get('docs_to_transfer', [])
-            for doc_id in transfer_docs:
-                original_doc = Document.query.get(doc_id)
-                if original_doc and original_doc.case_id == parent_case.id:
-                    new_doc = Document(
-                        case_id=None, # Will be set after flush
-                        title=original_doc.title,
-                        description=original_doc.description,
-                        file_path=original_doc.file_path,
-                        category=original_doc.category
-                    )
-                    child.documents.append(new_doc)
-
-            created_children.append(child)
-
+        child_ids = subdivide(parent_case, data.get('children', []), data.get('reason', 'Subdivision'),
+                              clone_ownership=bool(data.get('clone_ownership')))
         db.session.commit()
-        return cases_schema.dump(created_children), 201
+    except SubdivisionError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), **e.details}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e.orig)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
+
+    # The children's documents share the parent's (already processed) files; their text is copied over
+    enqueue_processing(db.session.scalars(db.select(Document.id).where(Document.case_id.in_(child_ids))).all())
+
+    if request.args.get('view') == 'summary' or batch_drops_body():
+        return jsonify({'شناسه_زیر_پرونده_ها': child_ids}), 201
+
+    children = (Case.query
+                .filter(Case.id.in_(child_ids))
+                .options(selectinload(Case.documents), selectinload(Case.ownerships).joinedload(Ownership.person),
+                         selectinload(Case.contracts), selectinload(Case.children))
+                .all())
+    position = {child_id: i for i, child_id in enumerate(child_ids)}
+    children.sort(key=lambda c: position[c.id])
+    return cases_schema.dump(children), 201
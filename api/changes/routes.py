@@ -0,0 +1,118 @@
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from modules.db import db
+from modules.changes import MAX_PAGE_SIZE, notifier, serialize, latest_seq, changes_since, encode_event
+import time
+
+changes_bp = Blueprint('changes', __name__)
+
+def _filters():
+    case_id = request.args.get('case_id', type=int)
+    models = [m for m in (request.args.get('model') or '').split(',') if m]
+    return case_id, models
+
+@changes_bp.route('/', methods=['GET'], strict_slashes=False)
+def list_changes():
+    """
+    Changes after a sequence number, for incremental sync
+    ---
+    tags:
+      - Changes
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        description: Last sequence number the client has applied (0 for everything)
+      - name: limit
+        in: query
+        type: integer
+        description: Page size (max 1000, default CHANGE_FEED_PAGE_SIZE)
+      - name: case_id
+        in: query
+        type: integer
+        description: Only changes of this case and its owners, documents, contracts and invoices
+      - name: model
+        in: query
+        type: string
+        description: Comma separated model names, e.g. Invoice or Case,Ownership
+    responses:
+      200:
+        description: "{changes, next, has_more}. Call again with since=next until has_more is false"
+    """
+    since = max(request.args.get('since', 0, type=int), 0)
+    limit = request.args.get('limit', current_app.config.get('CHANGE_FEED_PAGE_SIZE', 500), type=int)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    case_id, models = _filters()
+
+    entries = changes_since(since, limit, case_id, models, current_app.config.get('CHANGE_FEED_SETTLE', 0))
+    return jsonify({
+        'changes': [serialize(e) for e in entries],
+        'next': entries[-1].id if entries else since,
+        'has_more': len(entries) == limit,
+    })
+
+@changes_bp.route('/stream', methods=['GET'])
+def stream_changes():
+    """
+    Server-sent events stream of changes
+    ---
+    tags:
+      - Changes
+    produces:
+      - text/event-stream
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        description: Start after this sequence number (default - only new changes). Last-Event-ID takes precedence on reconnect
+      - name: case_id
+        in: query
+        type: integer
+      - name: model
+        in: query
+        type: string
+    responses:
+      200:
+        description: "`change` events whose data is one change as in /api/changes and whose id is its sequence number"
+    """
+    config = current_app.config
+    case_id, models = _filters()
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is None:
+        since = latest_seq()
+    db.session.remove()
+
+    page_size = config.get('CHANGE_FEED_PAGE_SIZE', 500)
+    poll_interval = config.get('CHANGE_FEED_POLL_INTERVAL', 1.0)
+    heartbeat = config.get('CHANGE_FEED_HEARTBEAT', 15)
+    max_age = config.get('CHANGE_FEED_STREAM_MAX_AGE', 300)
+    settle = config.get('CHANGE_FEED_SETTLE', 0)
+
+    def events():
+        last = since
+        deadline = time.monotonic() + max_age
+        last_sent = time.monotonic()
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            generation = notifier.generation
+            entries = changes_since(last, page_size, case_id, models, settle)
+            # Don't hold a connection (or a SQLite read snapshot) while waiting
+            db.session.remove()
+            for entry in entries:
+                last = entry.id
+                yield encode_event(entry)
+            if entries:
+                last_sent = time.monotonic()
+                if len(entries) == page_size:
+                    continue
+            elif time.monotonic() - last_sent >= heartbeat:
+                last_sent = time.monotonic()
+                yield ': keepalive\n\n'
+            notifier.wait(generation, min(poll_interval, max(deadline - time.monotonic(), 0)))
+        # Streams end after max_age; EventSource reconnects with Last-Event-ID
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
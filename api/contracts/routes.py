@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from modules.db import db
 from modules.models import LeaseContract, Case, Person
 from modules.schemas import LeaseContractSchema
+from modules.tenancy import visible
 from datetime import datetime
 
 contracts_bp = Blueprint('contracts', __name__)
@@ -34,10 +35,20 @@ def create_contract():
     responses:
       201:
         description: Contract created
+      404:
+        description: Case or tenant not found
     """
-    data = request.get_json()
+    data = request.get_json() or {}
     try:
         new_contract = contract_schema.load(data, session=db.session)
+        # The tenancy filter only covers reads: ids from the body must be the caller's organization's too.
+        # Checked after load, which turns the form's string ids into ints.
+        if not visible(Case, new_contract.case_id):
+            db.session.rollback()
+            return jsonify({'error': 'Case not found'}), 404
+        if not visible(Person, new_contract.tenant_id):
+            db.session.rollback()
+            return jsonify({'error': 'Tenant not found'}), 404
         db.session.add(new_contract)
         db.session.commit()
         return contract_schema.dump(new_contract), 201
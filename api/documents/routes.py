@@ -1,14 +1,30 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, current_app
 from modules.db import db
+from modules.cache import get_cache
 from modules.models import Document, Case
 from modules.schemas import DocumentSchema
+from modules.extraction import search as search_texts
+from modules.processing import enqueue_processing, initial_status, blocked_reason
+from modules.uploads import UploadRejected, limits_for, largest_limit
+from modules.storage import send_stored_file
+from modules.replicas import replica_reads
 from modules.utils import save_file, jalali_to_gregorian, get_shamsi_timestamp_now
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 from datetime import datetime
 
 documents_bp = Blueprint('documents', __name__)
 document_schema = DocumentSchema()
 
+MAX_SEARCH_RESULTS = 200
+
+# Room for the form fields next to the file in a multipart body
+FORM_OVERHEAD = 64 * 1024
+
+@documents_bp.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({'error': 'Upload is too large'}), 413
+
 @documents_bp.route('/', methods=['POST'])
 def upload_document():
     """
@@ -28,10 +44,24 @@ def upload_document():
       - name: title
         in: formData
         type: string
+      - name: category
+        in: formData
+        type: string
+        description: Decides the size and type limits (UPLOAD_LIMITS)
     responses:
       201:
-        description: Document uploaded
+        description: Document uploaded; وضعیت_پردازش is pending until post-processing ran
+      413:
+        description: File larger than its category allows
+      415:
+        description: File type not allowed for the category
     """
+    largest = largest_limit(current_app.config)
+    if largest is not None:
+        # A body no category could accept is refused from its Content-Length, before it is read
+        request.max_content_length = min(largest + FORM_OVERHEAD,
+                                         current_app.config.get('MAX_CONTENT_LENGTH') or largest + FORM_OVERHEAD)
+
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -43,7 +73,7 @@ def upload_document():
     if not case_id:
         return jsonify({'error': 'case_id required'}), 400
 
-    case = Case.query.get(case_id)
+    case = get_cache().get(Case, 'id', int(case_id)) if case_id.isdigit() else None
     if not case:
         return jsonify({'error': 'Case not found'}), 404
 
@@ -53,11 +83,14 @@ def upload_document():
     shamsi_ts = get_shamsi_timestamp_now()
     custom_filename = f"{case.case_number}_{title}_{shamsi_ts}"
 
-    file_path = save_file(file, custom_name=custom_filename)
-    if not file_path:
+    category = request.form.get('category')
+    try:
+        stored = save_file(file, custom_name=custom_filename, limits=limits_for(category, current_app.config))
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status
+    if not stored:
          return jsonify({'error': 'File save failed'}), 500
     description = request.form.get('description')
-    category = request.form.get('category')
 
     document_date_str = request.form.get('document_date')
     document_date = None
@@ -75,16 +108,56 @@ def upload_document():
         case_id=case_id,
         title=title,
         description=description,
-        file_path=file_path,
+        file_path=stored.filename,
         category=category,
-        document_date=document_date
+        document_date=document_date,
+        file_size=stored.size,
+        checksum=stored.checksum,
+        mime_type=stored.mime_type,
+        processing_status=initial_status(current_app.config, stored.mime_type)
     )
 
     db.session.add(new_doc)
     db.session.commit()
+    enqueue_processing([new_doc.id])
 
     return document_schema.dump(new_doc), 201
 
+@documents_bp.route('/search', methods=['GET'])
+@replica_reads
+def search_documents():
+    """
+    Search the text of documents
+    ---
+    tags:
+      - Documents
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Words to find; the last one also matches as a prefix
+      - name: limit
+        in: query
+        type: integer
+        description: Number of results (max 200, default 50)
+    responses:
+      200:
+        description: Matching documents, best first, each with a بخش_متن snippet
+      400:
+        description: q missing
+    """
+    term = request.args.get('q', '').strip()
+    if not term:
+        return jsonify({'error': 'q required'}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_SEARCH_RESULTS)
+
+    matches = search_texts(term, limit)
+    # Archived documents are left out by the query
+    documents = {d.id: d for d in Document.query.filter(Document.id.in_([doc_id for doc_id, _ in matches]))}
+    return jsonify([dict(document_schema.dump(documents[doc_id]), بخش_متن=snippet)
+                    for doc_id, snippet in matches if doc_id in documents])
+
 @documents_bp.route('/<int:doc_id>', methods=['GET'])
 def get_document(doc_id):
     doc = Document.query.get_or_404(doc_id)
@@ -93,6 +166,15 @@ def get_document(doc_id):
 @documents_bp.route('/<int:doc_id>/download', methods=['GET'])
 def download_document(doc_id):
     doc = Document.query.get_or_404(doc_id)
-    # Ensure absolute path or safe join
-    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
-    return send_from_directory(upload_folder, doc.file_path, as_attachment=True)
+    reason = blocked_reason(doc, current_app.config)
+    if reason:
+        return jsonify({'error': reason, 'وضعیت_پردازش': doc.processing_status}), 403 if doc.processing_status == 'quarantined' else 409
+    # Object stores redirect to a presigned URL, so the bytes skip the Flask worker
+    return send_stored_file(doc.file_path, download_name=os.path.basename(doc.file_path), mimetype=doc.mime_type)
+
+@documents_bp.route('/<int:doc_id>/thumbnail', methods=['GET'])
+def download_thumbnail(doc_id):
+    doc = Document.query.get_or_404(doc_id)
+    if not doc.thumbnail_path or blocked_reason(doc, current_app.config):
+        return jsonify({'error': 'No thumbnail'}), 404
+    return send_stored_file(doc.thumbnail_path, mimetype='image/jpeg', max_age=86400)
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from modules.db import db
+from modules.replicas import replica_reads
 from modules.models import Invoice, LeaseContract
 from modules.schemas import InvoiceSchema
+from modules.utils import compound_rent
 from datetime import datetime, timedelta
 import uuid
 
@@ -49,11 +51,9 @@ def generate_invoices():
         if next_due_date <= today:
             # Calculate amount (apply increase if > 1 year)
             years_passed = (today - contract.start_date).days // 365
-            amount = contract.base_rent
 
-            # Simple compounding
-            if years_passed > 0 and contract.annual_increase_percent > 0:
-                amount = amount * ((1 + contract.annual_increase_percent/100) ** years_passed)
+            # Simple compounding, exact to the Rial
+            amount = compound_rent(contract.base_rent, contract.annual_increase_percent, years_passed)
 
             new_invoice = Invoice(
                 contract_id=contract.id,
@@ -72,16 +72,21 @@ def generate_invoices():
     return jsonify(invoices_schema.dump(generated)), 201
 
 @invoices_bp.route('/', methods=['GET'])
+@replica_reads
 def get_invoices():
     invoices = Invoice.query.all()
     return jsonify(invoices_schema.dump(invoices))
 
 @invoices_bp.route('/reports/financial', methods=['GET'])
+@replica_reads
 def financial_report():
-    total_unpaid = Invoice.query.filter_by(status='unpaid').count()
-    total_amount_due = db.session.query(db.func.sum(Invoice.amount)).filter_by(status='unpaid').scalar() or 0
+    # Count and sum in one pass; amounts are integer Rials so SUM is exact
+    total_unpaid, total_amount_due = db.session.query(
+        db.func.count(Invoice.id),
+        db.func.coalesce(db.func.sum(Invoice.amount), 0)
+    ).filter(Invoice.status == 'unpaid').one()
 
     return jsonify({
         'تعداد_بدهکاران': total_unpaid,
-        'مجموع_بدهی': total_amount_due
+        'مجموع_بدهی': int(total_amount_due)
     })
@@ -0,0 +1,136 @@
+from flask import Blueprint, request, jsonify, current_app
+from modules.db import db
+from modules.changes import latest_seq
+from modules.sync import snapshot, delta, push, SyncError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+sync_bp = Blueprint('sync', __name__)
+
+MAX_PAGE_SIZE = 1000
+
+def _case_ids():
+    """The `cases` query parameter (comma separated ids), or None for all cases."""
+    raw = request.args.get('cases')
+    if not raw:
+        return None
+    try:
+        return [int(i) for i in raw.split(',') if i]
+    except ValueError:
+        raise SyncError('cases must be comma separated case ids')
+
+def _limit(config_key, default):
+    limit = request.args.get('limit', current_app.config.get(config_key, default), type=int)
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+@sync_bp.errorhandler(SyncError)
+def handle_sync_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@sync_bp.route('/snapshot', methods=['GET'])
+def get_snapshot():
+    """
+    First download of an offline copy, a page of cases at a time
+    ---
+    tags:
+      - Sync
+    parameters:
+      - name: cases
+        in: query
+        type: string
+        description: Comma separated ids of the cases to copy (default - all cases)
+      - name: after
+        in: query
+        type: integer
+        description: next_after of the previous page (0 for the first page)
+      - name: limit
+        in: query
+        type: integer
+        description: Cases per page (max 1000)
+    responses:
+      200:
+        description: "{upserts: {Case, Person, Ownership, Document: [rows]}, next_after, has_more, watermark}. Keep the watermark of the first page and pass it as since to /api/sync/changes"
+    """
+    watermark = latest_seq()
+    page = snapshot(_case_ids(), max(request.args.get('after', 0, type=int), 0),
+                    _limit('SYNC_SNAPSHOT_PAGE_SIZE', 200))
+    page['watermark'] = watermark
+    return jsonify(page)
+
+@sync_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Changes to an offline copy since its watermark
+    ---
+    tags:
+      - Sync
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        required: true
+        description: Watermark of the client's copy
+      - name: cases
+        in: query
+        type: string
+        description: Comma separated ids of the cases the client keeps (default - all cases)
+      - name: limit
+        in: query
+        type: integer
+        description: Changes scanned per page (max 1000)
+    responses:
+      200:
+        description: "{upserts, tombstones: {model: [ids]}, watermark, has_more}. Store the watermark once the page is applied"
+    """
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        raise SyncError('since is required (use /api/sync/snapshot for the first download)')
+    return jsonify(delta(since, _case_ids(), _limit('SYNC_DELTA_PAGE_SIZE', 1000)))
+
+@sync_bp.route('/push', methods=['POST'])
+def push_changes():
+    """
+    Upload edits made offline
+    ---
+    tags:
+      - Sync
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            changes:
+              type: array
+              items:
+                type: object
+                properties:
+                  model:
+                    type: string
+                    enum: [Case, Person, Document]
+                  id:
+                    type: integer
+                  version:
+                    type: integer
+                    description: نسخه of the row the edit was made on
+                  data:
+                    type: object
+                    description: Changed columns by column name
+    responses:
+      200:
+        description: "{applied: [{model, id, version}], conflicts: [{model, id, current | deleted}], rejected}. Conflicting edits are not applied"
+      409:
+        description: A row changed while the edits were applied; nothing was saved, push again
+    """
+    data = request.get_json() or {}
+    try:
+        applied, conflicts, rejected = push(data.get('changes'))
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Rows changed while applying, please push again'}), 409
+    except (SyncError, IntegrityError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e.orig) if isinstance(e, IntegrityError) else str(e)}), 400
+    return jsonify({'applied': applied, 'conflicts': conflicts, 'rejected': rejected})
@@ -2,19 +2,26 @@ from flask import Flask
 from config import Config
 from flasgger import Swagger
 from flask_login import LoginManager
-import os
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    # Ensure upload folder exists
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Where document files live: UPLOAD_FOLDER or an object store (modules/storage.py)
+    from modules.storage import init_storage
+    init_storage(app)
 
-    # Initialize extensions
+    # Initialize extensions (read replicas are extra binds, so they are configured first)
     from modules.db import db, ma
+    from modules.replicas import configure_binds, init_replicas
+    replica_keys = configure_binds(app)
     db.init_app(app)
     ma.init_app(app)
+    init_replicas(app, replica_keys)
+
+    # In-process (and optionally cross-process) cache for lookups by key
+    from modules.cache import init_cache, get_cache
+    init_cache(app)
 
     login_manager = LoginManager()
     login_manager.login_view = 'web.login'
@@ -23,10 +30,23 @@ def create_app(config_class=Config):
     from modules.models import User
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Detached copy: the principal is only read, so it never needs the session
+        return get_cache().get(User, 'id', int(user_id), attach=False)
+
+    # Password checks run on a bounded pool (see modules/auth.py)
+    from modules.auth import init_auth
+    init_auth(app)
 
     swagger = Swagger(app)
 
+    # Archived (soft deleted) rows are left out of ORM queries
+    from modules.archive import init_archive
+    init_archive(app)
+
+    # Background processing of uploaded documents (scan, thumbnails, text for content search)
+    from modules.processing import init_processing
+    init_processing(app)
+
     # Register Audit Listeners
     from modules.audit import register_audit_listeners
     register_audit_listeners()
@@ -35,6 +55,26 @@ def create_app(config_class=Config):
     from modules.logger import setup_logger
     setup_logger(app)
 
+    # Request timing, Server-Timing headers and /metrics
+    from modules.metrics import init_metrics
+    init_metrics(app)
+
+    # Registered after metrics so compression time is part of the measured request
+    from modules.compression import init_compression
+    init_compression(app)
+
+    # Wakes /api/changes/stream listeners when a commit wrote audited changes
+    from modules.changes import init_changes
+    init_changes(app)
+
+    # Token auth and rate limiting for /api/* (after metrics, so refusals are measured)
+    from modules.api_auth import init_api_auth
+    init_api_auth(app)
+
+    # Each request works inside one organization (district); registered after the token check
+    from modules.tenancy import init_tenancy
+    init_tenancy(app)
+
     # Register Blueprints
     from api.cases.routes import cases_bp
     app.register_blueprint(cases_bp, url_prefix='/api/cases')
@@ -48,6 +88,19 @@ def create_app(config_class=Config):
     from api.invoices.routes import invoices_bp
     app.register_blueprint(invoices_bp, url_prefix='/api/invoices')
 
+    from api.batch.routes import batch_bp
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+
+    from api.changes.routes import changes_bp
+    app.register_blueprint(changes_bp, url_prefix='/api/changes')
+
+    from api.sync.routes import sync_bp
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+
+    # Fingerprinted, precompressed static bundle (see download_assets.py)
+    from modules.assets import init_assets
+    init_assets(app)
+
     from web.routes import web_bp
     app.register_blueprint(web_bp, url_prefix='/')
 
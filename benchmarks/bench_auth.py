@@ -0,0 +1,110 @@
+"""
+Benchmark: authentication overhead.
+
+Usage:
+    python benchmarks/bench_auth.py [--requests 500] [--logins 64] [--threads 16]
+
+1. Authenticated page requests: latency and SQL statements per request of a
+   `login_required` page, with the principal cache on and off, against the
+   same page with login disabled (the floor).
+2. Login storm: --logins concurrent logins from --threads threads. Reports
+   throughput, p50/p99 latency and how many were shed with 503 because the
+   hash pool was full.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+from app import create_app
+from modules.db import db
+from modules.models import User
+
+def build_config(db_path, **overrides):
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(db_path)}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'crm-bench-uploads')
+        SECRET_KEY = 'bench'
+        LOG_2XX_SAMPLE_RATE = 0.0
+    for key, value in overrides.items():
+        setattr(BenchConfig, key, value)
+    return BenchConfig
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def bench_pages(db_path, n, label, **overrides):
+    app = create_app(build_config(db_path, **overrides))
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'secret'})
+    queries = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a, **k: queries.append(1))
+    client.get('/')  # warm up
+    queries.clear()
+    timings = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        res = client.get('/')
+        timings.append((time.perf_counter() - t0) * 1000)
+        assert res.status_code == 200, res.status_code
+    print(f"{label:<28} p50={percentile(timings, 50):6.2f}ms p99={percentile(timings, 99):6.2f}ms "
+          f"queries/request={len(queries) / n:.1f}")
+
+def bench_login_storm(db_path, logins, threads):
+    app = create_app(build_config(db_path))
+    results, lock = [], threading.Lock()
+    per_thread = logins // threads
+
+    def worker():
+        for _ in range(per_thread):
+            client = app.test_client()  # fresh session: logged-in clients skip the password check
+            t0 = time.perf_counter()
+            res = client.post('/login', data={'username': 'bench', 'password': 'secret'})
+            with lock:
+                results.append(((time.perf_counter() - t0) * 1000, res.status_code))
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    ok = [ms for ms, status in results if status == 302]
+    shed = sum(1 for _, status in results if status == 503)
+    workers = app.config.get('AUTH_HASH_WORKERS', 2)
+    print(f"login storm ({workers} hash workers)  {len(ok)} ok, {shed} shed in {elapsed:.2f}s "
+          f"({len(ok) / elapsed:.1f} logins/s) p50={percentile(ok, 50):.0f}ms p99={percentile(ok, 99):.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        app = create_app(build_config(db_path))
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('secret')
+            db.session.add(user)
+            db.session.commit()
+
+        bench_pages(db_path, args.requests, 'authenticated, cached')
+        bench_pages(db_path, args.requests, 'authenticated, no cache', CACHE_ENABLED=False)
+        bench_pages(db_path, args.requests, 'login disabled (floor)', LOGIN_DISABLED=True)
+        bench_login_storm(db_path, args.logins, args.threads)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: CPU cost vs. bandwidth saved by response compression.
+
+Usage:
+    python benchmarks/bench_compression.py [--cases 1000] [--bandwidth-mbit 10]
+
+Generates a dataset, captures real payloads (case list, case detail with
+children, invoice list) and, for every available encoding and a range of
+levels, reports compression time, ratio and the estimated time to deliver
+the body over the given link (compress + transfer).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+from app import create_app
+from modules.db import db
+from modules.models import Case
+from modules.compression import available_encodings, compress
+from modules.datagen import generate
+
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 4, 6, 11], 'zstd': [1, 3, 9, 19]}
+
+def build_config(db_path):
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        UPLOAD_FOLDER = os.path.join(os.path.dirname(db_path), 'uploads')
+        TESTING = True
+        API_AUTH_REQUIRED = False
+        RATE_LIMIT_ENABLED = False
+        COMPRESS_ENABLED = False
+    return BenchConfig
+
+def capture_payloads(app):
+    client = app.test_client()
+    with app.app_context():
+        parent_id = db.session.query(Case.parent_id).filter(Case.parent_id.isnot(None)) \
+            .group_by(Case.parent_id).order_by(func.count().desc()).limit(1).scalar() or 1
+        db.session.remove()
+    return {
+        'case_list': client.get('/api/cases/').get_data(),
+        'case_detail': client.get(f'/api/cases/{parent_id}').get_data(),
+        'invoice_list': client.get('/api/invoices/').get_data(),
+    }
+
+def timed_compress(body, encoding, level, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = compress(body, encoding, level)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', type=int, default=1000)
+    parser.add_argument('--bandwidth-mbit', type=float, default=10.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    bytes_per_s = args.bandwidth_mbit * 1_000_000 / 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(build_config(os.path.join(tmp, 'bench.db')))
+        with app.app_context():
+            db.create_all()
+            generate(args.cases, log=lambda msg: None)
+            db.session.remove()
+        payloads = capture_payloads(app)
+
+    print(f"Link: {args.bandwidth_mbit} Mbit/s. Encodings available: {', '.join(available_encodings())}\n")
+    for name, body in payloads.items():
+        escaped = json.dumps(json.loads(body), ensure_ascii=True, separators=(',', ':')).encode()
+        print(f"{name}: {len(body):,} bytes UTF-8 ({len(escaped):,} bytes with \\u escapes)")
+        print(f"  {'encoding':<10}{'level':>6}{'bytes':>14}{'ratio':>8}{'cpu ms':>10}{'MB/s':>9}{'deliver ms':>12}")
+        print(f"  {'identity':<10}{'-':>6}{len(body):>14,}{1.0:>8.2f}{0.0:>10.1f}{'-':>9}"
+              f"{len(body) / bytes_per_s * 1000:>12.1f}")
+        for encoding in available_encodings():
+            for level in LEVELS[encoding]:
+                out, cpu = timed_compress(body, encoding, level, args.repeat)
+                deliver = cpu + len(out) / bytes_per_s
+                print(f"  {encoding:<10}{level:>6}{len(out):>14,}{len(body) / len(out):>8.1f}"
+                      f"{cpu * 1000:>10.1f}{len(body) / cpu / 1e6:>9.1f}{deliver * 1000:>12.1f}")
+        print()
+
+if __name__ == '__main__':
+    main()
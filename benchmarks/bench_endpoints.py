@@ -0,0 +1,151 @@
+"""
+Benchmark: latency and query counts of the main API endpoints.
+
+Usage:
+    python benchmarks/bench_endpoints.py --cases 10000 [--iterations 20]
+    python benchmarks/bench_endpoints.py --db instance/crm.db   # existing dataset
+
+Drives list, search, detail, invoice generation and the financial report
+through the Flask test client, and prints p50/p90/p99/max latency with the
+number of SQL statements per request. Each run is appended as one JSON line
+to --output so results can be compared over time.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event, func
+from app import create_app
+from modules.db import db
+from modules.models import Case, Person
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), 'results', 'endpoints.jsonl')
+
+def build_config(db_path):
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(db_path)}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'crm-bench-uploads')
+        TESTING = True
+        API_AUTH_REQUIRED = False
+        RATE_LIMIT_ENABLED = False
+    return BenchConfig
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def scenarios(rnd, case_ids, search_terms):
+    return {
+        'list': lambda: ('GET', '/api/cases/'),
+        'search': lambda: ('GET', f'/api/cases/?search={rnd.choice(search_terms)}'),
+        'detail': lambda: ('GET', f'/api/cases/{rnd.choice(case_ids)}'),
+        'generate_invoices': lambda: ('POST', '/api/invoices/generate'),
+        'financial_report': lambda: ('GET', '/api/invoices/reports/financial'),
+    }
+
+def run(app, names, iterations, list_iterations, seed):
+    rnd = random.Random(seed)
+    client = app.test_client()
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+        max_id = db.session.query(func.max(Case.id)).scalar() or 0
+        case_ids = [rnd.randint(1, max_id) for _ in range(200)] if max_id else [1]
+        search_terms = [p.full_name.split()[0] for p in Person.query.limit(50).all()] or ['a']
+        search_terms += [f'G-{rnd.randint(1, max(max_id, 1)):08d}' for _ in range(20)]
+        db.session.remove()
+
+        available = scenarios(rnd, case_ids, search_terms)
+        results = {}
+        for name in names:
+            n = list_iterations if name in ('list', 'search') else iterations
+            timings, queries, sizes, statuses = [], [], [], set()
+            for _ in range(n):
+                method, url = available[name]()
+                before = counter.count
+                t0 = time.perf_counter()
+                res = client.open(url, method=method)
+                timings.append((time.perf_counter() - t0) * 1000)
+                queries.append(counter.count - before)
+                sizes.append(len(res.get_data()))
+                statuses.add(res.status_code)
+            results[name] = {
+                'n': n,
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p90_ms': round(percentile(timings, 90), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'max_ms': round(max(timings), 2),
+                'queries_avg': round(sum(queries) / n, 1),
+                'queries_max': max(queries),
+                'bytes_avg': int(sum(sizes) / n),
+                'statuses': sorted(statuses),
+            }
+            r = results[name]
+            print(f"{name:<18} n={n:<4} p50={r['p50_ms']:>9.1f}ms p90={r['p90_ms']:>9.1f}ms "
+                  f"p99={r['p99_ms']:>9.1f}ms queries={r['queries_avg']:>7} bytes={r['bytes_avg']:,}")
+    return results
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Existing SQLite database to benchmark against')
+    parser.add_argument('--cases', type=int, default=5000, help='Cases to generate when --db is not given')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--list-iterations', type=int, default=5, help='Iterations for list and search')
+    parser.add_argument('--scenarios', default='list,search,detail,generate_invoices,financial_report')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    names = args.scenarios.split(',')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, 'bench.db')
+        app = create_app(build_config(db_path))
+        if not args.db:
+            from modules.datagen import generate
+            with app.app_context():
+                db.create_all()
+                print(f"Generating {args.cases:,} cases...")
+                generate(args.cases, seed=args.seed, log=lambda msg: None)
+                db.session.remove()
+
+        results = run(app, names, args.iterations, args.list_iterations, args.seed)
+        with app.app_context():
+            dataset = {'cases': db.session.query(func.count(Case.id)).scalar()}
+            db.session.remove()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'dataset': dataset,
+            'results': results,
+        }) + '\n')
+    print(f"Results appended to {args.output}")
+
+if __name__ == '__main__':
+    main()
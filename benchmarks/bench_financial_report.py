@@ -0,0 +1,111 @@
+"""
+Benchmark: financial report aggregation over a large invoice table.
+
+Usage:
+    python benchmarks/bench_financial_report.py [--invoices 1000000] [--repeat 5]
+
+Builds a throwaway SQLite database, bulk inserts the invoices, then times
+`GET /api/invoices/reports/financial` through the Flask test client and
+checks the total against an exact Python sum.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from modules.db import db
+from modules.models import Case, Person, LeaseContract, Invoice
+
+CHUNK = 50000
+
+def build_config(db_path):
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        UPLOAD_FOLDER = os.path.join(os.path.dirname(db_path), 'uploads')
+        TESTING = True
+        API_AUTH_REQUIRED = False
+        RATE_LIMIT_ENABLED = False
+    return BenchConfig
+
+def seed(n_invoices, n_contracts=1000):
+    db.session.execute(Person.__table__.insert(), [
+        {'نام_و_نام_خانوادگی': f'Tenant {i}', 'کد_ملی': f'{i:010d}'} for i in range(n_contracts)
+    ])
+    db.session.execute(Case.__table__.insert(), [
+        {'شماره_پرونده': f'BENCH-{i}', 'وضعیت': 'active'} for i in range(n_contracts)
+    ])
+    db.session.execute(LeaseContract.__table__.insert(), [
+        {
+            'شناسه_پرونده': i + 1,
+            'شناسه_مستاجر': i + 1,
+            'تاریخ_شروع': date(2020, 1, 1),
+            'تاریخ_پایان': date(2030, 1, 1),
+            'مبلغ_اجاره_پایه': random.randint(5_000_000, 5_000_000_000),
+            'دوره_پرداخت': 'monthly',
+        }
+        for i in range(n_contracts)
+    ])
+
+    expected = 0
+    inserted = 0
+    now = datetime.utcnow()
+    while inserted < n_invoices:
+        rows = []
+        for _ in range(min(CHUNK, n_invoices - inserted)):
+            amount = random.randint(5_000_000, 9_000_000_000)
+            status = 'unpaid' if random.random() < 0.4 else 'paid'
+            if status == 'unpaid':
+                expected += amount
+            rows.append({
+                'شناسه_قرارداد': random.randint(1, n_contracts),
+                'شماره_صورتحساب': uuid.uuid4().hex,
+                'مبلغ': amount,
+                'تاریخ_سررسید': date(2020, 1, 1) + timedelta(days=random.randint(0, 3650)),
+                'وضعیت': status,
+                'تاریخ_صدور': now,
+            })
+        db.session.execute(Invoice.__table__.insert(), rows)
+        inserted += len(rows)
+    db.session.commit()
+    return expected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invoices', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(build_config(os.path.join(tmp, 'bench.db')))
+        with app.app_context():
+            db.create_all()
+            t0 = time.perf_counter()
+            expected = seed(args.invoices)
+            print(f"Seeded {args.invoices:,} invoices in {time.perf_counter() - t0:.1f}s")
+
+            client = app.test_client()
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                res = client.get('/api/invoices/reports/financial')
+                timings.append(time.perf_counter() - t0)
+            data = res.get_json()
+
+            best = min(timings)
+            print(f"Report: best {best * 1000:.1f} ms, mean {sum(timings) / len(timings) * 1000:.1f} ms "
+                  f"over {args.repeat} runs")
+            print(f"Throughput: {args.invoices / best:,.0f} invoices/s")
+            print(f"Total due: {data['مجموع_بدهی']:,} (expected {expected:,}) "
+                  f"{'OK' if data['مجموع_بدهی'] == expected else 'MISMATCH'}")
+            db.session.remove()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: subdividing a parcel into many units.
+
+Usage:
+    python benchmarks/bench_subdivision.py [--units 500] [--docs 10] [--rounds 5]
+
+Creates a parent case with an owner and --docs documents, then subdivides it
+--rounds times into --units children that each share every parent document
+and clone the parent's ownership. Prints latency and the number of SQL
+statements per subdivision, which should stay flat as --units grows.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+from app import create_app
+from modules.db import db
+from modules.models import Case, Person, Ownership, Document
+
+def build_config(db_path):
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(db_path)}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'crm-bench-uploads')
+        TESTING = True
+        API_AUTH_REQUIRED = False
+        RATE_LIMIT_ENABLED = False
+    return BenchConfig
+
+def create_parent(n_docs):
+    owner = Person(full_name='Developer', national_id='0000000001')
+    parent = Case(case_number='PARCEL', address='Tehran')
+    parent.ownerships.append(Ownership(person=owner, start_date=date(2024, 1, 1), is_current=True))
+    for i in range(n_docs):
+        parent.documents.append(Document(title=f'Doc {i}', file_path=f'doc_{i}.pdf', category='deed'))
+    db.session.add(parent)
+    db.session.commit()
+    return parent.id, [d.id for d in parent.documents]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--units', type=int, default=500)
+    parser.add_argument('--docs', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(build_config(os.path.join(tmp, 'bench.db')))
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            parent_id, doc_ids = create_parent(args.docs)
+            queries = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *a, **k: queries.append(1))
+            db.session.remove()
+
+        for r in range(args.rounds):
+            children = [{'شماره_پرونده': f'U-{r}-{i}', 'docs_to_transfer': doc_ids} for i in range(args.units)]
+            before = len(queries)
+            t0 = time.perf_counter()
+            res = client.post(f'/api/cases/{parent_id}/subdivide?view=summary',
+                              json={'children': children, 'clone_ownership': True})
+            elapsed = (time.perf_counter() - t0) * 1000
+            if res.status_code != 201:
+                sys.exit(f"subdivide failed: {res.status_code} {res.get_data(as_text=True)[:200]}")
+            print(f"round {r + 1}: {args.units} units x {args.docs} docs in {elapsed:8.1f}ms, "
+                  f"{len(queries) - before} queries")
+
+if __name__ == '__main__':
+    main()
@@ -6,4 +6,109 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///crm.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY', 'default-dev-key')
+
+    # Organizations (modules/tenancy.py): requests without a token or user organization work in this one
+    TENANCY_DEFAULT_ORGANIZATION = 1
+
+    # Read replicas for reports, lists, searches and exports (modules/replicas.py)
+    READ_REPLICA_URLS = [url for url in os.environ.get('READ_REPLICA_URLS', '').split(',') if url]
+    REPLICA_MAX_LAG = 5  # seconds behind the primary before a replica is skipped
+    REPLICA_CHECK_INTERVAL = 5  # seconds between lag/health checks of a replica
+    REPLICA_LAG_QUERY = os.environ.get('REPLICA_LAG_QUERY')  # seconds of lag, e.g. from a heartbeat table
+    READ_YOUR_WRITES_SECONDS = 10  # after a client's write, its reads go to the primary for this long
     UPLOAD_FOLDER = 'uploads'
+    UPLOAD_STAGING_WORKERS = 4  # threads writing uploaded files before the DB transaction
+
+    # Where document files are kept (modules/storage.py): 'local' (UPLOAD_FOLDER) or 's3' (needs boto3)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET')
+    STORAGE_S3_PREFIX = os.environ.get('STORAGE_S3_PREFIX', '')  # key prefix inside the bucket
+    STORAGE_S3_ENDPOINT_URL = os.environ.get('STORAGE_S3_ENDPOINT_URL')  # MinIO/Ceph; unset for AWS
+    STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION')
+    STORAGE_REDIRECT_DOWNLOADS = True  # object stores: redirect downloads to presigned URLs instead of proxying
+    STORAGE_URL_EXPIRES = 300  # seconds a presigned download URL stays valid
+
+    # Upload limits, checked while the file is written (modules/uploads.py)
+    MAX_CONTENT_LENGTH = 200 * 1024 * 1024  # whole request, refused with 413 before the body is read
+    UPLOAD_LIMITS = {  # per document category ('*' for the rest): size in bytes and allowed sniffed types
+        '*': {'max_size': 25 * 1024 * 1024,
+              'types': ['application/pdf', 'image/*', 'text/plain', 'text/csv', 'application/msword',
+                        'application/vnd.ms-excel', 'application/vnd.openxmlformats-officedocument.*',
+                        'application/vnd.oasis.opendocument.*']},
+        'Map': {'max_size': 100 * 1024 * 1024, 'types': ['application/pdf', 'image/*']},
+    }
+
+    # Post-upload processing (modules/processing.py; python manage.py process_uploads for retries)
+    UPLOAD_PROCESSORS = ['scan', 'thumbnail', 'extract_text']  # built-in steps or 'package.module:function'
+    UPLOAD_PROCESSING_BACKGROUND = True  # process new uploads in a background thread
+    UPLOAD_PROCESSING_WORKERS = int(os.environ.get('UPLOAD_PROCESSING_WORKERS', 2))  # worker processes; 0 runs inline
+    UPLOAD_PROCESSING_BATCH_SIZE = 50  # files per commit
+    UPLOAD_SCAN_COMMAND = os.environ.get('UPLOAD_SCAN_COMMAND')  # e.g. 'clamdscan --no-summary {path}'; unset skips scanning
+    UPLOAD_SCAN_TIMEOUT = 120  # seconds
+    UPLOAD_SCAN_INFECTED_CODES = [1]  # scanner exit codes that quarantine the document (ClamAV: 1)
+    UPLOAD_THUMBNAIL_SIZE = 256  # pixels, longest side
+
+    # Performance instrumentation
+    METRICS_ENABLED = True
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+    PROFILE_ON_DEMAND = os.environ.get('PROFILE_ON_DEMAND') == '1'  # profile requests sent with "X-Profile: 1"
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # fraction of requests to profile
+    PROFILE_DIR = 'profiles'
+
+    # Logging (JSON lines, written by a background thread)
+    LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+    LOG_ROTATION = os.environ.get('LOG_ROTATION', 'size')  # 'size' or 'time'
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_ROTATE_WHEN = 'midnight'
+    LOG_BACKUP_COUNT = 7
+    LOG_2XX_SAMPLE_RATE = float(os.environ.get('LOG_2XX_SAMPLE_RATE', 1.0))  # errors and slow requests are always logged
+    SLOW_REQUEST_MS = 1000
+
+    # Identity cache for User/Person/Case lookups by id or natural key
+    CACHE_ENABLED = True
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_TTL = 300  # seconds
+    CACHE_SHARED_PATH = os.environ.get('CACHE_SHARED_PATH')  # e.g. 'instance/cache.db' to share across workers
+    CACHE_SYNC_INTERVAL = 1.0  # seconds between checks for other workers' invalidations
+    API_TOKEN_CACHE_TTL = 10  # seconds a revoked token may still be accepted by a worker that missed the eviction
+
+    # Login password verification
+    AUTH_HASH_METHOD = os.environ.get('AUTH_HASH_METHOD', 'scrypt')  # existing hashes are upgraded on next login
+    AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', 2))  # concurrent hash computations
+    AUTH_HASH_QUEUE = 32  # logins allowed to wait for a worker before answering 503
+    AUTH_HASH_TIMEOUT = 10  # seconds
+
+    # JSON API access: web session or API token (manage.py create_token), token-bucket limits per client
+    API_AUTH_REQUIRED = True
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = {'read': (20, 40), 'write': (5, 10), 'heavy': (0.2, 2)}  # (requests per second, burst)
+    RATE_LIMIT_ENDPOINT_CLASSES = {
+        'invoices.generate_invoices': 'heavy',
+        'invoices.financial_report': 'heavy',
+    }
+    RATE_LIMIT_SHARED_PATH = os.environ.get('RATE_LIMIT_SHARED_PATH')  # e.g. 'instance/ratelimit.db' to share across workers
+
+    # Change feed (/api/changes) and its server-sent events stream
+    CHANGE_FEED_PAGE_SIZE = 500
+    CHANGE_FEED_POLL_INTERVAL = 1.0  # seconds; commits in this process wake streams at once, other workers' by polling
+    CHANGE_FEED_HEARTBEAT = 15  # seconds between keepalive comments on idle streams
+    CHANGE_FEED_STREAM_MAX_AGE = 300  # seconds; clients reconnect with Last-Event-ID
+    CHANGE_FEED_SETTLE = 0  # seconds to hold back new changes; set to a few seconds on PostgreSQL
+
+    # Offline sync (/api/sync): page sizes for the first download and for deltas
+    SYNC_SNAPSHOT_PAGE_SIZE = 200  # cases per page
+    SYNC_DELTA_PAGE_SIZE = 1000  # changes scanned per page
+
+    # Archival of closed cases (python manage.py archive)
+    ARCHIVE_CLOSED_AFTER_DAYS = 90
+    ARCHIVE_BATCH_SIZE = 500  # cases per transaction
+
+    # Document text extraction for content search, a post-upload processing step (manage.py extract_texts for backfills)
+    EXTRACTION_OCR_LANGUAGES = 'fas+eng'  # tesseract languages, used when pytesseract and tesseract are installed
+    EXTRACTION_MAX_CHARS = 1_000_000  # text kept per document
+
+    # Response compression
+    COMPRESS_ENABLED = True
+    COMPRESS_ALGORITHMS = ['zstd', 'br', 'gzip']  # server preference; zstd/br need the optional packages
+    COMPRESS_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+    COMPRESS_MIN_SIZE = 1024
@@ -1,20 +1,153 @@
+"""
+Downloads the third-party front-end assets and builds the production bundle.
+
+Usage:
+    python download_assets.py            # download, then build
+    python download_assets.py download   # download only
+    python download_assets.py build      # build only (used by the Dockerfile)
+
+The build step copies every file under `static/` into `static/dist/` with a
+content hash in its name, rewrites `url(...)` references inside CSS to the
+hashed names, keeps only the Vazirmatn weights the UI uses, and writes
+gzip (and brotli, when the `brotli` package is installed) variants next to
+each compressible file. `static/dist/manifest.json` maps logical paths to
+hashed ones for the `asset_url()` template helper.
+"""
+import gzip
+import hashlib
+import json
 import os
+import re
+import shutil
+import sys
 import urllib.request
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = 'static'
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = 'manifest.json'
+
+FONT_URL = "https://cdn.jsdelivr.net/gh/rastikerdar/vazirmatn@v33.003/fonts/webfonts/Vazirmatn-{weight}.woff2"
+FONT_WEIGHTS = {
+    "Thin": 100, "ExtraLight": 200, "Light": 300, "Regular": 400, "Medium": 500,
+    "SemiBold": 600, "Bold": 700, "ExtraBold": 800, "Black": 900,
+}
+# Weights referenced by the templates and Bootstrap (body, headings/500, 600, bold/strong)
+USED_FONT_WEIGHTS = ["Regular", "Medium", "SemiBold", "Bold"]
+
+# Already compressed formats gain nothing from gzip/brotli
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+MIN_COMPRESS_SIZE = 512
+
 def download(url, dest):
     print(f"Downloading {url} to {dest}")
     os.makedirs(os.path.dirname(dest), exist_ok=True)
     urllib.request.urlretrieve(url, dest)
 
-download("https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.rtl.min.css", "static/css/bootstrap.rtl.min.css")
-download("https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js", "static/js/bootstrap.bundle.min.js")
-download("https://unpkg.com/feather-icons@4.29.0/dist/feather.min.js", "static/js/feather.min.js")
-download("https://cdn.jsdelivr.net/gh/rastikerdar/vazirmatn@v33.003/Vazirmatn-font-face.css", "static/css/Vazirmatn-font-face.css")
+def download_all():
+    download("https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.rtl.min.css", "static/css/bootstrap.rtl.min.css")
+    download("https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js", "static/js/bootstrap.bundle.min.js")
+    download("https://unpkg.com/feather-icons@4.29.0/dist/feather.min.js", "static/js/feather.min.js")
+    download("https://cdn.jsdelivr.net/gh/rastikerdar/vazirmatn@v33.003/Vazirmatn-font-face.css", "static/css/Vazirmatn-font-face.css")
+
+    for weight in FONT_WEIGHTS:
+        download(FONT_URL.format(weight=weight), f"static/css/fonts/webfonts/Vazirmatn-{weight}.woff2")
+
+def font_face_css(weights):
+    """Builds the @font-face rules for the given Vazirmatn weights."""
+    rules = []
+    for name in weights:
+        rules.append(
+            "@font-face {\n"
+            "  font-family: Vazirmatn;\n"
+            f"  src: url('/static/css/fonts/webfonts/Vazirmatn-{name}.woff2') format('woff2');\n"
+            f"  font-weight: {FONT_WEIGHTS[name]};\n"
+            "  font-style: normal;\n"
+            "  font-display: swap;\n"
+            "}\n"
+        )
+    return "/* Generated by download_assets.py: used weights only */\n" + "\n".join(rules)
+
+def _fingerprint(rel_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    base, ext = os.path.splitext(rel_path)
+    return f"{base}.{digest}{ext}"
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def _compress(path, content):
+    if not path.endswith(COMPRESSIBLE) or len(content) < MIN_COMPRESS_SIZE:
+        return
+    _write(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(content, quality=11))
+
+def _rewrite_css_urls(css, css_rel_path, manifest):
+    """Points url(...) references at fingerprinted files under /assets/."""
+    css_dir = os.path.dirname(css_rel_path)
+
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//')):
+            return match.group(0)
+        if url.startswith('/static/'):
+            rel = url[len('/static/'):]
+        else:
+            rel = os.path.normpath(os.path.join(css_dir, url)).replace(os.sep, '/')
+        if rel not in manifest:
+            return match.group(0)
+        return f"url({match.group(1)}/assets/{manifest[rel]}{match.group(1)})"
+
+    return re.sub(r"url\((['\"]?)([^'\")]+)\1\)", replace, css)
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR, font_weights=USED_FONT_WEIGHTS):
+    """Builds the fingerprinted, precompressed bundle. Returns the manifest."""
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+
+    unused_fonts = {f"css/fonts/webfonts/Vazirmatn-{w}.woff2" for w in FONT_WEIGHTS if w not in font_weights}
+    sources = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root).startswith(os.path.abspath(dist_dir)):
+            continue
+        for name in files:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, static_dir).replace(os.sep, '/')
+            if rel in unused_fonts:
+                continue
+            with open(full, 'rb') as f:
+                sources[rel] = f.read()
+    sources['css/Vazirmatn-font-face.css'] = font_face_css(font_weights).encode('utf-8')
+
+    manifest = {}
+    # Non-CSS first so stylesheets can reference their hashed names
+    for rel in sorted(sources, key=lambda r: r.endswith('.css')):
+        content = sources[rel]
+        if rel.endswith('.css'):
+            content = _rewrite_css_urls(content.decode('utf-8'), rel, manifest).encode('utf-8')
+        hashed = _fingerprint(rel, content)
+        manifest[rel] = hashed
+        out = os.path.join(dist_dir, hashed)
+        _write(out, content)
+        _compress(out, content)
 
-fonts = [
-    "Thin", "ExtraLight", "Light", "Regular", "Medium", "SemiBold", "Bold", "ExtraBold", "Black"
-]
-for weight in fonts:
-    download(f"https://cdn.jsdelivr.net/gh/rastikerdar/vazirmatn@v33.003/fonts/webfonts/Vazirmatn-{weight}.woff2", f"static/css/fonts/webfonts/Vazirmatn-{weight}.woff2")
+    with open(os.path.join(dist_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"Built {len(manifest)} assets into {dist_dir}"
+          f"{'' if brotli else ' (brotli not installed: gzip only)'}")
+    return manifest
 
-print("Done")
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    if command in ('all', 'download'):
+        download_all()
+    if command in ('all', 'build'):
+        build()
+    print("Done")
@@ -1,7 +1,9 @@
 import sys
+import argparse
+import time
 from app import create_app
 from modules.db import db
-from modules.models import Case, Person, Ownership, Document, LeaseContract, Invoice, User
+from modules.models import Case, Person, Ownership, Document, LeaseContract, Invoice, User, Organization
 from faker import Faker
 import random
 from datetime import datetime, timedelta
@@ -12,6 +14,9 @@ def init_db():
     app = create_app()
     with app.app_context():
         db.create_all()
+        # A fresh schema already matches the models
+        from modules import migrations
+        migrations.stamp(db.engine)
         print("Database tables created successfully.")
 
 def drop_db():
@@ -106,12 +111,64 @@ def populate_db():
 
         print("Database populated successfully!")
 
+def migrate(args):
+    """Apply pending schema/data migrations (or: migrate status | migrate stamp)."""
+    from modules import migrations
+    app = create_app()
+    with app.app_context():
+        # New tables come from the models; migrations handle existing ones
+        db.create_all()
+        sub = args[0] if args else 'upgrade'
+        if sub == 'status':
+            for migration, applied in migrations.status(db.engine):
+                print(f"[{'x' if applied else ' '}] {migration.revision} {migration.description}")
+        elif sub == 'stamp':
+            migrations.stamp(db.engine, target=args[1] if len(args) > 1 else None)
+            print("Migrations marked as applied.")
+        elif sub == 'upgrade':
+            count = migrations.upgrade(db.engine, target=args[1] if len(args) > 1 else None)
+            print(f"{count} migration(s) applied." if count else "Database is up to date.")
+            # Organizations with their own PostgreSQL schema have their own copy of the tenant tables
+            from modules.tenancy import tenant_schemas, schema_engine
+            for schema in tenant_schemas():
+                engine = schema_engine(schema)
+                try:
+                    count = migrations.upgrade(engine, target=args[1] if len(args) > 1 else None)
+                finally:
+                    engine.dispose()
+                print(f"{schema}: {count} migration(s) applied." if count else f"{schema}: up to date.")
+        else:
+            print(f"Unknown migrate command: {sub}")
+
+def generate_data(args):
+    """Generate a large synthetic dataset with bulk inserts."""
+    from modules.datagen import generate
+    parser = argparse.ArgumentParser(prog='manage.py generate')
+    parser.add_argument('--cases', type=int, required=True)
+    parser.add_argument('--years', type=int, default=3, help='Years of contracts and invoices')
+    parser.add_argument('--workers', type=int, default=None, help='Faker worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-audit', action='store_true', help='Skip audit log rows')
+    opts = parser.parse_args(args)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"Generating {opts.cases:,} cases...")
+        started = time.perf_counter()
+        counts = generate(opts.cases, workers=opts.workers, years=opts.years, seed=opts.seed,
+                          chunk_size=opts.chunk_size, audit=not opts.no_audit)
+        print(f"Done in {time.perf_counter() - started:.1f}s: " +
+              ", ".join(f"{v:,} {k}" for k, v in counts.items()))
+
 def create_user():
     """Create a new user."""
     app = create_app()
     with app.app_context():
         username = input("Enter username: ")
         password = input("Enter password: ")
+        code = input("Organization code (empty for the default one): ").strip()
 
         if not username or not password:
             print("Username and password are required.")
@@ -121,15 +178,194 @@ def create_user():
             print("User already exists.")
             return
 
-        user = User(username=username)
-        user.set_password(password)
+        organization = Organization.query.filter_by(code=code).first() if code else None
+        if code and organization is None:
+            print(f"Organization {code} not found.")
+            return
+
+        user = User(username=username, organization_id=organization.id if organization else None)
+        user.set_password(password, method=app.config.get('AUTH_HASH_METHOD', 'scrypt'))
         db.session.add(user)
         db.session.commit()
         print(f"User {username} created successfully.")
 
+def create_token(args):
+    """Create an API token for an integration: create_token <name> [--organization CODE]."""
+    from modules.api_auth import create_token as new_token
+    parser = argparse.ArgumentParser(prog='manage.py create_token')
+    parser.add_argument('name')
+    parser.add_argument('--organization', help='Code of the organization the token works in (default: the default one)')
+    opts = parser.parse_args(args)
+    app = create_app()
+    with app.app_context():
+        organization = None
+        if opts.organization:
+            organization = Organization.query.filter_by(code=opts.organization).first()
+            if organization is None:
+                print(f"Organization {opts.organization} not found.")
+                return
+        api_token, token = new_token(opts.name, organization_id=organization.id if organization else None)
+        db.session.add(api_token)
+        db.session.commit()
+        print(f"Token for {api_token.name} (id {api_token.id}). Store it now, it cannot be shown again:")
+        print(token)
+
+def create_organization(args):
+    """Add an organization (district): create_organization <code> <name> [--schema NAME]."""
+    from modules.tenancy import create_organization as new_organization, TenancyError
+    parser = argparse.ArgumentParser(prog='manage.py create_organization')
+    parser.add_argument('code')
+    parser.add_argument('name')
+    parser.add_argument('--schema', help='PostgreSQL schema for its own copy of the tables (default: shared tables)')
+    opts = parser.parse_args(args)
+    app = create_app()
+    with app.app_context():
+        try:
+            organization = new_organization(opts.code, opts.name, schema=opts.schema)
+        except TenancyError as e:
+            print(e)
+            return
+        db.session.commit()
+        print(f"Organization {organization.code} created (id {organization.id})" +
+              (f" in schema {organization.schema_name}." if organization.schema_name else "."))
+
+def revoke_token(args):
+    """Revoke an API token by id: revoke_token <id>."""
+    from modules.models import ApiToken
+    if not args:
+        print("Usage: python manage.py revoke_token <id>")
+        return
+    app = create_app()
+    with app.app_context():
+        api_token = db.session.get(ApiToken, int(args[0]))
+        if not api_token:
+            print("Token not found.")
+            return
+        api_token.revoked_at = datetime.utcnow()
+        db.session.commit()
+        print(f"Token {api_token.id} ({api_token.name}, {api_token.prefix}...) revoked.")
+
+def archive(args):
+    """Archive closed cases in batches: archive [--older-than DAYS] [--batch-size N] [--pause SECONDS]."""
+    from modules.archive import archive_closed
+    app = create_app()
+    parser = argparse.ArgumentParser(prog='manage.py archive')
+    parser.add_argument('--older-than', type=int, default=app.config.get('ARCHIVE_CLOSED_AFTER_DAYS', 90),
+                        help='Only closed cases unchanged for this many days')
+    parser.add_argument('--batch-size', type=int, default=app.config.get('ARCHIVE_BATCH_SIZE', 500))
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to wait between batches')
+    opts = parser.parse_args(args)
+
+    with app.app_context():
+        print(f"Archiving closed cases unchanged for {opts.older_than} days...")
+        count = archive_closed(opts.older_than, batch_size=opts.batch_size, pause=opts.pause)
+        print(f"{count} case(s) archived.")
+
+def restore_case(args):
+    """Restore an archived case by id: restore_case <id>."""
+    from modules.archive import restore_cases
+    if not args:
+        print("Usage: python manage.py restore_case <id>")
+        return
+    app = create_app()
+    with app.app_context():
+        if restore_cases([int(args[0])]):
+            db.session.commit()
+            print(f"Case {args[0]} restored.")
+        else:
+            print("No archived case with this id.")
+
+def extract_texts(args):
+    """Extract text from documents for content search: extract_texts [--retry] [--workers N]."""
+    from modules.extraction import run_extraction
+    from modules.processing import make_pool
+    app = create_app()
+    parser = argparse.ArgumentParser(prog='manage.py extract_texts')
+    parser.add_argument('--retry', action='store_true', help='Retry files that were unsupported or failed')
+    parser.add_argument('--workers', type=int, default=app.config.get('UPLOAD_PROCESSING_WORKERS', 2),
+                        help='Extraction processes (0 to extract inline)')
+    parser.add_argument('--batch-size', type=int, default=app.config.get('UPLOAD_PROCESSING_BATCH_SIZE', 50))
+    opts = parser.parse_args(args)
+
+    with app.app_context():
+        pool = make_pool(dict(app.config, UPLOAD_PROCESSING_WORKERS=opts.workers))
+        started = time.perf_counter()
+        try:
+            counts = run_extraction(pool=pool, batch_size=opts.batch_size, retry_failed=opts.retry, log=print)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        print(f"{total} file(s) in {elapsed:.1f}s" + (f" ({total / elapsed:.1f} files/s): " if total else ".") +
+              ", ".join(f"{v} {k}" for k, v in counts.items()))
+
+def process_uploads(args):
+    """Run post-upload processing for pending documents: process_uploads [--retry] [--workers N]."""
+    from modules.processing import run_processing, make_pool
+    app = create_app()
+    parser = argparse.ArgumentParser(prog='manage.py process_uploads')
+    parser.add_argument('--retry', action='store_true', help='Also retry documents whose processing failed')
+    parser.add_argument('--workers', type=int, default=app.config.get('UPLOAD_PROCESSING_WORKERS', 2),
+                        help='Worker processes (0 to process inline)')
+    opts = parser.parse_args(args)
+
+    with app.app_context():
+        pool = make_pool(dict(app.config, UPLOAD_PROCESSING_WORKERS=opts.workers))
+        try:
+            counts, texts = run_processing(pool=pool, batch_size=app.config.get('UPLOAD_PROCESSING_BATCH_SIZE', 50),
+                                           retry_failed=opts.retry)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        print("Processed: " + (", ".join(f"{v} {k}" for k, v in counts.items()) or "nothing pending"))
+        if texts:
+            print("Texts: " + ", ".join(f"{v} {k}" for k, v in texts.items()))
+
+def explain(args):
+    """Check the query plans of the hot endpoints: explain [--writes] [--organization CODE] [--fail-on-scan]."""
+    from modules.query_plans import HOT_ENDPOINTS, HOT_WRITE_ENDPOINTS, profile_endpoints, analyze
+    parser = argparse.ArgumentParser(prog='manage.py explain')
+    parser.add_argument('--writes', action='store_true',
+                        help='Also call endpoints that write (generate invoices, transfer an owner): scratch databases only')
+    parser.add_argument('--organization', help='Code of the organization to run the endpoints as (default: the default one)')
+    parser.add_argument('--fail-on-scan', action='store_true', help='Exit with status 1 when a query reads a whole table')
+    opts = parser.parse_args(args)
+
+    app = create_app()
+    # The endpoints are called in-process, as the configured organization
+    app.config['API_AUTH_REQUIRED'] = False
+    with app.app_context():
+        if opts.organization:
+            organization = Organization.query.filter_by(code=opts.organization).first()
+            if organization is None:
+                print(f"Organization {opts.organization} not found.")
+                sys.exit(1)
+            app.config['TENANCY_DEFAULT_ORGANIZATION'] = organization.id
+        endpoints = HOT_ENDPOINTS + (HOT_WRITE_ENDPOINTS if opts.writes else [])
+        profiles = profile_endpoints(app, endpoints)
+        findings = analyze(profiles)
+
+    print(f"{sum(len(c) for _, c in profiles.values())} statements from {len(profiles)} endpoints.")
+    for (method, path), (status, _) in profiles.items():
+        if status >= 400:
+            print(f"  {method} {path} answered {status}; its plans are incomplete.")
+    scans = [f for f in findings if f.kind == 'scan']
+    for finding in findings:
+        print()
+        print(("FULL SCAN: " if finding.kind == 'scan' else "sort: ") + finding.detail)
+        print("  endpoints: " + ", ".join(f"{method} {path}" for method, path in finding.endpoints))
+        print("  query: " + " ".join(finding.statement.split())[:300])
+        if finding.suggestion:
+            print("  suggested index: " + finding.suggestion)
+    print()
+    print(f"{len(scans)} full scan(s), {len(findings) - len(scans)} sort(s) without an index.")
+    if scans and opts.fail_on_scan:
+        sys.exit(1)
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python manage.py [init|drop|populate|create_user]")
+        print("Usage: python manage.py [init|migrate|drop|populate|generate|create_user|create_organization|create_token|revoke_token|archive|restore_case|extract_texts|process_uploads|explain]")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -139,7 +375,27 @@ if __name__ == "__main__":
         drop_db()
     elif command == 'populate':
         populate_db()
+    elif command == 'migrate':
+        migrate(sys.argv[2:])
+    elif command == 'generate':
+        generate_data(sys.argv[2:])
     elif command == 'create_user':
         create_user()
+    elif command == 'create_organization':
+        create_organization(sys.argv[2:])
+    elif command == 'create_token':
+        create_token(sys.argv[2:])
+    elif command == 'revoke_token':
+        revoke_token(sys.argv[2:])
+    elif command == 'archive':
+        archive(sys.argv[2:])
+    elif command == 'restore_case':
+        restore_case(sys.argv[2:])
+    elif command == 'extract_texts':
+        extract_texts(sys.argv[2:])
+    elif command == 'process_uploads':
+        process_uploads(sys.argv[2:])
+    elif command == 'explain':
+        explain(sys.argv[2:])
     else:
         print(f"Unknown command: {command}")
@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger
+
+revision = '0001'
+description = 'Store rents and invoice amounts as whole Rials (BIGINT)'
+
+MONEY_COLUMNS = [
+    ('lease_contracts', 'مبلغ_اجاره_پایه'),
+    ('invoices', 'مبلغ'),
+]
+
+def upgrade(ctx):
+    for table, column in MONEY_COLUMNS:
+        if not ctx.has_table(table):
+            continue
+        current_type = str(ctx.columns(table)[column]['type']).upper()
+        if 'INT' in current_type:
+            continue
+        using = f'CAST(ROUND("{column}") AS BIGINT)'
+        ctx.alter_column_type(table, column, BigInteger(), using=using)
+        ctx.log(f"  {table}.{column} converted to whole Rials")
@@ -0,0 +1,18 @@
+revision = '0002'
+description = 'Allow at most one current ownership per case (partial unique index)'
+
+INDEX = 'uq_ownerships_current_case'
+
+def upgrade(ctx):
+    if not ctx.has_table('ownerships') or ctx.has_index('ownerships', INDEX):
+        return
+    true = '1' if ctx.dialect == 'sqlite' else 'TRUE'
+    false = '0' if ctx.dialect == 'sqlite' else 'FALSE'
+    # Concurrent transfers could leave several current owners: keep the newest one
+    result = ctx.execute(
+        f'UPDATE "ownerships" SET "فعال" = {false} WHERE "فعال" = {true} AND "شناسه" NOT IN '
+        f'(SELECT MAX("شناسه") FROM "ownerships" WHERE "فعال" = {true} GROUP BY "شناسه_پرونده")'
+    )
+    if result.rowcount:
+        ctx.log(f"  archived {result.rowcount} duplicate current ownerships")
+    ctx.create_index(INDEX, 'ownerships', ['شناسه_پرونده'], unique=True, where=f'"فعال" = {true}')
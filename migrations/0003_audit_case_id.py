@@ -0,0 +1,27 @@
+revision = '0003'
+description = 'Record the case of each audit row for the change feed'
+
+COLUMN = 'شناسه_پرونده'
+INDEX = 'ix_audit_logs_شناسه_پرونده'
+
+def upgrade(ctx):
+    if not ctx.has_table('audit_logs'):
+        return
+    ctx.add_column('audit_logs', COLUMN, 'INTEGER')
+
+    ctx.backfill('case_rows', 'audit_logs', f'"{COLUMN}" = "شناسه_هدف"',
+                 where=f'"بخش" = \'Case\' AND "{COLUMN}" IS NULL')
+    # Child rows carry their case in the JSON snapshot of the audited row
+    if ctx.dialect == 'postgresql':
+        from_details = f'CAST(CAST("جزئیات" AS JSON) ->> \'{COLUMN}\' AS INTEGER)'
+    else:
+        from_details = f'CAST(json_extract("جزئیات", \'$.{COLUMN}\') AS INTEGER)'
+    ctx.backfill('child_rows', 'audit_logs', f'"{COLUMN}" = {from_details}',
+                 where=f'"بخش" IN (\'Ownership\', \'Document\', \'LeaseContract\') AND "{COLUMN}" IS NULL')
+    ctx.backfill('invoice_rows', 'audit_logs',
+                 f'"{COLUMN}" = (SELECT c."{COLUMN}" FROM "invoices" i '
+                 f'JOIN "lease_contracts" c ON c."شناسه" = i."شناسه_قرارداد" '
+                 f'WHERE i."شناسه" = "audit_logs"."شناسه_هدف")',
+                 where=f'"بخش" = \'Invoice\' AND "{COLUMN}" IS NULL')
+
+    ctx.create_index(INDEX, 'audit_logs', [COLUMN])
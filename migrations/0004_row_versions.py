@@ -0,0 +1,14 @@
+revision = '0004'
+description = 'Add row version and update time columns for offline sync'
+
+TABLES = ['cases', 'people', 'ownerships', 'documents', 'lease_contracts', 'invoices']
+
+def upgrade(ctx):
+    timestamp = 'TIMESTAMP' if ctx.dialect == 'postgresql' else 'DATETIME'
+    for table in TABLES:
+        if not ctx.has_table(table):
+            continue
+        # A constant default fills existing rows without rewriting the table
+        ctx.add_column(table, 'نسخه', 'INTEGER NOT NULL', default=1)
+        # Rows written before this migration keep a NULL update time until their next change
+        ctx.add_column(table, 'تاریخ_به_روزرسانی', timestamp)
@@ -0,0 +1,21 @@
+revision = '0005'
+description = 'Soft delete (archived_at) with partial indexes over live rows'
+
+COLUMN = 'تاریخ_بایگانی'
+
+# (index, table, columns)
+LIVE_INDEXES = [
+    ('ix_cases_live_status', 'cases', ['وضعیت']),
+    ('ix_ownerships_live_case', 'ownerships', ['شناسه_پرونده']),
+    ('ix_documents_live_case', 'documents', ['شناسه_پرونده']),
+    ('ix_lease_contracts_live_case', 'lease_contracts', ['شناسه_پرونده']),
+    ('ix_invoices_live_contract', 'invoices', ['شناسه_قرارداد']),
+]
+
+def upgrade(ctx):
+    timestamp = 'TIMESTAMP' if ctx.dialect == 'postgresql' else 'DATETIME'
+    for index, table, columns in LIVE_INDEXES:
+        if not ctx.has_table(table):
+            continue
+        ctx.add_column(table, COLUMN, timestamp)
+        ctx.create_index(index, table, columns, where=f'"{COLUMN}" IS NULL')
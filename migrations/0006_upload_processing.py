@@ -0,0 +1,16 @@
+revision = '0006'
+description = 'Add file size, checksum, sniffed type and processing status to documents'
+
+def upgrade(ctx):
+    if not ctx.has_table('documents'):
+        return
+    ctx.add_column('documents', 'حجم_فایل', 'BIGINT')
+    ctx.add_column('documents', 'هش_فایل', 'VARCHAR(64)')
+    ctx.add_column('documents', 'نوع_فایل', 'VARCHAR(100)')
+    # Files uploaded before the pipeline existed count as processed
+    ctx.add_column('documents', 'وضعیت_پردازش', "VARCHAR(20) NOT NULL", default="'ready'")
+    ctx.add_column('documents', 'خطای_پردازش', 'VARCHAR(500)')
+    ctx.add_column('documents', 'مسیر_تصویر_کوچک', 'VARCHAR(255)')
+    # The pipeline and the monitoring query look for documents still being processed
+    ctx.create_index('ix_documents_unprocessed', 'documents', ['وضعیت_پردازش'],
+                     where='"وضعیت_پردازش" <> \'ready\'')
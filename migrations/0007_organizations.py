@@ -0,0 +1,41 @@
+revision = '0007'
+description = 'Organization (tenant) key on tenant tables, with natural keys unique per organization'
+
+COLUMN = 'شناسه_سازمان'
+TENANT_TABLES = ['cases', 'people', 'documents', 'lease_contracts', 'invoices', 'audit_logs']
+LIVE = '"تاریخ_بایگانی" IS NULL'
+
+# (old index, new index, table, columns, unique, where)
+INDEXES = [
+    ('ix_cases_شماره_پرونده', 'ix_cases_org_case_number', 'cases', [COLUMN, 'شماره_پرونده'], True, None),
+    ('ix_people_کد_ملی', 'ix_people_org_national_id', 'people', [COLUMN, 'کد_ملی'], True, None),
+    ('ix_people_نام_و_نام_خانوادگی', 'ix_people_org_name', 'people', [COLUMN, 'نام_و_نام_خانوادگی'], False, None),
+    ('ix_cases_live_status', 'ix_cases_live_org_status', 'cases', [COLUMN, 'وضعیت'], False, LIVE),
+    (None, 'ix_cases_live_org', 'cases', [COLUMN, 'شناسه'], False, LIVE),
+    (None, 'ix_invoices_live_org_status', 'invoices', [COLUMN, 'وضعیت'], False, LIVE),
+    (None, 'ix_audit_logs_org', 'audit_logs', [COLUMN, 'شناسه'], False, None),
+]
+
+def upgrade(ctx):
+    # The table itself comes from db.create_all(); existing rows belong to organization 1
+    if ctx.has_table('organizations'):
+        if ctx.execute('SELECT COUNT(*) FROM organizations WHERE id = 1').scalar() == 0:
+            ctx.execute("INSERT INTO organizations (id, code, name) VALUES (1, 'default', 'Default')")
+        if ctx.dialect == 'postgresql':
+            ctx.execute("SELECT setval(pg_get_serial_sequence('organizations', 'id'), "
+                        "(SELECT MAX(id) FROM organizations))")
+    for table in ('users', 'api_tokens'):
+        if ctx.has_table(table):
+            ctx.add_column(table, 'organization_id', 'INTEGER')
+
+    for table in TENANT_TABLES:
+        if ctx.has_table(table):
+            ctx.add_column(table, COLUMN, 'INTEGER NOT NULL', default='1')
+
+    for old, new, table, columns, unique, where in INDEXES:
+        if not ctx.has_table(table) or not all(ctx.has_column(table, c) for c in columns):
+            continue
+        # New index first, so lookups are never left without one
+        ctx.create_index(new, table, columns, unique=unique, where=where)
+        if old:
+            ctx.drop_index(old)
@@ -0,0 +1,20 @@
+revision = '0008'
+description = 'Indexes for the full scans found by the query plan check (manage.py explain)'
+
+LIVE = '"تاریخ_بایگانی" IS NULL'
+
+# (old index, new index, table, columns)
+INDEXES = [
+    (None, 'ix_cases_live_parent', 'cases', ['شناسه_والد']),
+    (None, 'ix_ownerships_live_person', 'ownerships', ['شناسه_شخص']),
+    (None, 'ix_lease_contracts_live_end', 'lease_contracts', ['تاریخ_پایان']),
+    ('ix_invoices_live_contract', 'ix_invoices_live_contract_created', 'invoices', ['شناسه_قرارداد', 'تاریخ_صدور']),
+]
+
+def upgrade(ctx):
+    for old, new, table, columns in INDEXES:
+        if not ctx.has_table(table) or not all(ctx.has_column(table, c) for c in columns + ['تاریخ_بایگانی']):
+            continue
+        ctx.create_index(new, table, columns, where=LIVE)
+        if old:
+            ctx.drop_index(old)
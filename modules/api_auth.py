@@ -0,0 +1,106 @@
+"""
+Authentication and rate limiting for the JSON API blueprints.
+
+A request to `/api/*` is accepted from a logged-in web session (the UI calls
+the API with its cookie) or with an API token sent as
+`Authorization: Bearer <token>` or `X-API-Key: <token>`. Tokens are created
+with `python manage.py create_token <name>`. Only their sha256 is stored,
+and lookups go through the identity cache, so checking a token costs no SQL
+once warm. Revoking a token evicts it from every worker sharing
+`CACHE_SHARED_PATH`; any other worker drops it after `API_TOKEN_CACHE_TTL`.
+
+Every accepted request then takes a token from the bucket for
+(client, endpoint class). The classes are `read` (GET/HEAD), `write`, and
+`heavy` for the endpoints listed in `RATE_LIMIT_ENDPOINT_CLASSES`.
+Throttled requests get 429 with `Retry-After`. Each call of a batch
+(/api/batch) is charged to its own endpoint's class as well.
+"""
+import hashlib
+import secrets
+from flask import request, jsonify, g, current_app
+from flask_login import current_user
+from modules.cache import get_cache
+from modules.metrics import REGISTRY, Counter
+from modules.models import ApiToken
+from modules.ratelimit import MemoryBuckets, SQLiteBuckets
+
+DEFAULT_RATE_LIMITS = {'read': (20, 40), 'write': (5, 10), 'heavy': (0.2, 2)}  # (tokens per second, burst)
+DEFAULT_ENDPOINT_CLASSES = {'invoices.generate_invoices': 'heavy', 'invoices.financial_report': 'heavy'}
+
+API_AUTH_FAILURES = REGISTRY.register(Counter(
+    'crm_api_auth_failures_total', 'API requests rejected for a missing or invalid token', ('reason',)))
+RATE_LIMITED = REGISTRY.register(Counter(
+    'crm_rate_limited_total', 'API requests refused by the rate limiter', ('rate_class',)))
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def create_token(name, organization_id=None):
+    """Creates an API token and returns (row, plain token). The plain token cannot be recovered later."""
+    token = secrets.token_urlsafe(32)
+    return ApiToken(name=name, token_hash=hash_token(token), prefix=token[:8], organization_id=organization_id), token
+
+def _request_token():
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip()
+    return request.headers.get('X-API-Key')
+
+def _principal():
+    """Returns the rate limit key of the caller, or None when it is not authenticated."""
+    token = _request_token()
+    if token:
+        api_token = get_cache().get(ApiToken, 'token_hash', hash_token(token), attach=False)
+        if api_token is None or api_token.revoked_at is not None:
+            API_AUTH_FAILURES.inc(('invalid',))
+            return None
+        g.api_token = api_token
+        return f"token:{api_token.id}"
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    if not current_app.config.get('API_AUTH_REQUIRED', True):
+        return f"ip:{request.remote_addr}"
+    API_AUTH_FAILURES.inc(('missing',))
+    return None
+
+def endpoint_class(config):
+    classes = config.get('RATE_LIMIT_ENDPOINT_CLASSES', DEFAULT_ENDPOINT_CLASSES)
+    if request.endpoint in classes:
+        return classes[request.endpoint]
+    return 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+
+def rate_limit(principal):
+    """Takes a token from `principal`'s bucket for the current endpoint's class. Returns a 429 response when empty."""
+    if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+    rate_class = endpoint_class(current_app.config)
+    rate, burst = current_app.extensions['rate_limits'][rate_class]
+    allowed, retry_after = current_app.extensions['rate_limit_buckets'].take(f"{principal}:{rate_class}", rate, burst)
+    if not allowed:
+        RATE_LIMITED.inc((rate_class,))
+        response = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    return None
+
+def init_api_auth(app):
+    """Registers the token check and rate limiter for every `/api/` route."""
+    shared_path = app.config.get('RATE_LIMIT_SHARED_PATH')
+    app.extensions['rate_limit_buckets'] = SQLiteBuckets(shared_path) if shared_path else MemoryBuckets()
+    app.extensions['rate_limits'] = dict(DEFAULT_RATE_LIMITS, **app.config.get('RATE_LIMITS', {}))
+
+    @app.before_request
+    def guard_api():
+        # By path, so a blueprint added under /api/ is never left unguarded
+        if not request.path.startswith('/api/'):
+            return None
+        principal = _principal()
+        if principal is None:
+            response = jsonify({'error': 'Valid API token required'})
+            response.status_code = 401
+            response.headers['WWW-Authenticate'] = 'Bearer'
+            return response
+        # Batch calls charge each of their sub-requests to the same client
+        g.api_principal = principal
+        return rate_limit(principal)
@@ -0,0 +1,106 @@
+"""
+Soft delete and archival of cases.
+
+Archiving a case stamps `archived_at` on the case and on its ownerships,
+documents, contracts and invoices. Archived rows stay where they are, but
+every ORM SELECT gets `archived_at IS NULL` added for all `Archivable`
+models, so lists, searches, reports and lookups only see live data. The
+hot-path indexes are partial indexes over live rows, so archived rows don't
+slow those queries down either. Queries that need archived rows run with
+`execution_options(include_archived=True)`.
+
+Archiving and restoring are a few set-based UPDATEs per batch of cases.
+They bump the row versions, and they write audit rows (`archive` /
+`restore`), so the change feed and offline sync clients see them. Sync
+clients see an archived row as a tombstone.
+
+Closed cases are archived in batches by `python manage.py archive`, e.g.
+from cron.
+"""
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, update, or_
+from sqlalchemy.orm import Session, with_loader_criteria
+from modules.db import db
+from modules.audit import log_bulk
+from modules.cache import evict_on_commit
+from modules.models import Archivable, Case, Ownership, Document, LeaseContract, Invoice
+
+def _live_rows_only(execute_state):
+    if (execute_state.is_select
+            and not execute_state.is_column_load
+            and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get('include_archived', False)):
+        # Propagates to lazy and eager loads of the objects this query returns
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(Archivable, lambda cls: cls.archived_at.is_(None), include_aliases=True)
+        )
+
+def _set_archived(model, where, archived_at, now, columns):
+    state = model.archived_at.is_(None) if archived_at else model.archived_at.isnot(None)
+    statement = (update(model).where(where, state)
+                 .values(archived_at=archived_at, version=model.version + 1, updated_at=now)
+                 .returning(*(getattr(model, c).label(c) for c in columns))
+                 .execution_options(synchronize_session=False))
+    return [row._asdict() for row in db.session.execute(statement)]
+
+def _apply(case_ids, restore):
+    now = datetime.utcnow()
+    archived_at = None if restore else now
+    action = 'restore' if restore else 'archive'
+
+    cases = _set_archived(Case, Case.id.in_(case_ids), archived_at, now, ('id', 'case_number', 'organization_id'))
+    ids = [c['id'] for c in cases]
+    if not ids:
+        return 0
+    changed = {Case: cases}
+    for model in (Ownership, Document, LeaseContract):
+        changed[model] = _set_archived(model, model.case_id.in_(ids), archived_at, now, ('id', 'case_id'))
+    case_of_contract = {c['id']: c['case_id'] for c in changed[LeaseContract]}
+    invoices = _set_archived(Invoice, Invoice.contract_id.in_(case_of_contract), archived_at, now, ('id', 'contract_id'))
+    changed[Invoice] = [dict(row, case_id=case_of_contract[row['contract_id']]) for row in invoices]
+    # The archiver runs across organizations: audit rows take their case's
+    organization_of_case = {c['id']: c['organization_id'] for c in cases}
+    for model in (Ownership, Document, LeaseContract, Invoice):
+        changed[model] = [dict(row, organization_id=organization_of_case[row['case_id']]) for row in changed[model]]
+
+    connection = db.session.connection()
+    for model, rows in changed.items():
+        log_bulk(connection, model, rows, action=action)
+    evict_on_commit(db.session, Case, cases)
+    return len(ids)
+
+def archive_cases(case_ids):
+    """Archives the live cases among `case_ids` with everything attached to them. Returns how many; the caller commits."""
+    return _apply(case_ids, restore=False)
+
+def restore_cases(case_ids):
+    """Brings archived cases (and what was archived with them) back. Returns how many; the caller commits."""
+    return _apply(case_ids, restore=True)
+
+def archive_closed(older_than_days, batch_size=500, pause=0.0, log=print):
+    """
+    Archives closed cases not changed for `older_than_days`, `batch_size`
+    cases per transaction, so the archiver never holds write locks for long.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        # Rows from before version tracking have no update time; they count as old
+        ids = db.session.scalars(
+            select(Case.id)
+            .where(Case.status == 'closed', or_(Case.updated_at.is_(None), Case.updated_at < cutoff))
+            .order_by(Case.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return total
+        total += archive_cases(ids)
+        db.session.commit()
+        log(f"  archived {total} cases (up to id {ids[-1]})")
+        if pause:
+            time.sleep(pause)
+
+def init_archive(app):
+    """Hides archived rows from ORM queries (once per process)."""
+    if not event.contains(Session, 'do_orm_execute', _live_rows_only):
+        event.listen(Session, 'do_orm_execute', _live_rows_only)
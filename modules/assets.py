@@ -0,0 +1,70 @@
+"""
+Serving of the fingerprinted asset bundle built by `download_assets.py build`.
+
+`asset_url('css/app.css')` resolves to `/assets/css/app.<hash>.css` when the
+bundle exists, and to plain `/static/...` otherwise (development). Files
+under `/assets/` never change content for a given name, so they are sent
+with an immutable one-year cache lifetime, and the precompressed `.br` or
+`.gz` variant is sent when the client accepts it.
+"""
+import json
+import mimetypes
+import os
+from flask import abort, current_app, request, send_file
+
+ONE_YEAR = 365 * 24 * 3600
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+mimetypes.add_type('font/woff2', '.woff2')
+
+def _dist_dir(app):
+    return os.path.join(app.root_path, app.config.get('ASSETS_DIST_DIR', os.path.join('static', 'dist')))
+
+def load_manifest(app):
+    path = os.path.join(_dist_dir(app), 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _accepted_encodings():
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token and params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            accepted.add(token.lower())
+    return accepted
+
+def serve_asset(filename):
+    dist = _dist_dir(current_app)
+    path = os.path.realpath(os.path.join(dist, filename))
+    if not path.startswith(os.path.realpath(dist) + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    accepted = _accepted_encodings()
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, name
+            break
+
+    response = send_file(path, mimetype=mimetype, max_age=ONE_YEAR, conditional=True)
+    response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def init_assets(app):
+    """Registers `asset_url()` for templates and the `/assets/<path>` route."""
+    manifest = load_manifest(app)
+
+    def asset_url(path):
+        hashed = manifest.get(path)
+        if hashed:
+            return f"/assets/{hashed}"
+        return f"/static/{path}"
+
+    app.add_template_global(asset_url, 'asset_url')
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
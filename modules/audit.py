@@ -1,6 +1,7 @@
-from sqlalchemy import event, inspect
+from sqlalchemy import event, inspect, select
 from modules.db import db
-from modules.models import Case, Person, Ownership, Document, AuditLog, LeaseContract, Invoice
+from modules.models import Case, Person, Ownership, Document, AuditLog, LeaseContract, Invoice, default_organization_id
+from modules.changes import mark_pending
 import json
 from datetime import datetime
 
@@ -27,6 +28,19 @@ def get_details(target):
 
     return data
 
+def _case_id(connection, target):
+    """The case a change belongs to, so the change feed can be followed per case."""
+    if isinstance(target, Case):
+        return target.id
+    if isinstance(target, Invoice):
+        contract = inspect(target).attrs.contract.loaded_value
+        if contract is not None and hasattr(contract, 'case_id'):
+            return contract.case_id
+        return connection.execute(
+            select(LeaseContract.case_id).where(LeaseContract.id == target.contract_id)
+        ).scalar()
+    return getattr(target, 'case_id', None)
+
 def _log(connection, target, action):
     # Determine user
     user = "system"
@@ -42,12 +56,44 @@ def _log(connection, target, action):
         'بخش': target.__class__.__name__,
         'شناسه_هدف': target.id,
         'زمان': datetime.utcnow(),
-        'جزئیات': json.dumps(details, ensure_ascii=False)
+        'جزئیات': json.dumps(details, ensure_ascii=False),
+        'شناسه_پرونده': _case_id(connection, target)
     }
+    if getattr(target, 'organization_id', None) is not None:
+        # The row's own organization; other rows (ownerships) take the request's
+        values['شناسه_سازمان'] = target.organization_id
 
     connection.execute(
         audit_table.insert().values(**values)
     )
+    mark_pending(connection)
+
+def log_bulk(connection, model, rows, action='create'):
+    """
+    Audits rows written with bulk `insert()`/`update()` statements, which
+    bypass the mapper events below. `rows` are dicts keyed by attribute name
+    and must include `id`, and `organization_id` when written outside the
+    request's organization. All audit rows go out in one executemany.
+    """
+    if not rows:
+        return
+    col_names = {attr.key: attr.columns[0].name for attr in inspect(model).column_attrs}
+    now = datetime.utcnow()
+    connection.execute(AuditLog.__table__.insert(), [
+        {
+            'کاربر': "system",
+            'عملیات': action,
+            'بخش': model.__name__,
+            'شناسه_هدف': row['id'],
+            'زمان': now,
+            'جزئیات': json.dumps({col_names[k]: str(v) for k, v in row.items() if k in col_names and v is not None},
+                                 ensure_ascii=False),
+            'شناسه_پرونده': row['id'] if model is Case else row.get('case_id'),
+            'شناسه_سازمان': row.get('organization_id') or default_organization_id(),
+        }
+        for row in rows
+    ])
+    mark_pending(connection)
 
 def after_insert_listener(mapper, connection, target):
     _log(connection, target, 'create')
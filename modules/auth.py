@@ -0,0 +1,91 @@
+"""
+Password verification off the request threads.
+
+Password hashes are deliberately expensive (scrypt by default), so a burst
+of logins can use up every CPU. Verification runs in a small pool of
+`AUTH_HASH_WORKERS` threads. hashlib releases the GIL while hashing, so this
+gives real parallelism while capping the CPU that logins can take. At most
+`AUTH_HASH_QUEUE` further logins may wait for a worker. Beyond that,
+`verify_password` raises `AuthBusy` right away instead of tying up another
+request thread.
+
+A successful login whose stored hash was made with other parameters than
+`AUTH_HASH_METHOD` is rehashed with the current ones.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import current_app
+from werkzeug.security import check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from modules.db import db
+from modules.metrics import REGISTRY, Counter
+
+LOGIN_ATTEMPTS = REGISTRY.register(Counter(
+    'crm_login_attempts_total', 'Password verifications by outcome', ('result',)))
+
+class AuthBusy(Exception):
+    """Raised when the verification pool and its queue are full."""
+
+class HashPool:
+    def __init__(self, workers, queue_size):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def check(self, pwhash, password, timeout=None):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy()
+        try:
+            future = self._executor.submit(check_password_hash, pwhash, password)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise AuthBusy()
+
+def canonical_method(method):
+    """Spells out werkzeug's defaults, e.g. 'scrypt' -> 'scrypt:32768:8:1'."""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(args or ['32768', '8', '1'])
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+def needs_rehash(pwhash, method):
+    return pwhash.split('$', 1)[0] != canonical_method(method)
+
+def verify_password(user, password):
+    """
+    Checks `password` against `user` on the hash pool, rehashing it when the
+    configured hash parameters changed. Raises `AuthBusy` when overloaded.
+    """
+    if user is None or not user.password_hash or not password:
+        LOGIN_ATTEMPTS.inc(('rejected',))
+        return False
+    pool = current_app.extensions['auth_hash_pool']
+    try:
+        ok = pool.check(user.password_hash, password, timeout=current_app.config.get('AUTH_HASH_TIMEOUT', 10))
+    except AuthBusy:
+        LOGIN_ATTEMPTS.inc(('busy',))
+        raise
+    if not ok:
+        LOGIN_ATTEMPTS.inc(('rejected',))
+        return False
+
+    LOGIN_ATTEMPTS.inc(('accepted',))
+    method = current_app.config.get('AUTH_HASH_METHOD', 'scrypt')
+    if needs_rehash(user.password_hash, method):
+        user = db.session.merge(user)
+        user.set_password(password, method=method)
+        db.session.commit()
+        LOGIN_ATTEMPTS.inc(('rehashed',))
+    return True
+
+def init_auth(app):
+    """Creates the app's password verification pool."""
+    app.extensions['auth_hash_pool'] = HashPool(
+        app.config.get('AUTH_HASH_WORKERS', 2), app.config.get('AUTH_HASH_QUEUE', 32))
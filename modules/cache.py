@@ -0,0 +1,343 @@
+"""
+Identity cache for hot lookups by primary or natural key.
+
+`get(User, 'id', 5)` or `get(Person, 'national_id', '0012345678')` returns
+an instance attached to the current session, loading it from the database
+only on a miss. Entries are plain column snapshots kept in an in-process LRU
+with a TTL. Cached instances are attached with `merge(load=False)`, so a hit
+costs no SQL at all.
+
+Every committed flush that changes or deletes a cached model evicts that
+row's keys, including the old values of a changed natural key. With
+`CACHE_SHARED_PATH` set, a second tier in a local SQLite file is shared by
+all worker processes on the host (users and their password hashes are never
+written to it). It also carries an invalidation log, so
+one worker's commit evicts the stale entry from every other worker's
+in-process tier within `CACHE_SYNC_INTERVAL` seconds.
+
+API tokens are kept for `API_TOKEN_CACHE_TTL` seconds only: a revocation
+made where no commit hook of this process runs (another host, a plain SQL
+update) still takes effect quickly.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from modules.db import db
+from modules.metrics import REGISTRY, Counter, Gauge
+from modules.models import Tenanted, current_organization_id
+
+# Keys each model can be looked up by, besides its primary key
+NATURAL_KEYS = {
+    'User': ('username',),
+    'Person': ('national_id',),
+    'Case': ('case_number',),
+    'ApiToken': ('token_hash',),
+    'Organization': ('code',),
+}
+
+# Rows holding credentials stay in process memory: the shared tier is a file on disk
+LOCAL_ONLY = {'User'}
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'crm_identity_cache_requests_total', 'Identity cache lookups by tier that answered', ('model', 'result')))
+
+def _models():
+    from modules.models import User, Person, Case, ApiToken, Organization
+    return {'User': User, 'Person': Person, 'Case': Case, 'ApiToken': ApiToken, 'Organization': Organization}
+
+def _snapshot(instance):
+    values = {}
+    for attr in inspect(instance).mapper.column_attrs:
+        value = getattr(instance, attr.key)
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        values[attr.key] = value
+    return values
+
+def _restore(model, values):
+    instance = model()
+    for attr in inspect(model).column_attrs:
+        value = values.get(attr.key)
+        if isinstance(value, str):
+            python_type = attr.columns[0].type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+        setattr(instance, attr.key, value)
+    make_transient_to_detached(instance)
+    return instance
+
+def _key(model_name, attr, value, organization_id=None):
+    if organization_id is not None:
+        return f"{model_name}:{organization_id}:{attr}:{value}"
+    return f"{model_name}:{attr}:{value}"
+
+def _keys(model_name, attr, value, organization_id=None):
+    """
+    Where a row is stored for one lookup attribute. Rows of an organization
+    are also stored under it: requests look them up there, so they never get
+    another organization's row with the same natural key. The plain key serves
+    unscoped code (manage.py, workers).
+    """
+    keys = {_key(model_name, attr, value)}
+    if organization_id is not None:
+        keys.add(_key(model_name, attr, value, organization_id))
+    return keys
+
+def _keys_for(instance, include_history=False):
+    """All cache keys `instance` may be stored under (old natural key values too)."""
+    model_name = type(instance).__name__
+    state = inspect(instance)
+    organization_id = getattr(instance, 'organization_id', None)
+    keys = _keys(model_name, 'id', state.identity[0] if state.identity else instance.id, organization_id)
+    for attr in NATURAL_KEYS.get(model_name, ()):
+        keys |= _keys(model_name, attr, getattr(instance, attr), organization_id)
+        if include_history:
+            for old in state.attrs[attr].history.deleted or ():
+                keys |= _keys(model_name, attr, old, organization_id)
+    return keys
+
+class SharedTier:
+    """Cross-process tier: entries plus an invalidation log in a local SQLite file."""
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS invalidations (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT)')
+        self.last_seq = self._max_seq()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _max_seq(self):
+        return self._conn().execute('SELECT COALESCE(MAX(seq), 0) FROM invalidations').fetchone()[0]
+
+    def get(self, key):
+        row = self._conn().execute('SELECT value FROM entries WHERE key = ? AND expires > ?',
+                                   (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, keys, values, ttl):
+        payload = json.dumps(values, ensure_ascii=False)
+        expires = time.time() + ttl
+        self._conn().executemany('INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)',
+                                 [(k, payload, expires) for k in keys])
+
+    def invalidate(self, keys):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(k,) for k in keys])
+            conn.executemany('INSERT INTO invalidations (key) VALUES (?)', [(k,) for k in keys])
+            # Keep the log short: workers only need what happened since their last sync
+            conn.execute('DELETE FROM invalidations WHERE seq < (SELECT MAX(seq) FROM invalidations) - 10000')
+            conn.execute('DELETE FROM entries WHERE expires < ?', (time.time(),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def invalidations_since_last(self):
+        rows = self._conn().execute('SELECT seq, key FROM invalidations WHERE seq > ? ORDER BY seq',
+                                    (self.last_seq,)).fetchall()
+        if rows:
+            self.last_seq = rows[-1][0]
+        return [key for _, key in rows]
+
+class IdentityCache:
+    def __init__(self, max_entries=10000, ttl=300, shared_path=None, sync_interval=1.0, model_ttls=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_ttls = model_ttls or {}  # model name -> ttl, for models that must not stay cached as long
+        self.sync_interval = sync_interval
+        self.shared = SharedTier(shared_path) if shared_path else None
+        self._data = OrderedDict()  # key -> (expires, values)
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _sync(self):
+        if self.shared is None or time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = time.monotonic()
+        self._evict_local(self.shared.invalidations_since_last())
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def _put_local(self, keys, values, ttl):
+        expires = time.monotonic() + ttl
+        with self._lock:
+            for key in keys:
+                self._data[key] = (expires, values)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _evict_local(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def _store(self, model_name, values, shared=True):
+        organization_id = values.get('organization_id')
+        keys = _keys(model_name, 'id', values['id'], organization_id)
+        for attr in NATURAL_KEYS.get(model_name, ()):
+            keys |= _keys(model_name, attr, values[attr], organization_id)
+        ttl = self.model_ttls.get(model_name, self.ttl)
+        self._put_local(keys, values, ttl)
+        if shared and self.shared is not None and model_name not in LOCAL_ONLY:
+            self.shared.put(keys, values, ttl)
+
+    def _lookup(self, model_name, key):
+        self._sync()
+        values = self._get_local(key)
+        if values is not None:
+            CACHE_REQUESTS.inc((model_name, 'hit'))
+            return values
+        if self.shared is not None and model_name not in LOCAL_ONLY:
+            values = self.shared.get(key)
+            if values is not None:
+                CACHE_REQUESTS.inc((model_name, 'shared_hit'))
+                self._store(model_name, values, shared=False)
+                return values
+        CACHE_REQUESTS.inc((model_name, 'miss'))
+        return None
+
+    def get(self, model, attr, value, attach=True):
+        """
+        Returns the `model` row whose `attr` equals `value`, or None.
+
+        The instance is attached to the current session unless `attach` is
+        False: a detached copy is cheaper when only column values are read.
+        """
+        found = self.get_many(model, attr, [value], attach=attach)
+        return found.get(value)
+
+    def get_many(self, model, attr, values, attach=True):
+        """Like `get` for several values; all misses are loaded with one `IN` query."""
+        model_name = model.__name__
+        found, missing = {}, []
+        organization_id = current_organization_id() if issubclass(model, Tenanted) else None
+        for value in dict.fromkeys(values):
+            cached = self._lookup(model_name, _key(model_name, attr, value, organization_id))
+            if cached is None:
+                missing.append(value)
+            else:
+                instance = _restore(model, cached)
+                found[value] = db.session.merge(instance, load=False) if attach else instance
+        if missing:
+            column = getattr(model, attr)
+            # Rows read inside a deferred-commit block may never be committed, rows read from a replica may be stale
+            cacheable = not (db.session.info.get('deferred_commits') or db.session.info.get('read_replica'))
+            for instance in model.query.filter(column.in_(missing)):
+                if cacheable:
+                    self._store(model_name, _snapshot(instance))
+                found[getattr(instance, attr)] = instance
+        return found
+
+    def invalidate(self, keys):
+        if not keys:
+            return
+        self._evict_local(keys)
+        if self.shared is not None:
+            self.shared.invalidate(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+def _current_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('identity_cache')
+
+def _after_flush(session, flush_context):
+    # Collected now, while attribute history still has the old natural key values
+    cached_models = tuple(_models().values())
+    pending = session.info.setdefault('identity_cache_evict', set())
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, cached_models):
+            pending |= _keys_for(instance, include_history=True)
+
+def evict_on_commit(session, model, rows):
+    """Queues eviction of rows changed by bulk statements, which the flush hook never sees.
+
+    `rows` are dicts with `id`, the model's natural key attributes and, for
+    tenanted models, `organization_id`.
+    """
+    model_name = model.__name__
+    pending = session.info.setdefault('identity_cache_evict', set())
+    for values in rows:
+        organization_id = values.get('organization_id')
+        pending |= _keys(model_name, 'id', values['id'], organization_id)
+        for attr in NATURAL_KEYS.get(model_name, ()):
+            pending |= _keys(model_name, attr, values[attr], organization_id)
+
+def _after_commit(session):
+    keys = session.info.pop('identity_cache_evict', None)
+    cache = _current_cache()
+    if keys and cache is not None:
+        cache.invalidate(keys)
+
+def _after_rollback(session):
+    session.info.pop('identity_cache_evict', None)
+
+def get_cache():
+    """The current app's identity cache (a pass-through one when caching is disabled)."""
+    return current_app.extensions['identity_cache']
+
+class _NoCache(IdentityCache):
+    def _lookup(self, model_name, key):
+        CACHE_REQUESTS.inc((model_name, 'miss'))
+        return None
+
+    def _store(self, model_name, values, shared=True):
+        pass
+
+def init_cache(app):
+    """Creates the app's identity cache and hooks invalidation into session commits (once per process)."""
+    if app.config.get('CACHE_ENABLED', True):
+        cache = IdentityCache(
+            max_entries=app.config.get('CACHE_MAX_ENTRIES', 10000),
+            ttl=app.config.get('CACHE_TTL', 300),
+            shared_path=app.config.get('CACHE_SHARED_PATH'),
+            sync_interval=app.config.get('CACHE_SYNC_INTERVAL', 1.0),
+            model_ttls={'ApiToken': app.config.get('API_TOKEN_CACHE_TTL', 10)},
+        )
+    else:
+        cache = _NoCache()
+    app.extensions['identity_cache'] = cache
+
+    REGISTRY.register(Gauge('crm_identity_cache_entries', 'Keys held by the in-process identity cache',
+                            lambda: len(_current_cache() or ())))
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
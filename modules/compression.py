@@ -0,0 +1,188 @@
+"""
+Response compression for API and page responses.
+
+Negotiates zstd, brotli or gzip from `Accept-Encoding` (zstd and brotli only
+when the `zstandard`/`brotli` packages are installed), skips bodies smaller
+than `COMPRESS_MIN_SIZE`, compresses streamed responses chunk by chunk, and
+keeps a small LRU of compressed bodies for GET responses so repeated
+identical payloads are only compressed once.
+"""
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from flask import request, g
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'application/xml',
+                      'text/html', 'text/css', 'text/plain', 'text/csv', 'text/event-stream', 'image/svg+xml')
+
+DEFAULT_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+
+def available_encodings():
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+def negotiate(accept_encoding, preferred):
+    """Picks the first encoding in `preferred` the client accepts (q > 0)."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    for encoding in preferred:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+def compress(data, encoding, level):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+def compress_stream(chunks, encoding, level):
+    """Compresses an iterable of chunks, flushing after each so streamed events are not held back."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+
+class CompressedCache:
+    """Thread-safe LRU of compressed bodies keyed by (encoding, level, body digest)."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+def _is_compressible(response, min_size):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return False
+    if request.method == 'HEAD' or response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    if response.is_streamed:
+        return True
+    return response.content_length is None or response.content_length >= min_size
+
+def init_compression(app):
+    """Registers the compression `after_request` hook on `app`."""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    preferred = [e for e in app.config.get('COMPRESS_ALGORITHMS', ['zstd', 'br', 'gzip'])
+                 if e in available_encodings()]
+    levels = dict(DEFAULT_LEVELS, **app.config.get('COMPRESS_LEVELS', {}))
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    stream = app.config.get('COMPRESS_STREAMS', True)
+    cache = CompressedCache(app.config.get('COMPRESS_CACHE_ENTRIES', 256))
+    cache_max_bytes = app.config.get('COMPRESS_CACHE_MAX_BYTES', 2 * 1024 * 1024)
+    app.extensions['compression_cache'] = cache
+
+    from modules.metrics import REGISTRY, Gauge
+    REGISTRY.register(Gauge('crm_compression_cache_hits_total', 'Compressed body cache hits',
+                            lambda: app.extensions['compression_cache'].hits, kind='counter'))
+    REGISTRY.register(Gauge('crm_compression_cache_misses_total', 'Compressed body cache misses',
+                            lambda: app.extensions['compression_cache'].misses, kind='counter'))
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not _is_compressible(response, min_size):
+            return response
+        encoding = negotiate(request.headers.get('Accept-Encoding'), preferred)
+        if encoding is None:
+            return response
+        level = levels[encoding]
+
+        if response.is_streamed:
+            if not stream:
+                return response
+            response.response = compress_stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoding
+            return response
+
+        started = time.perf_counter()
+        body = response.get_data()
+        cacheable = request.method == 'GET' and 'no-store' not in response.headers.get('Cache-Control', '')
+        key = None
+        compressed = None
+        if cacheable and len(body) <= cache_max_bytes:
+            key = (encoding, level, hashlib.blake2b(body, digest_size=16).digest())
+            compressed = cache.get(key)
+        if compressed is None:
+            compressed = compress(body, encoding, level)
+            if key is not None:
+                cache.put(key, compressed)
+
+        if len(compressed) < len(body):
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = encoding
+        g.perf_compress_time = time.perf_counter() - started
+        return response
@@ -0,0 +1,251 @@
+"""
+Synthetic data generator for capacity planning and benchmarks.
+
+Cases are generated in fixed-size chunks. Worker processes build the rows of
+a chunk (Faker is the expensive part) while the main process bulk inserts the
+previous one with executemany. Primary keys are assigned up front from the
+current table maxima so rows can reference each other without round trips.
+Core inserts bypass the ORM audit listeners, so 'create' audit rows for
+people, cases and contracts are generated explicitly.
+"""
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from multiprocessing import Pool
+from sqlalchemy import func, text
+from modules.db import db
+from modules.models import Case, Person, Ownership, Document, LeaseContract, Invoice, AuditLog
+
+STATUSES = ['active'] * 6 + ['pending'] * 2 + ['closed'] * 2
+CATEGORIES = ['Deed', 'Contract', 'Map', 'Permit', 'Other']
+PERIODS = {'monthly': 30, 'quarterly': 91, 'yearly': 365}
+PEOPLE_PER_CASE = 1.5
+
+_faker = None
+
+def _get_faker(seed):
+    global _faker
+    if _faker is None:
+        from faker import Faker
+        _faker = Faker(['fa_IR'])
+    _faker.seed_instance(seed)
+    return _faker
+
+def national_id(n):
+    """Builds a valid 10 digit Iranian national code (with check digit) from a sequence number."""
+    body = f"{n % 1_000_000_000:09d}"
+    total = sum(int(d) * (10 - i) for i, d in enumerate(body))
+    remainder = total % 11
+    check = remainder if remainder < 2 else 11 - remainder
+    return f"{body}{check}"
+
+def _audit_row(model, target_id, values, when):
+    return {
+        'کاربر': 'generator',
+        'عملیات': 'create',
+        'بخش': model,
+        'شناسه_هدف': target_id,
+        'زمان': when,
+        'جزئیات': json.dumps({k: str(v) for k, v in values.items() if v is not None}, ensure_ascii=False),
+    }
+
+def build_chunk(spec):
+    """Builds all rows for one chunk of cases. Runs inside a worker process.
+
+    Contract ids are local (0-based) and are remapped by the caller.
+    """
+    fake = _get_faker(spec['seed'])
+    rnd = random.Random(spec['seed'])
+    today = spec['today']
+    years = spec['years']
+    horizon_days = max(years, 1) * 365
+
+    people, cases, ownerships, documents, contracts, invoices = [], [], [], [], [], []
+
+    for i in range(spec['n_people']):
+        pid = spec['person_base'] + i
+        people.append({
+            'شناسه': pid,
+            'نام_و_نام_خانوادگی': fake.name(),
+            'کد_ملی': national_id(pid),
+            'تلفن_همراه': fake.phone_number(),
+            'تلفن_ثابت': fake.phone_number() if rnd.random() < 0.5 else None,
+        })
+    max_person = spec['person_base'] + spec['n_people'] - 1
+
+    roots = []
+    for i in range(spec['n_cases']):
+        cid = spec['case_base'] + i
+        created = datetime.combine(today - timedelta(days=rnd.randint(0, horizon_days)), datetime.min.time())
+        parent_id = None
+        if roots and rnd.random() < 0.1:
+            parent_id = rnd.choice(roots)
+        else:
+            roots.append(cid)
+        cases.append({
+            'شناسه': cid,
+            'شماره_پرونده': f"G-{cid:08d}",
+            'شماره_کلاسه': f"CLS-{rnd.randint(1000, 99999)}",
+            'وضعیت': rnd.choice(STATUSES),
+            'آدرس': fake.address(),
+            'توضیحات': fake.text(max_nb_chars=200),
+            'تاریخ_ایجاد': created,
+            'شناسه_والد': parent_id,
+        })
+
+        # Ownership history: sequential owners, the last one current
+        start = created.date()
+        n_owners = rnd.randint(1, 4)
+        for k in range(n_owners):
+            last = k == n_owners - 1
+            end = None if last else start + timedelta(days=rnd.randint(90, 900))
+            ownerships.append({
+                'شناسه_پرونده': cid,
+                'شناسه_شخص': rnd.randint(spec['person_min'], max_person),
+                'تاریخ_شروع': start,
+                'تاریخ_پایان': end,
+                'فعال': last,
+            })
+            if end:
+                start = end
+
+        for k in range(rnd.randint(1, 5)):
+            documents.append({
+                'شناسه_پرونده': cid,
+                'عنوان': fake.word(),
+                'توضیحات': fake.sentence(),
+                'مسیر_فایل': f"generated/{cid}_{k}.pdf",
+                'دسته_بندی': rnd.choice(CATEGORIES),
+                'تاریخ_ثبت': created + timedelta(days=rnd.randint(0, 30)),
+                'تاریخ_سند': created.date() - timedelta(days=rnd.randint(0, 3650)),
+            })
+
+        if rnd.random() < 0.4:
+            period = rnd.choice(list(PERIODS))
+            c_start = today - timedelta(days=rnd.randint(0, horizon_days))
+            c_end = c_start + timedelta(days=365 * rnd.randint(1, max(years, 1) + 1))
+            base_rent = rnd.randint(50, 5000) * 100_000
+            local_id = len(contracts)
+            contracts.append({
+                'شناسه_پرونده': cid,
+                'شناسه_مستاجر': rnd.randint(spec['person_min'], max_person),
+                'تاریخ_شروع': c_start,
+                'تاریخ_پایان': c_end,
+                'مبلغ_اجاره_پایه': base_rent,
+                'دوره_پرداخت': period,
+                'درصد_افزایش_سالانه': float(rnd.choice([0, 10, 15, 20, 25])),
+            })
+            due = c_start
+            n_invoices = 0
+            while due <= min(today, c_end):
+                n_invoices += 1
+                invoices.append({
+                    '_contract': local_id,
+                    # A case has at most one generated contract, so its id keeps the numbers unique across runs
+                    'شماره_صورتحساب': f"GI-{cid:08d}-{n_invoices:04d}",
+                    'مبلغ': base_rent,
+                    'تاریخ_سررسید': due,
+                    'وضعیت': 'paid' if due < today - timedelta(days=60) or rnd.random() < 0.5 else 'unpaid',
+                    'تاریخ_صدور': datetime.combine(due, datetime.min.time()),
+                })
+                due += timedelta(days=PERIODS[period])
+
+    return {
+        'people': people, 'cases': cases, 'ownerships': ownerships,
+        'documents': documents, 'contracts': contracts, 'invoices': invoices,
+    }
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+def _insert(table, rows, batch=20000):
+    for i in range(0, len(rows), batch):
+        db.session.execute(table.insert(), rows[i:i + batch])
+
+def _sync_sequences():
+    """Explicit primary keys do not advance PostgreSQL sequences."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in (Case, Person, Ownership, Document, LeaseContract, Invoice, AuditLog):
+        table = model.__table__.name
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'شناسه'), "
+            f"COALESCE((SELECT MAX(\"شناسه\") FROM \"{table}\"), 1))"
+        ))
+    db.session.commit()
+
+def generate(n_cases, workers=None, years=3, seed=1, chunk_size=5000, audit=True, log=print):
+    """Generates `n_cases` cases with people, ownerships, documents, contracts and invoices.
+
+    Must run inside an application context. Returns row counts per table.
+    """
+    case_base = _next_id(Case)
+    person_base = _next_id(Person)
+    contract_next = _next_id(LeaseContract)
+    today = date.today()
+
+    specs = []
+    offset = 0
+    people_offset = 0
+    while offset < n_cases:
+        n = min(chunk_size, n_cases - offset)
+        n_people = max(1, int(n * PEOPLE_PER_CASE))
+        specs.append({
+            # The first case id differs from run to run, so a second run does not repeat the first one's data
+            'seed': seed * 1_000_003 + case_base + offset,
+            'today': today,
+            'years': years,
+            'case_base': case_base + offset,
+            'n_cases': n,
+            'person_base': person_base + people_offset,
+            'person_min': person_base,
+            'n_people': n_people,
+        })
+        offset += n
+        people_offset += n_people
+
+    counts = {'people': 0, 'cases': 0, 'ownerships': 0, 'documents': 0, 'contracts': 0, 'invoices': 0, 'audit': 0}
+    started = time.perf_counter()
+
+    def insert_chunk(chunk):
+        nonlocal contract_next
+        contract_ids = list(range(contract_next, contract_next + len(chunk['contracts'])))
+        for row, cid in zip(chunk['contracts'], contract_ids):
+            row['شناسه'] = cid
+        for row in chunk['invoices']:
+            row['شناسه_قرارداد'] = contract_ids[row.pop('_contract')]
+        contract_next += len(contract_ids)
+
+        _insert(Person.__table__, chunk['people'])
+        _insert(Case.__table__, chunk['cases'])
+        _insert(Ownership.__table__, chunk['ownerships'])
+        _insert(Document.__table__, chunk['documents'])
+        _insert(LeaseContract.__table__, chunk['contracts'])
+        _insert(Invoice.__table__, chunk['invoices'])
+
+        if audit:
+            now = datetime.utcnow()
+            audit_rows = [_audit_row('Person', r['شناسه'], r, now) for r in chunk['people']]
+            audit_rows += [_audit_row('Case', r['شناسه'], r, r['تاریخ_ایجاد']) for r in chunk['cases']]
+            audit_rows += [_audit_row('LeaseContract', r['شناسه'], r, now) for r in chunk['contracts']]
+            _insert(AuditLog.__table__, audit_rows)
+            counts['audit'] += len(audit_rows)
+        db.session.commit()
+
+        for key in ('people', 'cases', 'ownerships', 'documents', 'contracts', 'invoices'):
+            counts[key] += len(chunk[key])
+        elapsed = time.perf_counter() - started
+        log(f"  {counts['cases']:,}/{n_cases:,} cases "
+            f"({counts['invoices']:,} invoices) - {counts['cases'] / elapsed:,.0f} cases/s")
+
+    if workers == 1 or len(specs) == 1:
+        for spec in specs:
+            insert_chunk(build_chunk(spec))
+    else:
+        with Pool(processes=workers) as pool:
+            for chunk in pool.imap(build_chunk, specs):
+                insert_chunk(chunk)
+
+    _sync_sequences()
+    return counts
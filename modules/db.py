@@ -1,5 +1,64 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_marshmallow import Marshmallow
+from contextlib import contextmanager
+from sqlalchemy import Select, UpdateBase, select, text
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """
+    Sends plain SELECTs to the read replica named in `info['read_replica']`
+    (set by modules/replicas.py for the duration of a view). Flushes, DML
+    and locking reads go to the primary, and the session stays on the
+    primary afterwards, so it reads back what it wrote.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('read_replica')
+        if replica is not None and bind is None:
+            writing = self._flushing or isinstance(clause, UpdateBase)
+            if isinstance(clause, Select) and clause._for_update_arg is None and not writing:
+                return self._db.engines[replica]
+            if writing or isinstance(clause, Select):
+                del self.info['read_replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 ma = Marshmallow()
+
+def lock_rows(model, ids):
+    """
+    Locks the given rows of `model` until the current transaction ends, so
+    concurrent read-modify-write sequences on them run one after another.
+
+    PostgreSQL uses `SELECT ... FOR UPDATE`. SQLite has no row locks: a no-op
+    write takes the database write lock right away (what `BEGIN IMMEDIATE`
+    does) instead of at the first flush, after the reads it depends on.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    if db.session.get_bind().dialect.name == 'sqlite':
+        table = model.__table__.name
+        db.session.execute(text(f'UPDATE "{table}" SET rowid = rowid WHERE 0'))
+    else:
+        pk = model.__mapper__.primary_key[0]
+        db.session.execute(select(pk).where(pk.in_(ids)).order_by(pk).with_for_update()).all()
+
+@contextmanager
+def deferred_commits(session):
+    """
+    Turns `session.commit()` into a flush until the block exits, so several
+    view functions that each commit run in one transaction. Like a real
+    commit it expires loaded objects, so later views re-read what earlier
+    ones wrote. The caller commits or rolls back afterwards.
+    """
+    def flush_and_expire():
+        session.flush()
+        session.expire_all()
+
+    session.commit = flush_and_expire
+    session.info['deferred_commits'] = True
+    try:
+        yield session
+    finally:
+        del session.commit
+        session.info.pop('deferred_commits', None)
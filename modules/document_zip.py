@@ -0,0 +1,169 @@
+"""
+Streamed ZIP downloads of a case's documents.
+
+`case_documents()` resolves the case (optionally with its whole subdivided
+subtree, through one recursive query) and its documents, and maps every
+file to a path inside the archive: one folder per case, nested like the
+subdivision tree, with the document titles as file names.
+
+`stream_zip()` builds the archive while it is sent. `zipfile` writes to a
+sink that is drained after every chunk, so neither a temp file nor the
+whole archive in memory is needed. Sizes and CRCs go into data descriptors
+after each entry, and ZIP64 records are used for large files. Formats that
+are already compressed (images, PDFs, office files, archives) are stored
+as they are; deflating them costs CPU and saves nothing. Non-ASCII names
+get the ZIP UTF-8 flag, so Persian titles show up correctly in current
+unzip tools.
+"""
+import itertools
+import os
+import re
+import unicodedata
+import zipfile
+from datetime import datetime, timezone
+from sqlalchemy import select
+from modules.db import db
+from modules.metrics import REGISTRY, Counter
+from modules.models import Case, Document
+from modules.storage import StorageError
+
+CHUNK_SIZE = 256 * 1024
+
+# Deflating these saves next to nothing
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.tif', '.tiff',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz', '.zst',
+    '.mp3', '.mp4', '.m4a', '.mov', '.avi', '.mkv',
+}
+
+MISSING_FILES_NAME = 'فایل_های_ناموجود.txt'
+
+ZIP_BYTES = REGISTRY.register(Counter(
+    'crm_document_zip_bytes_total', 'Document bytes sent in ZIP downloads', ('compression',)))
+
+# Characters Windows, macOS or unzip tools do not accept in names
+_UNSAFE = re.compile(r'[\x00-\x1f\x7f/\\:*?"<>|]+')
+# The earliest time a ZIP entry can carry
+_ZIP_EPOCH = datetime(1980, 1, 2, tzinfo=timezone.utc)
+
+def safe_name(value, fallback='بدون_نام', max_length=120):
+    """A single path component: NFC normalised, without separators or reserved characters."""
+    value = _UNSAFE.sub('_', unicodedata.normalize('NFC', value or '')).strip(' .')
+    return value[:max_length].rstrip(' .') or fallback
+
+def _subtree(case_id, include_children):
+    """{case id: (parent id, case number)} for the case, and its descendants when asked."""
+    root = select(Case.id, Case.parent_id, Case.case_number).where(Case.id == case_id)
+    if not include_children:
+        return {r.id: (None, r.case_number) for r in db.session.execute(root)}
+    tree = root.cte('subtree', recursive=True)
+    tree = tree.union_all(select(Case.id, Case.parent_id, Case.case_number).join(tree, Case.parent_id == tree.c.id))
+    rows = db.session.execute(select(tree)).all()
+    return {r.id: (r.parent_id if r.id != case_id else None, r.case_number) for r in rows}
+
+def _folders(cases):
+    """{case id: 'parent/child/'} following the subdivision tree."""
+    folders = {}
+
+    def folder(case_id):
+        if case_id not in folders:
+            parent_id, number = cases[case_id]
+            prefix = folder(parent_id) if parent_id in cases else ''
+            folders[case_id] = f"{prefix}{safe_name(number, fallback=str(case_id))}/"
+        return folders[case_id]
+
+    for case_id in cases:
+        folder(case_id)
+    return folders
+
+def _entry_name(document):
+    ext = os.path.splitext(document.file_path)[1].lower()
+    title = safe_name(document.title or os.path.splitext(os.path.basename(document.file_path))[0])
+    if ext and title.lower().endswith(ext):
+        title = title[:-len(ext)]
+    return title + ext
+
+def case_documents(case_id, include_children):
+    """
+    Returns (root case number, [(name in archive, storage key)]) for the
+    case's documents, or None when the case does not exist.
+    """
+    cases = _subtree(case_id, include_children)
+    if case_id not in cases:
+        return None
+    folders = _folders(cases)
+    # Quarantined files stay out
+    documents = db.session.execute(
+        select(Document)
+        .where(Document.case_id.in_(cases), Document.processing_status != 'quarantined')
+        .order_by(Document.case_id, Document.id)
+    ).scalars().all()
+
+    entries, used = [], set()
+    for document in documents:
+        name = folders[document.case_id] + _entry_name(document)
+        base, ext = os.path.splitext(name)
+        counter = 2
+        while name.lower() in used:
+            name = f"{base} ({counter}){ext}"
+            counter += 1
+        used.add(name.lower())
+        entries.append((name, document.file_path))
+    return cases[case_id][1], entries
+
+class _Sink:
+    """A write-only file for zipfile that collects output until it is drained."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(entries, storage, chunk_size=CHUNK_SIZE):
+    """
+    Yields a ZIP archive of `entries` ([(name in archive, storage key)]) in
+    pieces of about `chunk_size`. Files that cannot be read are listed in a
+    text file at the end of the archive instead.
+    """
+    sink = _Sink()
+    missing = []
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for name, key in entries:
+            stat = storage.stat(key)
+            chunks = storage.stream(key, chunk_size=chunk_size) if stat else None
+            try:
+                # Read ahead, so a file that vanished is caught before its entry is started
+                first = next(chunks, b'') if chunks else None
+            except StorageError:
+                first = None
+            if first is None:
+                missing.append(name)
+                continue
+            size, modified, _ = stat
+            stored = os.path.splitext(name)[1].lower() in STORED_EXTENSIONS
+            info = zipfile.ZipInfo(name, date_time=max(modified.astimezone(), _ZIP_EPOCH).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            # Lets zipfile decide up front whether the entry needs ZIP64 sizes
+            info.file_size = size
+            with archive.open(info, 'w') as target:
+                for chunk in itertools.chain((first,), chunks):
+                    target.write(chunk)
+                    # Deflate may hold output back; only send what is there
+                    data = sink.drain()
+                    if data:
+                        yield data
+            ZIP_BYTES.inc(('stored' if stored else 'deflated',), size)
+            yield sink.drain()
+        if missing:
+            archive.writestr(MISSING_FILES_NAME, '\n'.join(missing) + '\n')
+    yield sink.drain()
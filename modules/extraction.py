@@ -0,0 +1,265 @@
+"""
+Text extraction from document files, for content search.
+
+Each document's file is read once and its text is stored in
+`document_texts`, with a full-text index over it (FTS5 on SQLite, a GIN
+`to_tsvector` index on PostgreSQL). The case search and
+`/api/documents/search` match against that index.
+
+- Plain text files are read as UTF-8.
+- PDFs use their embedded text layer (needs the optional `pypdf` package).
+  Scanned PDFs without one end up as `empty`.
+- Images are OCRed when `pytesseract`, Pillow and the `tesseract` binary
+  are installed (`EXTRACTION_OCR_LANGUAGES`, default `fas+eng`). Otherwise
+  they are recorded as `unsupported`.
+
+Parsing and OCR are CPU-bound, so they run in the post-upload processing
+pool (see modules/processing.py, where extraction is the `extract_text`
+step). `python manage.py extract_texts` processes whatever is pending: new
+files, or files whose size/version changed since their text was extracted.
+Only documents that finished processing (not quarantined) are read.
+Documents that share a file (subdivided units) are extracted once.
+
+Arabic and Persian letter variants (ي/ی, ك/ک) and diacritics are
+normalised in both the stored text and search terms, so either spelling
+matches.
+"""
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, func, text, table, column, literal_column
+from modules.db import db
+from modules.metrics import REGISTRY, Counter, Histogram, DURATION_BUCKETS
+from modules.models import Document, DocumentText, current_organization_id
+from modules.storage import get_storage, run_on_local_copies
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+TEXT_EXTENSIONS = {'.txt', '.csv', '.md'}
+PDF_EXTENSIONS = {'.pdf'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp'}
+
+EXTRACTIONS = REGISTRY.register(Counter(
+    'crm_text_extractions_total', 'Files processed by the text extractor', ('method', 'status')))
+EXTRACTION_SECONDS = REGISTRY.register(Histogram(
+    'crm_text_extraction_seconds', 'Extraction time per file (in the worker)', DURATION_BUCKETS, ('method',)))
+EXTRACTION_BYTES = REGISTRY.register(Counter(
+    'crm_text_extraction_bytes_total', 'Bytes of files read by the text extractor', ('method',)))
+
+_search_table = table('document_search', column('rowid'), column('content'))
+
+# --- Normalisation ----------------------------------------------------------
+
+_CHAR_MAP = str.maketrans({'\u064a': '\u06cc', '\u0649': '\u06cc', '\u0643': '\u06a9',  # Arabic yeh/kaf -> Persian
+                           '\u0629': '\u0647', '\u06c0': '\u0647', '\u200c': ' ', '\x00': ''})
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+_SPACES = re.compile(r'[ \t\r\f\v]+')
+
+def normalize(value):
+    value = _DIACRITICS.sub('', value.translate(_CHAR_MAP))
+    lines = (_SPACES.sub(' ', line).strip() for line in value.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+# --- Extraction (runs in pool workers) ----------------------------------------
+
+def ocr_available():
+    return pytesseract is not None and shutil.which('tesseract') is not None
+
+def method_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TEXT_EXTENSIONS:
+        return 'text'
+    if ext in PDF_EXTENSIONS:
+        return 'pdf'
+    if ext in IMAGE_EXTENSIONS:
+        return 'ocr'
+    return None
+
+def extract_file(path, ocr_languages='fas+eng', max_chars=1_000_000):
+    """Returns (method, status, text, error, seconds). Safe to run in another process."""
+    started = time.perf_counter()
+    method = method_for(path)
+
+    def result(status, content=None, error=None):
+        return method, status, content, error, time.perf_counter() - started
+
+    try:
+        if method == 'text':
+            with open(path, 'rb') as f:
+                content = f.read().decode('utf-8', errors='replace')
+        elif method == 'pdf':
+            if PdfReader is None:
+                return result('unsupported', error='pypdf is not installed')
+            content = '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+        elif method == 'ocr':
+            if not ocr_available():
+                return result('unsupported', error='No OCR engine installed')
+            with Image.open(path) as image:
+                content = pytesseract.image_to_string(image, lang=ocr_languages)
+        else:
+            return result('unsupported', error='Unsupported file type')
+    except Exception as e:
+        return result('error', error=str(e)[:500])
+
+    content = normalize(content)[:max_chars]
+    return result('done' if content else 'empty', content)
+
+# --- Pending work and storage -------------------------------------------------
+
+def pending_documents(storage, document_ids=None, retry_failed=False):
+    """
+    {file_path: (fingerprint, [document ids])} for documents without text for
+    their current file. `retry_failed` also takes files that were unsupported
+    or failed before (e.g. after installing pypdf or tesseract).
+    """
+    query = (select(Document.id, Document.file_path, DocumentText.document_id, DocumentText.fingerprint,
+                    DocumentText.status)
+             .outerjoin(DocumentText, DocumentText.document_id == Document.id))
+    query = query.where(Document.processing_status == 'ready')
+    if document_ids is not None:
+        query = query.where(Document.id.in_(document_ids))
+    pending, stats = {}, {}
+    for doc_id, file_path, has_text, known, status in db.session.execute(query.order_by(Document.id)):
+        if file_path not in stats:
+            stats[file_path] = storage.fingerprint(file_path)
+        current = stats[file_path]
+        if has_text is None or current != known or (retry_failed and status in ('unsupported', 'error')):
+            pending.setdefault(file_path, (current, []))[1].append(doc_id)
+    return pending
+
+def _extracted_copies(pending):
+    """{file_path: DocumentText} for pending files another document already has current text for."""
+    if not pending:
+        return {}
+    query = (select(Document.file_path, DocumentText)
+             .join(DocumentText, DocumentText.document_id == Document.id)
+             .where(Document.file_path.in_(pending), DocumentText.status.in_(('done', 'empty')))
+             .execution_options(include_archived=True))
+    copies = {}
+    for file_path, extracted in db.session.execute(query):
+        if extracted.fingerprint == pending[file_path][0] and extracted.document_id not in pending[file_path][1]:
+            copies.setdefault(file_path, extracted)
+    return copies
+
+def _store(file_path, fp, document_ids, outcome):
+    method, status, content, error, seconds = outcome
+    if fp is None:
+        status, error = 'error', 'File not found'
+    for doc_id in document_ids:
+        db.session.merge(DocumentText(document_id=doc_id, status=status, method=method, content=content,
+                                      error=error, fingerprint=fp, extracted_at=datetime.utcnow()))
+    db.session.flush()
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(_search_table.delete().where(_search_table.c.rowid.in_(document_ids)))
+        if content:
+            db.session.execute(_search_table.insert(), [{'rowid': d, 'content': content} for d in document_ids])
+
+def _outcomes(jobs, storage, config, pool, window):
+    """Yields (file_path, outcome) in job order, extracting in `pool` when given."""
+    args = (config.get('EXTRACTION_OCR_LANGUAGES', 'fas+eng'), config.get('EXTRACTION_MAX_CHARS', 1_000_000))
+    for file_path, outcome in run_on_local_copies(storage, [(path, args) for path in jobs], extract_file, pool, window):
+        yield file_path, outcome or (method_for(file_path), 'error', None, 'File not found', 0)
+
+def run_extraction(document_ids=None, pool=None, batch_size=50, retry_failed=False, log=None):
+    """
+    Extracts text for new or changed documents (only `document_ids` when
+    given), committing every `batch_size` files. Returns counts by status.
+    """
+    config = current_app.config
+    storage = get_storage()
+    pending = pending_documents(storage, document_ids, retry_failed)
+    # Missing files are recorded without a trip to the pool
+    jobs = [path for path, (fp, _) in pending.items() if fp is not None]
+    counts = {}
+    for file_path in [path for path, (fp, _) in pending.items() if fp is None]:
+        _store(file_path, None, pending[file_path][1], (method_for(file_path), 'error', None, None, 0))
+        counts['error'] = counts.get('error', 0) + 1
+    # Subdivided units share their parent's files: reuse the text instead of extracting it again
+    for file_path, source in _extracted_copies(pending).items():
+        fp, doc_ids = pending[file_path]
+        _store(file_path, fp, doc_ids, (source.method, source.status, source.content, None, 0))
+        counts['copied'] = counts.get('copied', 0) + 1
+        jobs.remove(file_path)
+
+    started = time.perf_counter()
+    total_bytes = 0
+    done = 0
+    for file_path, outcome in _outcomes(jobs, storage, config, pool, batch_size):
+        fp, doc_ids = pending[file_path]
+        _store(file_path, fp, doc_ids, outcome)
+        method, status, _, _, seconds = outcome
+        size = int(fp.split(':')[0])
+        total_bytes += size
+        EXTRACTIONS.inc((method or 'none', status))
+        EXTRACTION_SECONDS.observe((method or 'none',), seconds)
+        EXTRACTION_BYTES.inc((method or 'none',), size)
+        counts[status] = counts.get(status, 0) + 1
+        done += 1
+        if done % batch_size == 0:
+            db.session.commit()
+            if log:
+                elapsed = time.perf_counter() - started
+                log(f"  {done}/{len(jobs)} files, {done / elapsed:.1f} files/s, "
+                    f"{total_bytes / elapsed / 1e6:.1f} MB/s")
+    db.session.commit()
+    return counts
+
+# --- Search -----------------------------------------------------------------
+
+def _fts_query(term):
+    """Every word must match; the last one as a prefix, so partial words work while typing."""
+    words = [w.replace('"', '""') for w in normalize(term).split()]
+    if not words:
+        return None
+    return ' '.join(f'"{w}"' for w in words[:-1]) + (' ' if len(words) > 1 else '') + f'"{words[-1]}"*'
+
+def matching_document_ids(term):
+    """A subquery of the ids of documents whose text matches `term` (None when the term has no words)."""
+    if db.engine.dialect.name == 'sqlite':
+        query = _fts_query(term)
+        if query is None:
+            return None
+        return select(_search_table.c.rowid).where(literal_column('document_search').op('MATCH')(query))
+    return select(DocumentText.document_id).where(
+        func.to_tsvector('simple', func.coalesce(DocumentText.content, '')).op('@@')(
+            func.plainto_tsquery('simple', normalize(term))))
+
+def search(term, limit):
+    """[(document id, snippet)] best matches first."""
+    if db.engine.dialect.name == 'sqlite':
+        query = _fts_query(term)
+        if query is None:
+            return []
+        organization_id = current_organization_id()
+        # Raw SQL is not scoped by modules/tenancy.py or the archive filter: keep other organizations' and
+        # archived documents out of the top `limit`. Each match is checked by primary key
+        scope = ('JOIN documents ON documents."شناسه" = document_search.rowid '
+                 'AND documents."شناسه_سازمان" = :org AND documents."تاریخ_بایگانی" IS NULL '
+                 if organization_id is not None else '')
+        rows = db.session.execute(text(
+            "SELECT document_search.rowid, snippet(document_search, 0, '[', ']', '…', 16) FROM document_search "
+            f"{scope}WHERE document_search MATCH :q ORDER BY rank LIMIT :n"),
+            {'q': query, 'n': limit, 'org': organization_id})
+        return [tuple(r) for r in rows]
+    tsquery = func.plainto_tsquery('simple', normalize(term))
+    vector = func.to_tsvector('simple', func.coalesce(DocumentText.content, ''))
+    rows = db.session.execute(
+        select(DocumentText.document_id,
+               func.ts_headline('simple', DocumentText.content, tsquery, 'StartSel=[, StopSel=]'))
+        .join(Document, Document.id == DocumentText.document_id)  # scoped to the organization (and live rows)
+        .where(vector.op('@@')(tsquery))
+        .order_by(func.ts_rank(vector, tsquery).desc())
+        .limit(limit))
+    return [tuple(r) for r in rows]
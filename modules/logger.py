@@ -1,34 +1,150 @@
-
+import atexit
+import json
 import logging
-from flask import request
+import queue
+import random
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from flask import request, g
+
+# Loggers routed through the background queue
+PIPELINE_LOGGERS = ('api_logger', 'slow_query', 'profiler')
+
+# Request fields copied from `extra` into each JSON line
+REQUEST_FIELDS = ('request_id', 'user', 'method', 'path', 'endpoint', 'status', 'latency_ms',
+                  'db_ms', 'queries', 'size', 'remote')
+
+_listener = None
+_queue_handler = None
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key in REQUEST_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted."""
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+def _build_file_handler(config):
+    path = config.get('LOG_FILE', 'app.log')
+    if config.get('LOG_ROTATION', 'size') == 'time':
+        handler = TimedRotatingFileHandler(path, when=config.get('LOG_ROTATE_WHEN', 'midnight'),
+                                           backupCount=config.get('LOG_BACKUP_COUNT', 7), encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(path, maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                      backupCount=config.get('LOG_BACKUP_COUNT', 7), encoding='utf-8')
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+def _start_pipeline(config):
+    """Starts the listener thread and attaches the queue handler. Runs once per process."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    handlers = [_build_file_handler(config)]
+    if config.get('LOG_CONSOLE', True):
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        handlers.append(stream_handler)
+
+    log_queue = queue.Queue(maxsize=config.get('LOG_QUEUE_SIZE', 10000))
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    for name in PIPELINE_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        logger.addHandler(_queue_handler)
+        logger.propagate = False
+
+    from modules.metrics import REGISTRY, Gauge
+    REGISTRY.register(Gauge('crm_log_records_dropped_total', 'Log records dropped because the queue was full',
+                            lambda: DroppingQueueHandler.dropped, kind='counter'))
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for name in PIPELINE_LOGGERS:
+        logging.getLogger(name).removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
+
+def _current_username():
+    # Read the user flask_login already loaded; never trigger a user lookup just for logging
+    user = g.get('_login_user')
+    if user is not None and getattr(user, 'is_authenticated', False):
+        return user.username
+    return None
 
 def setup_logger(app):
     """
-    Sets up a file and stream logger for the application.
-    Logs each request to `app.log` and the console.
+    Sets up structured request logging for the application.
+    Records are queued and written by a background thread as JSON lines
+    to `LOG_FILE` (rotated by size or time) and to the console, so the
+    request thread never waits on log I/O. Safe to call for every app
+    instance; handlers are only attached once per process.
     """
-    # Create logger
+    _start_pipeline(app.config)
     logger = logging.getLogger('api_logger')
-    logger.setLevel(logging.INFO)
-
-    # File Handler
-    file_handler = logging.FileHandler('app.log')
-    file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
-
-    # Stream Handler (Console)
-    stream_handler = logging.StreamHandler()
-    stream_formatter = logging.Formatter('%(levelname)s: %(message)s')
-    stream_handler.setFormatter(stream_formatter)
-    logger.addHandler(stream_handler)
 
     @app.before_request
-    def log_request():
-        # You can log headers, body, etc.
-        logger.info(f"REQUEST: {request.method} {request.path} - Remote: {request.remote_addr}")
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
 
     @app.after_request
     def log_response(response):
-        logger.info(f"RESPONSE: {response.status} - Size: {response.content_length}")
+        response.headers['X-Request-ID'] = g.request_id
+        status = response.status_code
+        latency = g.get('perf_total_time')
+        slow_ms = app.config.get('SLOW_REQUEST_MS', 1000)
+        is_slow = latency is not None and latency * 1000 >= slow_ms
+
+        # Always log errors and slow requests; sample the (high volume) 2xx/3xx traffic
+        sample_rate = app.config.get('LOG_2XX_SAMPLE_RATE', 1.0)
+        if status < 400 and not is_slow and sample_rate < 1.0 and random.random() >= sample_rate:
+            return response
+
+        fields = {
+            'request_id': g.request_id,
+            'user': _current_username(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status,
+            'latency_ms': round(latency * 1000, 1) if latency is not None else None,
+            'db_ms': round(g.perf_db_time * 1000, 1) if 'perf_db_time' in g else None,
+            'queries': g.get('perf_db_count'),
+            'size': response.content_length,
+            'remote': request.remote_addr,
+        }
+        level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 or is_slow else logging.INFO
+        logger.log(level, "%s %s %s", request.method, request.path, status, extra=fields)
         return response
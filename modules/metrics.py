@@ -0,0 +1,261 @@
+"""
+Per-request performance instrumentation.
+
+Every request records wall time, DB time, query count and serialization
+time. They are returned in a `Server-Timing` header and aggregated into
+Prometheus-style histograms served at `/metrics` (per process). Statements
+slower than `SLOW_QUERY_MS` are logged with their parameters, and requests
+can be profiled with cProfile on demand or by sampling.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context, has_app_context, Response
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_logger = logging.getLogger('slow_query')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Gauge:
+    """A value read from a callback at scrape time (`kind='counter'` for monotonic ones)."""
+    def __init__(self, name, help_text, callback, kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {self.callback()}"]
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.values = {}  # label_values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (str(bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {series[-1]}")
+        return lines
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{str(v).replace(chr(34), "")}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Re-registering (e.g. a second create_app) keeps the existing series
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'crm_http_request_duration_seconds', 'Request wall time', DURATION_BUCKETS, ('endpoint', 'method')))
+REQUEST_COUNT = REGISTRY.register(Counter(
+    'crm_http_requests_total', 'Requests by status', ('endpoint', 'method', 'status')))
+DB_DURATION = REGISTRY.register(Histogram(
+    'crm_db_duration_seconds', 'Time spent in SQL per request', DURATION_BUCKETS, ('endpoint',)))
+DB_QUERIES = REGISTRY.register(Histogram(
+    'crm_db_queries_per_request', 'SQL statements per request', QUERY_COUNT_BUCKETS, ('endpoint',)))
+SERIALIZATION_DURATION = REGISTRY.register(Histogram(
+    'crm_serialization_duration_seconds', 'Time spent dumping schemas and encoding JSON per request',
+    DURATION_BUCKETS, ('endpoint',)))
+SLOW_QUERIES = REGISTRY.register(Counter(
+    'crm_slow_queries_total', 'Statements slower than SLOW_QUERY_MS', ('endpoint',)))
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+# --- SQL timing -----------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start_time')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    if has_request_context() and 'perf_start' in g:
+        g.perf_db_time += elapsed
+        g.perf_db_count += 1
+
+    threshold_ms = current_app.config.get('SLOW_QUERY_MS', 200) if has_app_context() else 200
+    if threshold_ms is not None and elapsed * 1000 >= threshold_ms:
+        endpoint = _endpoint() if has_request_context() else 'none'
+        SLOW_QUERIES.inc((endpoint,))
+        params = parameters
+        if executemany and isinstance(parameters, (list, tuple)):
+            params = f"{list(parameters[:3])} ... ({len(parameters)} rows)"
+        slow_query_logger.warning(
+            "SLOW QUERY %.1f ms [%s]: %s | params: %s",
+            elapsed * 1000, endpoint, ' '.join(statement.split()), params,
+            extra={'request_id': g.get('request_id') if has_request_context() else None, 'endpoint': endpoint}
+        )
+
+def _register_engine_listeners():
+    # Listening on the Engine class covers every engine/bind, once per process
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+# --- Serialization timing -------------------------------------------------
+
+@contextmanager
+def serialization_timer():
+    """Adds the enclosed time, minus any SQL run inside it (lazy loads), to the request's serialization time.
+
+    Re-entrant: nested schema dumps are only counted once.
+    """
+    if not has_request_context() or 'perf_start' not in g:
+        yield
+        return
+    g.perf_ser_depth += 1
+    if g.perf_ser_depth > 1:
+        try:
+            yield
+        finally:
+            g.perf_ser_depth -= 1
+        return
+    start = time.perf_counter()
+    db_before = g.perf_db_time
+    try:
+        yield
+    finally:
+        g.perf_ser_depth -= 1
+        g.perf_ser_time += (time.perf_counter() - start) - (g.perf_db_time - db_before)
+
+class InstrumentedJSONProvider(DefaultJSONProvider):
+    # Persian text as UTF-8 is a third of the size of \uXXXX escapes
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        with serialization_timer():
+            return super().dumps(obj, **kwargs)
+
+# --- Request hooks --------------------------------------------------------
+
+def _start_request():
+    g.perf_start = time.perf_counter()
+    g.perf_db_time = 0.0
+    g.perf_db_count = 0
+    g.perf_ser_time = 0.0
+    g.perf_ser_depth = 0
+
+    config = current_app.config
+    on_demand = config.get('PROFILE_ON_DEMAND') and request.headers.get('X-Profile') == '1'
+    sampled = random.random() < config.get('PROFILE_SAMPLE_RATE', 0.0)
+    if on_demand or sampled:
+        g.perf_profiler = cProfile.Profile()
+        g.perf_profiler.enable()
+
+def _finish_request(response):
+    if 'perf_start' not in g:
+        return response
+    profiler = g.pop('perf_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        response.headers['X-Profile-File'] = _save_profile(profiler)
+
+    total = time.perf_counter() - g.perf_start
+    endpoint = _endpoint()
+    g.perf_total_time = total
+
+    response.headers['Server-Timing'] = (
+        f'app;dur={total * 1000:.1f}, '
+        f'db;dur={g.perf_db_time * 1000:.1f};desc="{g.perf_db_count} queries", '
+        f'ser;dur={g.perf_ser_time * 1000:.1f}'
+    )
+    if 'perf_compress_time' in g:
+        response.headers['Server-Timing'] += f', cmp;dur={g.perf_compress_time * 1000:.1f}'
+
+    REQUEST_DURATION.observe((endpoint, request.method), total)
+    REQUEST_COUNT.inc((endpoint, request.method, response.status_code))
+    DB_DURATION.observe((endpoint,), g.perf_db_time)
+    DB_QUERIES.observe((endpoint,), g.perf_db_count)
+    SERIALIZATION_DURATION.observe((endpoint,), g.perf_ser_time)
+    return response
+
+def _save_profile(profiler):
+    profile_dir = current_app.config.get('PROFILE_DIR', 'profiles')
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{_endpoint()}-{time.strftime('%Y%m%d-%H%M%S')}-{random.getrandbits(24):06x}.prof"
+    path = os.path.join(profile_dir, name)
+    profiler.dump_stats(path)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+    logging.getLogger('profiler').info("PROFILE %s %s -> %s\n%s", request.method, request.path, path, summary.getvalue())
+    return name
+
+def metrics_view():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app):
+    """Registers timing hooks, the JSON provider and the `/metrics` endpoint on `app`."""
+    _register_engine_listeners()
+    app.json = InstrumentedJSONProvider(app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    if app.config.get('METRICS_ENABLED', True):
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
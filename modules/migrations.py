@@ -0,0 +1,272 @@
+"""
+Versioned schema and data migrations.
+
+Migrations live in the top level `migrations/` package as `NNNN_name.py`
+modules exposing `revision`, `description` and `upgrade(ctx)`. Applied
+revisions are recorded in `schema_migrations`. New tables are created by
+`db.create_all()`; migrations take care of everything create_all cannot do on
+an existing database (column changes, new indexes, data backfills), so each
+one must be safe to run against a database that already has its changes.
+"""
+import importlib
+import os
+import time
+from datetime import datetime
+from sqlalchemy import text, inspect, MetaData, Table, UniqueConstraint
+from sqlalchemy.schema import CreateTable
+
+MIGRATIONS_PACKAGE = 'migrations'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), MIGRATIONS_PACKAGE)
+
+VERSION_TABLE = 'schema_migrations'
+PROGRESS_TABLE = 'schema_migration_progress'
+
+class Migration:
+    def __init__(self, module):
+        self.module = module
+        self.revision = module.revision
+        self.description = getattr(module, 'description', '')
+
+    def upgrade(self, ctx):
+        self.module.upgrade(ctx)
+
+def discover():
+    """Returns all migrations sorted by revision."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename[:4].isdigit() and filename.endswith('.py'):
+            module = importlib.import_module(f"{MIGRATIONS_PACKAGE}.{filename[:-3]}")
+            migrations.append(Migration(module))
+    return migrations
+
+def _ensure_version_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ('
+            'version VARCHAR(32) PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)'
+        ))
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} ('
+            'version VARCHAR(32) NOT NULL, step VARCHAR(100) NOT NULL, last_key BIGINT, '
+            'PRIMARY KEY (version, step))'
+        ))
+
+def applied_revisions(engine):
+    _ensure_version_tables(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f'SELECT version FROM {VERSION_TABLE}'))}
+
+def _mark_applied(engine, migration):
+    with engine.begin() as conn:
+        conn.execute(
+            text(f'INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)'),
+            {'v': migration.revision, 'd': migration.description, 't': datetime.utcnow()}
+        )
+        conn.execute(text(f'DELETE FROM {PROGRESS_TABLE} WHERE version = :v'), {'v': migration.revision})
+
+def status(engine):
+    """Returns (migration, is_applied) pairs in revision order."""
+    applied = applied_revisions(engine)
+    return [(m, m.revision in applied) for m in discover()]
+
+def upgrade(engine, target=None, log=print):
+    """Applies pending migrations up to and including `target` (default: all)."""
+    applied = applied_revisions(engine)
+    count = 0
+    for migration in discover():
+        if target and migration.revision > target:
+            break
+        if migration.revision in applied:
+            continue
+        log(f"[{migration.revision}] {migration.description}")
+        started = time.perf_counter()
+        migration.upgrade(MigrationContext(engine, migration.revision, log))
+        _mark_applied(engine, migration)
+        log(f"[{migration.revision}] done in {time.perf_counter() - started:.1f}s")
+        count += 1
+    return count
+
+def stamp(engine, target=None):
+    """Records migrations as applied without running them (for fresh create_all databases)."""
+    applied = applied_revisions(engine)
+    for migration in discover():
+        if target and migration.revision > target:
+            break
+        if migration.revision not in applied:
+            _mark_applied(engine, migration)
+
+class MigrationContext:
+    """Operations available to a migration's `upgrade(ctx)`.
+
+    Every operation runs in its own short transaction so a migration never
+    holds locks for longer than one statement or one backfill batch.
+    """
+    def __init__(self, engine, revision, log=print):
+        self.engine = engine
+        self.revision = revision
+        self.log = log
+
+    @property
+    def dialect(self):
+        return self.engine.dialect.name
+
+    def execute(self, sql, params=None):
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), params or {})
+
+    def has_table(self, table):
+        return inspect(self.engine).has_table(table)
+
+    def has_column(self, table, column):
+        return column in self.columns(table)
+
+    def columns(self, table):
+        return {c['name']: c for c in inspect(self.engine).get_columns(table)}
+
+    def has_index(self, table, name):
+        return any(ix['name'] == name for ix in inspect(self.engine).get_indexes(table))
+
+    def add_column(self, table, column, ddl_type, default=None):
+        """Adds a nullable column. Cheap on both PostgreSQL and SQLite (no table rewrite)."""
+        if self.has_column(table, column):
+            return
+        sql = f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl_type}'
+        if default is not None:
+            sql += f' DEFAULT {default}'
+        self.execute(sql)
+
+    def alter_column_type(self, table, column, type_, using):
+        """Changes a column's type, converting existing values with the SQL expression `using`.
+
+        PostgreSQL does this in place. SQLite has no ALTER COLUMN, so the table
+        is copied into its new shape (foreign keys off, indexes recreated).
+        """
+        if self.dialect == 'postgresql':
+            type_sql = type_.compile(dialect=self.engine.dialect)
+            self.execute(f'ALTER TABLE "{table}" ALTER COLUMN "{column}" TYPE {type_sql} USING {using}')
+            return
+
+        with self.engine.connect() as conn:
+            conn.execute(text('PRAGMA foreign_keys=OFF'))
+            conn.commit()
+
+            reflected = Table(table, MetaData(), autoload_with=conn)
+            reflected.c[column].type = type_
+            # Inline column UNIQUEs only show up as SQLite auto indexes
+            unique_cols = {tuple(c.columns.keys()) for c in reflected.constraints if isinstance(c, UniqueConstraint)}
+            for ix in inspect(conn).get_indexes(table, include_auto_indexes=True):
+                if ix['name'].startswith('sqlite_autoindex') and tuple(ix['column_names']) not in unique_cols:
+                    reflected.append_constraint(UniqueConstraint(*ix['column_names']))
+            tmp_name = f"{table}__new"
+            preparer = conn.dialect.identifier_preparer
+            ddl = str(CreateTable(reflected).compile(conn)).strip()
+            ddl = ddl.replace(f"CREATE TABLE {preparer.format_table(reflected)} ",
+                              f"CREATE TABLE {preparer.quote(tmp_name)} ", 1)
+            cols = ', '.join(preparer.quote(c.name) for c in reflected.columns)
+            select_cols = ', '.join(
+                f'{using} AS "{c.name}"' if c.name == column else preparer.quote(c.name)
+                for c in reflected.columns
+            )
+            conn.execute(text(f'DROP TABLE IF EXISTS "{tmp_name}"'))
+            conn.execute(text(ddl))
+            conn.execute(text(f'INSERT INTO "{tmp_name}" ({cols}) SELECT {select_cols} FROM "{table}"'))
+            conn.execute(text(f'DROP TABLE "{table}"'))
+            conn.execute(text(f'ALTER TABLE "{tmp_name}" RENAME TO "{table}"'))
+            for index in reflected.indexes:
+                index.create(conn)
+            conn.commit()
+
+            conn.execute(text('PRAGMA foreign_keys=ON'))
+            conn.commit()
+
+    def create_index(self, name, table, columns, unique=False, where=None):
+        """Creates an index without blocking writes where the database supports it.
+
+        On PostgreSQL this runs `CREATE INDEX CONCURRENTLY` outside a transaction.
+        """
+        if self.has_index(table, name):
+            return
+        cols = ', '.join(f'"{c}"' for c in columns)
+        unique_sql = 'UNIQUE ' if unique else ''
+        concurrently = 'CONCURRENTLY ' if self.dialect == 'postgresql' else ''
+        sql = f'CREATE {unique_sql}INDEX {concurrently}IF NOT EXISTS "{name}" ON "{table}" ({cols})'
+        if where:
+            sql += f' WHERE {where}'
+        if self.dialect == 'postgresql':
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(sql))
+        else:
+            self.execute(sql)
+
+    def drop_index(self, name):
+        concurrently = 'CONCURRENTLY ' if self.dialect == 'postgresql' else ''
+        sql = f'DROP INDEX {concurrently}IF EXISTS "{name}"'
+        if self.dialect == 'postgresql':
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(sql))
+        else:
+            self.execute(sql)
+
+    def _get_progress(self, step):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text(f'SELECT last_key FROM {PROGRESS_TABLE} WHERE version = :v AND step = :s'),
+                {'v': self.revision, 's': step}
+            ).scalar()
+
+    def backfill(self, step, table, set_clause, where=None, params=None,
+                 key='شناسه', batch_size=5000, pause=0.0):
+        """Runs `UPDATE table SET set_clause` in primary key ordered batches.
+
+        Each batch commits together with its progress marker, so an interrupted
+        backfill resumes after the last finished batch. Rows are updated in
+        place: no table rewrite on SQLite and only short row locks on
+        PostgreSQL. `pause` (seconds) can be used to leave room for live traffic.
+        """
+        last_key = self._get_progress(step)
+        with self.engine.connect() as conn:
+            total, max_key = conn.execute(text(f'SELECT COUNT(*), MAX("{key}") FROM "{table}"')).one()
+        if not total:
+            return 0
+
+        filter_sql = f' AND ({where})' if where else ''
+        done = 0
+        if last_key is not None:
+            with self.engine.connect() as conn:
+                done = conn.execute(
+                    text(f'SELECT COUNT(*) FROM "{table}" WHERE "{key}" <= :k'), {'k': last_key}
+                ).scalar()
+            self.log(f"  {step}: resuming after {key}={last_key}")
+
+        updated = 0
+        while last_key is None or last_key < max_key:
+            lower = last_key if last_key is not None else -1
+            with self.engine.begin() as conn:
+                if self.dialect == 'postgresql':
+                    # Give up on a batch rather than queue behind long-running writers
+                    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                upper = conn.execute(
+                    text(f'SELECT "{key}" FROM "{table}" WHERE "{key}" > :lo ORDER BY "{key}" LIMIT 1 OFFSET :off'),
+                    {'lo': lower, 'off': batch_size - 1}
+                ).scalar()
+                if upper is None:
+                    upper = max_key
+                result = conn.execute(
+                    text(f'UPDATE "{table}" SET {set_clause} WHERE "{key}" > :lo AND "{key}" <= :hi{filter_sql}'),
+                    dict(params or {}, lo=lower, hi=upper)
+                )
+                updated += result.rowcount
+                batch_rows = conn.execute(
+                    text(f'SELECT COUNT(*) FROM "{table}" WHERE "{key}" > :lo AND "{key}" <= :hi'),
+                    {'lo': lower, 'hi': upper}
+                ).scalar()
+                conn.execute(text(f'DELETE FROM {PROGRESS_TABLE} WHERE version = :v AND step = :s'),
+                             {'v': self.revision, 's': step})
+                conn.execute(text(f'INSERT INTO {PROGRESS_TABLE} (version, step, last_key) VALUES (:v, :s, :k)'),
+                             {'v': self.revision, 's': step, 'k': upper})
+            last_key = upper
+            done += batch_rows
+            self.log(f"  {step}: {done:,}/{total:,} rows ({done * 100 // total}%)")
+            if pause:
+                time.sleep(pause)
+        return updated
@@ -1,17 +1,42 @@
 from modules.db import db
 from datetime import datetime
+from sqlalchemy import event, DDL
+from sqlalchemy.orm import declared_attr
 import json
+from flask import g, has_app_context
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# Existing rows, and rows created outside a request, belong to this organization
+DEFAULT_ORGANIZATION_ID = 1
+
+class Organization(db.Model):
+    """A district served by this deployment. Its data is kept apart from the others' (modules/tenancy.py)."""
+    __tablename__ = 'organizations'
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    schema_name = db.Column(db.String(63), nullable=True)  # PostgreSQL schema holding its tables; None: shared tables
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Organization {self.code}>'
+
+event.listen(Organization.__table__, 'after_create', DDL(
+    f"INSERT INTO organizations (id, code, name) VALUES ({DEFAULT_ORGANIZATION_ID}, 'default', 'Default')"))
+event.listen(Organization.__table__, 'after_create', DDL(
+    "SELECT setval(pg_get_serial_sequence('organizations', 'id'), (SELECT MAX(id) FROM organizations))"
+).execute_if(dialect='postgresql'))
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)  # None: the default one
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    def set_password(self, password, method='scrypt'):
+        self.password_hash = generate_password_hash(password, method=method)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -19,10 +44,65 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
-class Case(db.Model):
+class ApiToken(db.Model):
+    __tablename__ = 'api_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)  # e.g. the integration using it
+    token_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)  # sha256 hex; the token itself is never stored
+    prefix = db.Column(db.String(8), nullable=False)  # first characters, to recognise a token in logs
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)  # None: the default one
+
+    def __repr__(self):
+        return f'<ApiToken {self.name} {self.prefix}>'
+
+class Versioned:
+    """
+    Row version and last change time, used by the offline sync API
+    (modules/sync.py). The version is SQLAlchemy's version counter: every ORM
+    UPDATE checks and bumps it, so a write based on a stale read fails with
+    StaleDataError instead of silently overwriting.
+    """
+    version = db.Column('نسخه', db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column('تاریخ_به_روزرسانی', db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @declared_attr.directive
+    def __mapper_args__(cls):
+        return {'version_id_col': cls.__table__.c['نسخه']}
+
+class Archivable:
+    """
+    Soft delete. Archived rows stay in their table but are left out of every
+    ORM query unless it runs with `execution_options(include_archived=True)`
+    (see modules/archive.py). Partial indexes only cover live rows.
+    """
+    archived_at = db.Column('تاریخ_بایگانی', db.DateTime, nullable=True)
+
+def current_organization_id():
+    """The organization the current request works in; None outside requests, where nothing is scoped."""
+    return g.get('organization_id') if has_app_context() else None
+
+def default_organization_id():
+    """The organization new rows belong to: the request's, else the default one."""
+    organization_id = current_organization_id()
+    return DEFAULT_ORGANIZATION_ID if organization_id is None else organization_id
+
+class Tenanted:
+    """
+    Rows that belong to one organization. Inside a request, ORM queries only
+    see the request's organization and new rows are stamped with it (see
+    modules/tenancy.py).
+    """
+    @declared_attr
+    def organization_id(cls):
+        return db.Column('شناسه_سازمان', db.Integer, db.ForeignKey('organizations.id'), nullable=False,
+                         default=default_organization_id, server_default=str(DEFAULT_ORGANIZATION_ID))
+
+class Case(Versioned, Archivable, Tenanted, db.Model):
     __tablename__ = 'cases'
     id = db.Column('شناسه', db.Integer, primary_key=True)
-    case_number = db.Column('شماره_پرونده', db.String(50), unique=True, nullable=False, index=True)
+    case_number = db.Column('شماره_پرونده', db.String(50), nullable=False) # unique per organization
     classification_number = db.Column('شماره_کلاسه', db.String(50), index=True)
     status = db.Column('وضعیت', db.String(20), default='active')
     address = db.Column('آدرس', db.Text)
@@ -39,11 +119,11 @@ class Case(db.Model):
     def __repr__(self):
         return f'<Case {self.case_number}>'
 
-class Person(db.Model):
+class Person(Versioned, Tenanted, db.Model):
     __tablename__ = 'people'
     id = db.Column('شناسه', db.Integer, primary_key=True)
-    full_name = db.Column('نام_و_نام_خانوادگی', db.String(100), nullable=False, index=True)
-    national_id = db.Column('کد_ملی', db.String(20), unique=True, nullable=False, index=True)
+    full_name = db.Column('نام_و_نام_خانوادگی', db.String(100), nullable=False)
+    national_id = db.Column('کد_ملی', db.String(20), nullable=False) # unique per organization
     phone = db.Column('تلفن_همراه', db.String(20))
     alt_phone = db.Column('تلفن_ثابت', db.String(20))
 
@@ -54,7 +134,7 @@ class Person(db.Model):
     def __repr__(self):
         return f'<Person {self.full_name}>'
 
-class Ownership(db.Model):
+class Ownership(Versioned, Archivable, db.Model):
     __tablename__ = 'ownerships'
     id = db.Column('شناسه', db.Integer, primary_key=True)
     case_id = db.Column('شناسه_پرونده', db.Integer, db.ForeignKey('cases.شناسه'), nullable=False)
@@ -63,7 +143,11 @@ class Ownership(db.Model):
     end_date = db.Column('تاریخ_پایان', db.Date, nullable=True)
     is_current = db.Column('فعال', db.Boolean, default=True)
 
-class Document(db.Model):
+# At most one current owner per case, enforced by the database
+db.Index('uq_ownerships_current_case', Ownership.case_id, unique=True,
+         sqlite_where=Ownership.is_current == db.true(), postgresql_where=Ownership.is_current == db.true())
+
+class Document(Versioned, Archivable, Tenanted, db.Model):
     __tablename__ = 'documents'
     id = db.Column('شناسه', db.Integer, primary_key=True)
     case_id = db.Column('شناسه_پرونده', db.Integer, db.ForeignKey('cases.شناسه'), nullable=False)
@@ -73,8 +157,36 @@ class Document(db.Model):
     category = db.Column('دسته_بندی', db.String(50))
     created_at = db.Column('تاریخ_ثبت', db.DateTime, default=datetime.utcnow)
     document_date = db.Column('تاریخ_سند', db.Date, nullable=True)
+    # Set while the upload is written (modules/uploads.py)
+    file_size = db.Column('حجم_فایل', db.BigInteger)
+    checksum = db.Column('هش_فایل', db.String(64)) # SHA-256, hex
+    mime_type = db.Column('نوع_فایل', db.String(100)) # sniffed from the content
+    # Post-upload processing (modules/processing.py): pending, ready, quarantined, failed
+    processing_status = db.Column('وضعیت_پردازش', db.String(20), nullable=False, default='ready', server_default='ready')
+    processing_error = db.Column('خطای_پردازش', db.String(500))
+    thumbnail_path = db.Column('مسیر_تصویر_کوچک', db.String(255))
 
-class AuditLog(db.Model):
+class DocumentText(db.Model):
+    """Text extracted from a document's file for content search (see modules/extraction.py)."""
+    __tablename__ = 'document_texts'
+    document_id = db.Column('شناسه_سند', db.Integer, db.ForeignKey('documents.شناسه'), primary_key=True)
+    status = db.Column('وضعیت', db.String(20), nullable=False) # done, empty, unsupported, error
+    method = db.Column('روش', db.String(10)) # text, pdf, ocr
+    content = db.Column('متن', db.Text)
+    error = db.Column('خطا', db.String(500))
+    fingerprint = db.Column('اثر_فایل', db.String(64)) # size and version (mtime or ETag) of the file the text came from
+    extracted_at = db.Column('تاریخ_استخراج', db.DateTime, default=datetime.utcnow)
+
+# Full-text index over the extracted text: FTS5 on SQLite (rowid = document id), GIN on PostgreSQL
+event.listen(DocumentText.__table__, 'after_create', DDL(
+    'CREATE VIRTUAL TABLE IF NOT EXISTS document_search USING fts5(content)').execute_if(dialect='sqlite'))
+event.listen(DocumentText.__table__, 'after_drop', DDL(
+    'DROP TABLE IF EXISTS document_search').execute_if(dialect='sqlite'))
+event.listen(DocumentText.__table__, 'after_create', DDL(
+    'CREATE INDEX IF NOT EXISTS ix_document_texts_search ON document_texts '
+    'USING GIN (to_tsvector(\'simple\', coalesce("متن", \'\')))').execute_if(dialect='postgresql'))
+
+class AuditLog(Tenanted, db.Model):
     __tablename__ = 'audit_logs'
     id = db.Column('شناسه', db.Integer, primary_key=True)
     user = db.Column('کاربر', db.String(50)) # Placeholder for user system
@@ -83,6 +195,7 @@ class AuditLog(db.Model):
     target_id = db.Column('شناسه_هدف', db.Integer)
     timestamp = db.Column('زمان', db.DateTime, default=datetime.utcnow)
     details = db.Column('جزئیات', db.Text) # JSON string
+    case_id = db.Column('شناسه_پرونده', db.Integer, index=True) # case the change belongs to, for the change feed
 
     def set_details(self, details_dict):
         self.details = json.dumps(details_dict, ensure_ascii=False)
@@ -90,25 +203,61 @@ class AuditLog(db.Model):
     def get_details(self):
         return json.loads(self.details) if self.details else {}
 
-class LeaseContract(db.Model):
+class LeaseContract(Versioned, Archivable, Tenanted, db.Model):
     __tablename__ = 'lease_contracts'
     id = db.Column('شناسه', db.Integer, primary_key=True)
     case_id = db.Column('شناسه_پرونده', db.Integer, db.ForeignKey('cases.شناسه'), nullable=False)
     tenant_id = db.Column('شناسه_مستاجر', db.Integer, db.ForeignKey('people.شناسه'), nullable=False)
     start_date = db.Column('تاریخ_شروع', db.Date, nullable=False)
     end_date = db.Column('تاریخ_پایان', db.Date, nullable=False)
-    base_rent = db.Column('مبلغ_اجاره_پایه', db.Float, nullable=False)
+    base_rent = db.Column('مبلغ_اجاره_پایه', db.BigInteger, nullable=False) # Whole Rials
     payment_period = db.Column('دوره_پرداخت', db.String(20)) # monthly, quarterly, yearly
     annual_increase_percent = db.Column('درصد_افزایش_سالانه', db.Float, default=0.0)
 
     invoices = db.relationship('Invoice', backref='contract', lazy=True)
 
-class Invoice(db.Model):
+class Invoice(Versioned, Archivable, Tenanted, db.Model):
     __tablename__ = 'invoices'
     id = db.Column('شناسه', db.Integer, primary_key=True)
     contract_id = db.Column('شناسه_قرارداد', db.Integer, db.ForeignKey('lease_contracts.شناسه'), nullable=False)
     invoice_number = db.Column('شماره_صورتحساب', db.String(50), unique=True, nullable=False)
-    amount = db.Column('مبلغ', db.Float, nullable=False)
+    amount = db.Column('مبلغ', db.BigInteger, nullable=False) # Whole Rials
     due_date = db.Column('تاریخ_سررسید', db.Date, nullable=False)
     status = db.Column('وضعیت', db.String(20), default='unpaid')
     created_at = db.Column('تاریخ_صدور', db.DateTime, default=datetime.utcnow)
+
+# Natural keys are unique within an organization
+db.Index('ix_cases_org_case_number', Case.organization_id, Case.case_number, unique=True)
+db.Index('ix_people_org_national_id', Person.organization_id, Person.national_id, unique=True)
+db.Index('ix_people_org_name', Person.organization_id, Person.full_name)
+# The change feed pages through one organization's audit rows
+db.Index('ix_audit_logs_org', AuditLog.organization_id, AuditLog.id)
+
+# Hot-path indexes over live rows only (archived rows are excluded from default queries).
+# Organization-wide lists lead on the organization; rows reached through their case use the case id.
+db.Index('ix_cases_live_org', Case.organization_id, Case.id,
+         sqlite_where=Case.archived_at.is_(None), postgresql_where=Case.archived_at.is_(None))
+db.Index('ix_cases_live_org_status', Case.organization_id, Case.status,
+         sqlite_where=Case.archived_at.is_(None), postgresql_where=Case.archived_at.is_(None))
+db.Index('ix_cases_live_parent', Case.parent_id,
+         sqlite_where=Case.archived_at.is_(None), postgresql_where=Case.archived_at.is_(None))
+db.Index('ix_ownerships_live_case', Ownership.case_id,
+         sqlite_where=Ownership.archived_at.is_(None), postgresql_where=Ownership.archived_at.is_(None))
+db.Index('ix_ownerships_live_person', Ownership.person_id,
+         sqlite_where=Ownership.archived_at.is_(None), postgresql_where=Ownership.archived_at.is_(None))
+db.Index('ix_documents_live_case', Document.case_id,
+         sqlite_where=Document.archived_at.is_(None), postgresql_where=Document.archived_at.is_(None))
+db.Index('ix_lease_contracts_live_case', LeaseContract.case_id,
+         sqlite_where=LeaseContract.archived_at.is_(None), postgresql_where=LeaseContract.archived_at.is_(None))
+# Contracts still running, for invoice generation (not led by the organization, see modules/query_plans.py)
+db.Index('ix_lease_contracts_live_end', LeaseContract.end_date,
+         sqlite_where=LeaseContract.archived_at.is_(None), postgresql_where=LeaseContract.archived_at.is_(None))
+# Ordered by issue date, so a contract's latest invoice is read without sorting
+db.Index('ix_invoices_live_contract_created', Invoice.contract_id, Invoice.created_at,
+         sqlite_where=Invoice.archived_at.is_(None), postgresql_where=Invoice.archived_at.is_(None))
+db.Index('ix_invoices_live_org_status', Invoice.organization_id, Invoice.status,
+         sqlite_where=Invoice.archived_at.is_(None), postgresql_where=Invoice.archived_at.is_(None))
+
+# Documents still in (or stuck in) post-upload processing; nearly all rows are 'ready'
+db.Index('ix_documents_unprocessed', Document.processing_status,
+         sqlite_where=Document.processing_status != 'ready', postgresql_where=Document.processing_status != 'ready')
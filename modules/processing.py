@@ -0,0 +1,272 @@
+"""
+Post-upload processing of documents.
+
+Uploads are checked while they are written (modules/uploads.py). Everything
+slower runs after the commit, off the request thread. Documents then go
+through the steps in `UPLOAD_PROCESSORS`, in order:
+
+- `scan`: runs `UPLOAD_SCAN_COMMAND` (e.g. `clamdscan --no-summary {path}`)
+  on the file. Exit code 0 means clean. A code in
+  `UPLOAD_SCAN_INFECTED_CODES` quarantines the document: it cannot be
+  downloaded and gets no further processing. Any other result marks it
+  `failed`, to be retried by `python manage.py process_uploads --retry`.
+- `thumbnail`: a small JPEG preview of images (needs Pillow).
+- `extract_text`: text for content search (modules/extraction.py).
+- `package.module:function`: any other callable with the same signature
+  as `scan(path, info, options)`.
+
+File steps run in a process pool (`UPLOAD_PROCESSING_WORKERS`, 0 for
+inline), one task per file. A file shared by several documents (subdivided
+units) is processed once. The documents' `وضعیت_پردازش` shows where they
+are: `pending` until their file steps ran, then `ready`, `quarantined` or
+`failed`. Documents no file step applies to are `ready` right away.
+"""
+import importlib
+import io
+import logging
+import multiprocessing
+import queue
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from modules.db import db
+from modules.extraction import run_extraction
+from modules.metrics import REGISTRY, Counter, Gauge, Histogram, DURATION_BUCKETS
+from modules.models import Document
+from modules.storage import get_storage, run_on_local_copies
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+THUMBNAIL_DIR = 'thumbnails'
+
+# Config passed to the steps in the pool (it has to be picklable)
+OPTION_KEYS = ('UPLOAD_SCAN_COMMAND', 'UPLOAD_SCAN_TIMEOUT', 'UPLOAD_SCAN_INFECTED_CODES',
+               'UPLOAD_THUMBNAIL_SIZE')
+
+PROCESSING_STEPS = REGISTRY.register(Counter(
+    'crm_upload_processing_total', 'Post-upload processing steps run, by outcome', ('step', 'outcome')))
+PROCESSING_SECONDS = REGISTRY.register(Histogram(
+    'crm_upload_processing_seconds', 'Time per post-upload processing step (in the worker)', DURATION_BUCKETS,
+    ('step',)))
+
+logger = logging.getLogger(__name__)
+
+# --- Steps (run in pool workers) ----------------------------------------------
+
+def scan(path, info, options):
+    """Runs the configured scanner. Returns {'outcome': 'ok' | 'quarantine', 'error': report}."""
+    args = shlex.split(options['UPLOAD_SCAN_COMMAND'])
+    args = [arg.replace('{path}', path) for arg in args] if any('{path}' in a for a in args) else args + [path]
+    result = subprocess.run(args, capture_output=True, text=True, timeout=options.get('UPLOAD_SCAN_TIMEOUT') or 120)
+    if result.returncode == 0:
+        return {'outcome': 'ok'}
+    report = (result.stdout.strip() or result.stderr.strip())[-500:]
+    if result.returncode in (options.get('UPLOAD_SCAN_INFECTED_CODES') or (1,)):
+        return {'outcome': 'quarantine', 'error': report or 'Rejected by the scanner'}
+    raise RuntimeError(f"Scanner exited with {result.returncode}: {report}")
+
+def thumbnail(path, info, options):
+    """A JPEG preview of an image. Returns {'outcome': 'ok', 'thumbnail': jpeg bytes}; the caller stores it."""
+    size = options.get('UPLOAD_THUMBNAIL_SIZE') or 256
+    output = io.BytesIO()
+    with Image.open(path) as image:
+        image.thumbnail((size, size))
+        image.convert('RGB').save(output, 'JPEG', quality=80)
+    return {'outcome': 'ok', 'thumbnail': output.getvalue()}
+
+BUILTIN_STEPS = {'scan': scan, 'thumbnail': thumbnail}
+
+def _resolve(name):
+    if name in BUILTIN_STEPS:
+        return BUILTIN_STEPS[name]
+    module, _, function = name.partition(':')
+    return getattr(importlib.import_module(module), function)
+
+def process_file(path, info, steps, options):
+    """
+    Runs `steps` on one file, stopping at the first quarantine or error.
+    Returns [(step, outcome, result)]. Safe to run in another process.
+    """
+    done = []
+    for step in steps:
+        started = time.perf_counter()
+        try:
+            result = _resolve(step)(path, info, options) or {'outcome': 'ok'}
+        except Exception as e:
+            result = {'outcome': 'error', 'error': f"{step}: {e}"[:500]}
+        result['seconds'] = time.perf_counter() - started
+        done.append((step, result['outcome'], result))
+        if result['outcome'] != 'ok':
+            break
+    return done
+
+# --- Running the pipeline ------------------------------------------------------
+
+def file_steps(config, mime_type):
+    """The steps of `UPLOAD_PROCESSORS` that apply to a file of `mime_type` (text extraction aside)."""
+    steps = []
+    for step in config.get('UPLOAD_PROCESSORS', ()):
+        if step == 'extract_text':
+            continue
+        if step == 'scan' and not config.get('UPLOAD_SCAN_COMMAND'):
+            continue
+        if step == 'thumbnail' and (Image is None or not (mime_type or '').startswith('image/')):
+            continue
+        steps.append(step)
+    return steps
+
+def initial_status(config, mime_type):
+    return 'pending' if file_steps(config, mime_type) else 'ready'
+
+def blocked_reason(document, config):
+    """Why the document's file may not be served (None when it may)."""
+    if document.processing_status == 'quarantined':
+        return 'Document was quarantined by the scanner'
+    if document.processing_status != 'ready' and config.get('UPLOAD_SCAN_COMMAND'):
+        return 'Document has not been scanned yet'
+    return None
+
+def _apply(storage, file_path, documents, done):
+    if done is None:
+        done = [('read', 'error', {'error': 'File not found', 'seconds': 0})]
+    _, outcome, result = done[-1] if done else (None, 'ok', {})
+    status = {'ok': 'ready', 'quarantine': 'quarantined'}.get(outcome, 'failed')
+    thumbnails = [r['thumbnail'] for _, _, r in done if r.get('thumbnail')]
+    thumbnail_path = None
+    if thumbnails and status == 'ready':
+        thumbnail_path = f"{THUMBNAIL_DIR}/{file_path}.jpg"
+        storage.put(thumbnail_path, [thumbnails[-1]])
+    for document in documents:
+        document.processing_status = status
+        document.processing_error = result.get('error') if status != 'ready' else None
+        if thumbnail_path:
+            document.thumbnail_path = thumbnail_path
+    for step, step_outcome, step_result in done:
+        PROCESSING_STEPS.inc((step, step_outcome))
+        PROCESSING_SECONDS.observe((step,), step_result['seconds'])
+    return status
+
+def run_processing(document_ids=None, pool=None, batch_size=50, retry_failed=False):
+    """
+    Runs the file steps for pending documents (only `document_ids` when
+    given), then text extraction for the ones that came out ready.
+    Returns (counts by processing status, counts by extraction status).
+    """
+    config = current_app.config
+    storage = get_storage()
+    statuses = ('pending', 'failed') if retry_failed else ('pending',)
+    query = Document.query.filter(Document.processing_status.in_(statuses))
+    if document_ids is not None:
+        query = query.filter(Document.id.in_(document_ids))
+    by_path = {}
+    for document in query.order_by(Document.id):
+        by_path.setdefault(document.file_path, []).append(document)
+
+    options = {key: config.get(key) for key in OPTION_KEYS}
+    jobs = []
+    for file_path, documents in by_path.items():
+        first = documents[0]
+        info = {'file_path': file_path, 'mime_type': first.mime_type, 'category': first.category}
+        jobs.append((file_path, (info, file_steps(config, first.mime_type), options)))
+
+    counts = {}
+    outcomes = run_on_local_copies(storage, jobs, process_file, pool, window=batch_size)
+    for done_files, (file_path, done) in enumerate(outcomes, 1):
+        status = _apply(storage, file_path, by_path[file_path], done)
+        counts[status] = counts.get(status, 0) + 1
+        if done_files % batch_size == 0:
+            db.session.commit()
+    db.session.commit()
+
+    texts = {}
+    if 'extract_text' in config.get('UPLOAD_PROCESSORS', ()):
+        texts = run_extraction(document_ids, pool=pool, batch_size=batch_size)
+    return counts, texts
+
+def make_pool(config):
+    workers = config.get('UPLOAD_PROCESSING_WORKERS', 2)
+    if not workers:
+        return None
+    # spawn: forking a process that runs request threads is not safe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+# --- Background processing of new uploads -------------------------------------
+
+class ProcessingWorker:
+    """A daemon thread that processes the documents handed to `submit()`."""
+    def __init__(self, app, batch_size=50):
+        self.app = app
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self._thread = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, document_ids):
+        with self._lock:
+            if self._thread is None:
+                self._pool = make_pool(self.app.config)
+                self._thread = threading.Thread(target=self._run, name='upload-processing', daemon=True)
+                self._thread.start()
+        for doc_id in document_ids:
+            self.queue.put(doc_id)
+
+    def _run(self):
+        while True:
+            ids = [self.queue.get()]
+            while len(ids) < self.batch_size:
+                try:
+                    ids.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    run_processing(ids, pool=self._pool, batch_size=self.batch_size)
+            except Exception:
+                logger.exception("Processing failed for documents %s", ids)
+
+def _queue_size():
+    worker = current_app.extensions.get('upload_processing') if has_app_context() else None
+    return worker.queue.qsize() if worker is not None else 0
+
+def enqueue_processing(document_ids):
+    """
+    Queues processing for documents the caller has just committed. Inside a
+    batch, where commits are deferred, they are queued when the batch
+    commits. No-op when background processing is off.
+    """
+    worker = current_app.extensions.get('upload_processing')
+    if worker is None or not document_ids:
+        return
+    if db.session.info.get('deferred_commits'):
+        db.session.info.setdefault('upload_processing', []).extend(document_ids)
+    else:
+        worker.submit(document_ids)
+
+def _after_commit(session):
+    ids = session.info.pop('upload_processing', None)
+    worker = current_app.extensions.get('upload_processing') if has_app_context() else None
+    if ids and worker is not None:
+        worker.submit(ids)
+
+def _after_rollback(session):
+    session.info.pop('upload_processing', None)
+
+def init_processing(app):
+    """Starts background processing of uploads (lazily, on the first upload) and its metrics."""
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+    if app.config.get('UPLOAD_PROCESSING_BACKGROUND', True):
+        worker = ProcessingWorker(app, batch_size=app.config.get('UPLOAD_PROCESSING_BATCH_SIZE', 50))
+        app.extensions['upload_processing'] = worker
+    REGISTRY.register(Gauge('crm_upload_processing_queue', 'Documents waiting for post-upload processing',
+                            _queue_size))
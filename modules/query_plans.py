@@ -0,0 +1,260 @@
+"""
+Query plan checks for the hot endpoints.
+
+`profile_endpoints` calls each endpoint with the test client and records
+the SQL it runs. `explain` then asks the database how it would run each
+statement (`EXPLAIN QUERY PLAN` on SQLite, `EXPLAIN (FORMAT JSON)` on
+PostgreSQL). A table read in full, with no index, is reported together
+with an index that would serve the statement's filters and joins. So is a
+SQLite search that only narrows to the organization while the statement
+filters on other columns too: with one district, that is the whole table.
+Sorts done without an index are listed as notes.
+
+Plans depend on the data, so run it against a large generated dataset:
+
+    python manage.py generate --cases 100000
+    python manage.py explain            # --fail-on-scan exits 1 on any full scan
+
+tests/test_query_plans.py runs the same check against a small dataset and
+fails when a hot query stops using an index. Without statistics SQLite
+uses any index that fits, so that test catches missing and unusable
+indexes; whether the planner still picks them on real data is for the
+command above.
+
+Suggestions are heuristics read from the SQL text: equality columns first,
+then one range column, and the organization column only when nothing else
+is filtered. Filters on `تاریخ_بایگانی IS NULL` become a partial
+index over live rows, like the existing ones in modules/models.py.
+"""
+import json
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+from modules.db import db
+
+# (method, path, JSON body). Placeholders are filled from the data by sample_values()
+HOT_ENDPOINTS = [
+    ('GET', '/api/cases/?view=summary&limit=50', None),
+    ('GET', '/api/cases/?search={national_id}&limit=50', None),
+    ('GET', '/api/cases/{case_id}', None),
+    ('GET', '/api/cases/{case_id}/documents.zip', None),
+    ('GET', '/api/contracts/{contract_id}', None),
+    ('GET', '/api/invoices/reports/financial', None),
+    ('GET', '/api/documents/{document_id}', None),
+    ('GET', '/api/documents/search?q=deed', None),
+    ('GET', '/api/changes?since={audit_id}&limit=100', None),
+    ('GET', '/api/changes?since=0&case_id={case_id}&limit=100', None),
+    ('GET', '/api/sync/snapshot?limit=50', None),
+    ('GET', '/api/sync/changes?since={audit_id}&cases={case_id}', None),
+]
+
+# Endpoints that write: only for scratch databases (manage.py explain --writes, the test)
+HOT_WRITE_ENDPOINTS = [
+    ('POST', '/api/invoices/generate', None),
+    ('POST', '/api/cases/transfer-owner', {'case_ids': ['{case_id}'], 'کد_ملی': '{national_id}',
+                                           'start_date': '1403/01/01'}),
+]
+
+EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE)\b', re.IGNORECASE)
+# "SCAN t" reads the whole table; "SCAN t USING INDEX i" with no search terms reads all of i
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?(?: USING (?:COVERING )?INDEX \S+)?$')
+# A search that only narrows to the organization still reads all of the organization's rows
+SQLITE_ORGANIZATION_SEARCH = re.compile(r'^SEARCH (\w+)(?: AS (\w+))? USING (?:COVERING )?INDEX \S+ \(([^=]+)=\?\)$')
+SQLITE_SORT = re.compile(r'^USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')
+ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?\s+AS\s+"?(\w+)"?', re.IGNORECASE)
+JOIN_CONDITION = re.compile(r'"?(\w+)"?\."([^"]+)"\s*=\s*"?(\w+)"?\."([^"]+)"')
+OPERATOR = r'\s*(=|>=|<=|<>|!=|<|>|IN\b|IS NOT\b|IS\b|BETWEEN\b|LIKE\b)'
+PREDICATE = re.compile(r'"?(\w+)"?\."([^"]+)"' + OPERATOR, re.IGNORECASE)
+# "? = t.c", as SQLAlchemy writes the lazy loads of relationships
+REVERSED_PREDICATE = re.compile(r'\?\s*(=|>=|<=|<|>)\s*"?(\w+)"?\."([^"]+)"')
+UNQUALIFIED_PREDICATE = re.compile(r'(?<![.\w"])"([^"]+)"' + OPERATOR, re.IGNORECASE)
+NO_ROWS = re.compile(r'\sWHERE 0\s*$')
+WHERE = re.compile(r'\sWHERE\s', re.IGNORECASE)
+LIVE_COLUMN = 'تاریخ_بایگانی'
+ORGANIZATION_COLUMN = 'شناسه_سازمان'
+
+class Finding:
+    """A full scan (kind 'scan') or a sort without an index ('sort') in a statement's plan."""
+    def __init__(self, kind, table, detail, statement, plan, endpoints, suggestion=None):
+        self.kind = kind
+        self.table = table
+        self.detail = detail
+        self.statement = statement
+        self.plan = plan
+        self.endpoints = endpoints
+        self.suggestion = suggestion
+
+    def __repr__(self):
+        return f'<Finding {self.kind} {self.table} {self.endpoints}>'
+
+@contextmanager
+def capture_queries(engine=None):
+    """Collects (statement, parameters) of every statement `engine` runs inside the block."""
+    engine = engine or db.engine
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def explain(statement, parameters=(), engine=None):
+    """The plan of one statement: SQLite's plan lines, or PostgreSQL's plan nodes (dicts)."""
+    engine = engine or db.engine
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            result = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+            document = result.scalar()
+            return _nodes((json.loads(document) if isinstance(document, str) else document)[0]['Plan'])
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+def _nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _nodes(child)
+
+def _describe(step):
+    if isinstance(step, str):
+        return step
+    target = step.get('Relation Name') or ', '.join(step.get('Sort Key', []))
+    return f"{step['Node Type']} {target}".strip()
+
+def full_scans(plan, statement=None):
+    """(table, alias, plan line) of each table `plan` reads in full, with no index.
+
+    With the `statement`, a SQLite search that only narrows to the organization
+    counts too when the statement filters the table on more columns.
+    """
+    scans = []
+    for step in plan:
+        if isinstance(step, dict):
+            if step.get('Node Type') == 'Seq Scan':
+                scans.append((step['Relation Name'], step.get('Alias'), _describe(step)))
+            continue
+        match = SQLITE_SCAN.match(step)
+        if match and match.group(1) in db.metadata.tables:
+            scans.append((match.group(1), match.group(2), step))
+        match = SQLITE_ORGANIZATION_SEARCH.match(step)
+        if match and statement and match.group(3) == ORGANIZATION_COLUMN:
+            columns, _ = index_columns(statement, match.group(1), match.group(2))
+            if set(columns) - {ORGANIZATION_COLUMN}:
+                scans.append((match.group(1), match.group(2), step))
+    return scans
+
+def temp_sorts(plan):
+    """The sorts `plan` does in a temporary structure because no index has the rows in order."""
+    return [_describe(step) for step in plan
+            if (SQLITE_SORT.match(step) if isinstance(step, str) else step.get('Node Type') == 'Sort')]
+
+def index_columns(statement, table, alias=None):
+    """([columns], live only) of an index for the filters and joins of `statement` on `table`."""
+    names = {alias or table, table}
+    names.update(a for t, a in ALIAS.findall(statement) if t == table and alias is None)
+    where = WHERE.split(statement, 1)[1] if WHERE.search(statement) else ''
+    equal, ranges, live = [], [], False
+
+    def add(columns, column):
+        if column not in equal and column not in ranges:
+            columns.append(column)
+
+    for left, left_column, right, right_column in JOIN_CONDITION.findall(statement):
+        # The side of a join condition on the scanned table is looked up by the other side's value
+        if left in names and right not in names:
+            add(equal, left_column)
+        elif right in names and left not in names:
+            add(equal, right_column)
+    table_columns = {c.name for c in db.metadata.tables[table].columns} if table in db.metadata.tables else set()
+    predicates = PREDICATE.findall(where)
+    predicates += [(name, column, operator) for operator, name, column in REVERSED_PREDICATE.findall(where)]
+    # Unqualified columns, as in hand-written SQL, belong to the table when it has them
+    predicates += [(table, column, operator) for column, operator in UNQUALIFIED_PREDICATE.findall(where)
+                   if column in table_columns]
+    for name, column, operator in predicates:
+        if name not in names:
+            continue
+        operator = operator.upper().strip()
+        if column == LIVE_COLUMN and operator == 'IS':
+            live = True
+        elif operator in ('=', 'IN', 'IS'):
+            add(equal, column)
+        elif operator in ('>', '<', '>=', '<=', 'BETWEEN'):
+            add(ranges, column)
+    # Primary keys and LIKE '%...%' filters do not need an index
+    primary_keys = {c.name for c in db.metadata.tables[table].primary_key} if table in db.metadata.tables else set()
+    columns = [c for c in equal if c not in primary_keys] + [c for c in ranges if c not in primary_keys][:1]
+    return columns, live
+
+def suggest_index(statement, table, alias=None):
+    """A CREATE INDEX for the columns `statement` filters or joins `table` on, or None."""
+    columns, live = index_columns(statement, table, alias)
+    # Every tenant query filters on the organization. Without statistics SQLite takes an index led by it for
+    # lookups on other columns too, so it only leads when nothing else is filtered
+    if len(columns) > 1 and ORGANIZATION_COLUMN in columns:
+        columns.remove(ORGANIZATION_COLUMN)
+    if not columns:
+        return None
+    name = f"ix_{table}_{'live_' if live else ''}{'_'.join(columns)}"
+    ddl = f'CREATE INDEX "{name}" ON {table} ({", ".join(f"{chr(34)}{c}{chr(34)}" for c in columns)})'
+    return ddl + (f' WHERE "{LIVE_COLUMN}" IS NULL' if live else '')
+
+def sample_values():
+    """Ids and keys of real rows, to fill the endpoint placeholders."""
+    from modules.models import Case, Person, Ownership, Document, LeaseContract, AuditLog
+    ownership = Ownership.query.filter_by(is_current=True).order_by(Ownership.id.desc()).first()
+    person = db.session.get(Person, ownership.person_id) if ownership else Person.query.first()
+    return {
+        'case_id': ownership.case_id if ownership else (db.session.query(db.func.max(Case.id)).scalar() or 1),
+        'national_id': person.national_id if person else '0000000000',
+        'contract_id': db.session.query(db.func.max(LeaseContract.id)).scalar() or 1,
+        'document_id': db.session.query(db.func.max(Document.id)).scalar() or 1,
+        # Near the end of the feed, like a client that is up to date
+        'audit_id': max((db.session.query(db.func.max(AuditLog.id)).scalar() or 0) - 100, 0),
+    }
+
+def _fill(value, values):
+    if isinstance(value, dict):
+        return {k: _fill(v, values) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, values) for v in value]
+    return value.format(**values) if isinstance(value, str) else value
+
+def profile_endpoints(app, endpoints=HOT_ENDPOINTS, headers=None):
+    """Calls each endpoint and returns {(method, path): (status code, [(statement, parameters)])}.
+
+    Needs an app context.
+    """
+    values = sample_values()
+    client = app.test_client()
+    profiles = {}
+    for method, path, body in endpoints:
+        with capture_queries() as captured:
+            response = client.open(_fill(path, values), method=method, json=_fill(body, values), headers=headers)
+            response.get_data()
+            response.close()
+        profiles[(method, path)] = (response.status_code, captured)
+    return profiles
+
+def analyze(profiles, engine=None):
+    """Explains every distinct statement of `profiles` and returns its full scans and sorts as Findings."""
+    statements = {}
+    for endpoint, (_, captured) in profiles.items():
+        for statement, parameters in captured:
+            # NO_ROWS: the write lock of modules/db.py, which matches nothing
+            if EXPLAINABLE.match(statement) and not NO_ROWS.search(statement):
+                statements.setdefault(statement, (parameters, []))[1].append(endpoint)
+
+    findings = []
+    for statement, (parameters, endpoints) in statements.items():
+        plan = list(explain(statement, parameters, engine))
+        endpoints = sorted(set(endpoints))
+        for table, alias, step in full_scans(plan, statement):
+            findings.append(Finding('scan', table, step, statement, plan, endpoints,
+                                    suggest_index(statement, table, alias)))
+        for step in temp_sorts(plan):
+            findings.append(Finding('sort', None, step, statement, plan, endpoints))
+    return findings
@@ -0,0 +1,79 @@
+"""
+Token-bucket rate limiting.
+
+Each bucket holds up to `burst` tokens and refills at `rate` tokens per
+second; a request takes one token or is refused with the time until the next
+one. Buckets live in process memory by default, where idle ones are dropped
+once they have refilled. `SQLiteBuckets` keeps them in
+a local SQLite file instead, so all workers on a host share one budget per
+client.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+def _refill(tokens, updated, rate, burst, now):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+def _decide(tokens, rate):
+    """Returns (allowed, tokens left, seconds until a token is available)."""
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, math.ceil((1 - tokens) / rate) if rate > 0 else 60
+
+class MemoryBuckets:
+    SWEEP_INTERVAL = 60  # seconds between passes dropping idle buckets
+
+    def __init__(self):
+        self._state = {}  # key -> (tokens, updated, rate, burst)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, now):
+        # A full bucket is the same as a missing one, so dropping it loses nothing
+        self._state = {key: state for key, state in self._state.items()
+                       if _refill(*state, now) < state[3]}
+        self._last_sweep = now
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self.SWEEP_INTERVAL:
+                self._sweep(now)
+            tokens, updated, _, _ = self._state.get(key, (burst, now, rate, burst))
+            allowed, tokens, retry_after = _decide(_refill(tokens, updated, rate, burst, now), rate)
+            self._state[key] = (tokens, now, rate, burst)
+        return allowed, retry_after
+
+class SQLiteBuckets:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        conn = self._conn()
+        now = time.time()  # wall clock: shared between processes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = _refill(*row, rate, burst, now) if row else burst
+            allowed, tokens, retry_after = _decide(tokens, rate)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
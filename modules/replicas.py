@@ -0,0 +1,179 @@
+"""
+Read replicas for reporting and listing endpoints.
+
+Each URL in `READ_REPLICA_URLS` becomes a Flask-SQLAlchemy bind
+(`replica_0`, `replica_1`...). Views decorated with `@replica_reads`
+(reports, lists, searches, exports) run their SELECTs on one healthy
+replica, picked once per request. Everything else stays on the primary:
+other views, flushes, DML, `FOR UPDATE` reads and raw SQL. A replica view
+that writes reads the rest of its data from the primary too
+(`RoutingSession` in modules/db.py).
+
+Read-your-writes: a response to a request that committed a write sets a
+cookie for `READ_YOUR_WRITES_SECONDS`. While it lasts, that client's
+replica views read from the primary, so a list fetched right after a save
+shows the save even when the replicas are behind.
+
+Fallback: each replica is checked at most every `REPLICA_CHECK_INTERVAL`
+seconds. A replica that does not answer, or that is more than
+`REPLICA_MAX_LAG` seconds behind, is skipped until the next check. On
+PostgreSQL the lag comes from the WAL replay position. `REPLICA_LAG_QUERY`
+replaces that, e.g. a query over a heartbeat table. Other databases count
+as current. When a query fails on a replica, the view is run again on
+the primary, and the replica is checked again right away.
+
+To try it locally, point `READ_REPLICA_URLS` at a second SQLite file
+(`sqlite3 crm.db ".backup replica.db"`) or at a second PostgreSQL instance
+streaming from the first.
+"""
+import logging
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from modules.db import db
+from modules.metrics import REGISTRY, Counter
+
+READ_YOUR_WRITES_COOKIE = 'crm_primary_until'
+
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+REPLICA_ROUTING = REGISTRY.register(Counter(
+    'crm_replica_routing_total', 'Replica-eligible requests by where their reads went', ('target',)))
+
+logger = logging.getLogger(__name__)
+
+def replica_lag(engine, query=None):
+    """Seconds `engine` is behind its primary (0 when the database cannot tell). Raises when it does not answer."""
+    with engine.connect() as conn:
+        if query:
+            return float(conn.execute(text(query)).scalar() or 0)
+        if engine.dialect.name == 'postgresql':
+            return float(conn.execute(POSTGRES_LAG).scalar() or 0)
+        conn.execute(text('SELECT 1'))
+        return 0.0
+
+class ReplicaRouter:
+    """Picks a replica bind for a request, skipping replicas that are down or lagging."""
+    def __init__(self, keys, max_lag=5.0, check_interval=5.0, lag_query=None):
+        self.keys = list(keys)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag_query = lag_query
+        self._status = {}  # key: (checked at, healthy)
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        try:
+            lag = replica_lag(db.engines[key], self.lag_query)
+            healthy = lag <= self.max_lag
+            if not healthy:
+                logger.warning("Replica %s is %.1f s behind, reading from the primary", key, lag)
+        except SQLAlchemyError as e:
+            logger.warning("Replica %s is unavailable: %s", key, e)
+            healthy = False
+        with self._lock:
+            self._status[key] = (time.monotonic(), healthy)
+        return healthy
+
+    def healthy(self, key):
+        checked, healthy = self._status.get(key, (None, False))
+        if checked is None or time.monotonic() - checked >= self.check_interval:
+            return self.check(key)
+        return healthy
+
+    def choose(self):
+        """A healthy replica's bind key, or None to use the primary."""
+        healthy = [key for key in self.keys if self.healthy(key)]
+        return random.choice(healthy) if healthy else None
+
+def _wants_primary():
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def replica_reads(view):
+    """Runs the view's reads on a read replica when one is configured and healthy."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get('replicas')
+        if router is None:
+            return view(*args, **kwargs)
+        session = db.session()
+        # Batched calls share one transaction and must see each other's writes
+        on_primary = _wants_primary() or session.info.get('deferred_commits')
+        key = None if on_primary else router.choose()
+        if key is None:
+            REPLICA_ROUTING.inc(('primary',))
+            return view(*args, **kwargs)
+
+        session.info['read_replica'] = key
+        try:
+            response = view(*args, **kwargs)
+            REPLICA_ROUTING.inc(('replica',))
+            return response
+        except DBAPIError as e:
+            # The view only reads, so it can run again on the primary; a replica that no longer answers is skipped
+            logger.warning("Query on replica %s failed, retrying on the primary: %s", key, e)
+            router.check(key)
+            REPLICA_ROUTING.inc(('fallback',))
+            session.rollback()
+            session.info.pop('read_replica', None)
+            return view(*args, **kwargs)
+        finally:
+            session.info.pop('read_replica', None)
+    return wrapper
+
+def _after_flush(session, flush_context):
+    session.info['replica_wrote'] = True
+
+def _after_commit(session):
+    if session.info.pop('replica_wrote', False) and has_request_context():
+        g.committed_writes = True
+
+def _after_rollback(session):
+    session.info.pop('replica_wrote', None)
+
+def _remember_writes(response):
+    seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+    if seconds and g.get('committed_writes'):
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, str(int(time.time() + seconds)), max_age=seconds,
+                            httponly=True, samesite='Lax')
+    return response
+
+def configure_binds(app):
+    """Adds a bind per `READ_REPLICA_URLS` entry. Runs before `db.init_app`, which creates the engines."""
+    urls = app.config.get('READ_REPLICA_URLS') or []
+    if not urls:
+        return []
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    keys = []
+    for i, url in enumerate(urls):
+        keys.append(f'replica_{i}')
+        binds[keys[-1]] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    return keys
+
+def init_replicas(app, keys):
+    """Routes `@replica_reads` views to the replica binds `keys` (no-op without replicas)."""
+    if not keys:
+        return
+    for key in keys:
+        # db.init_app gives every bind its own (empty) metadata; replicas mirror the primary's tables instead,
+        # and db.create_all() must never touch them
+        db.metadatas.pop(key, None)
+    app.extensions['replicas'] = ReplicaRouter(
+        keys, max_lag=app.config.get('REPLICA_MAX_LAG', 5), check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 5),
+        lag_query=app.config.get('REPLICA_LAG_QUERY'))
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+    app.after_request(_remember_writes)
@@ -1,7 +1,8 @@
 from modules.db import ma
 from modules.models import Case, Person, Ownership, Document, AuditLog, LeaseContract, Invoice
 from marshmallow import fields, pre_load, post_dump
-from modules.utils import gregorian_to_jalali, jalali_to_gregorian, gregorian_datetime_to_jalali_str
+from modules.metrics import serialization_timer
+from modules.utils import gregorian_to_jalali, jalali_to_gregorian, gregorian_datetime_to_jalali_str, to_rials
 from datetime import datetime
 
 class JalaliDateField(fields.Field):
@@ -16,7 +17,49 @@ class JalaliDateField(fields.Field):
             return None
         return jalali_to_gregorian(value)
 
-class PersonSchema(ma.SQLAlchemyAutoSchema):
+class MoneyField(fields.Field):
+    """Custom field for amounts stored as whole Rials."""
+    default_error_messages = {'invalid': 'Not a valid amount.'}
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        return int(value)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, bool):
+            raise self.make_error('invalid')
+        amount = to_rials(value)
+        if amount is None:
+            raise self.make_error('invalid')
+        return amount
+
+class BaseSchema(ma.SQLAlchemyAutoSchema):
+    """Base for all schemas; dump time is reported as request serialization time."""
+    # Tenanted models: the organization comes from the request (modules/tenancy.py), never from the payload
+    organization_id = fields.Int(data_key='شناسه_سازمان', dump_only=True)
+
+    @pre_load
+    def drop_organization(self, data, **kwargs):
+        """Payloads sent back as they were read carry the organization; it is not the client's to change."""
+        if isinstance(data, dict) and 'شناسه_سازمان' in data:
+            data = {k: v for k, v in data.items() if k != 'شناسه_سازمان'}
+        return data
+
+    def dump(self, obj, *, many=None):
+        with serialization_timer():
+            return super().dump(obj, many=many)
+
+class VersionedSchema(BaseSchema):
+    """Adds the row version and change time of `Versioned` models (read-only)."""
+    version = fields.Int(data_key='نسخه', dump_only=True)
+    updated_at = fields.DateTime(data_key='تاریخ_به_روزرسانی', dump_only=True)
+
+class ArchivableSchema(VersionedSchema):
+    """Adds the archive time of `Archivable` models (read-only, null for live rows)."""
+    archived_at = fields.DateTime(data_key='تاریخ_بایگانی', dump_only=True)
+
+class PersonSchema(VersionedSchema):
     class Meta:
         model = Person
         load_instance = True
@@ -28,7 +71,7 @@ class PersonSchema(ma.SQLAlchemyAutoSchema):
     phone = fields.Str(data_key='تلفن_همراه', allow_none=True)
     alt_phone = fields.Str(data_key='تلفن_ثابت', allow_none=True)
 
-class OwnershipSchema(ma.SQLAlchemyAutoSchema):
+class OwnershipSchema(ArchivableSchema):
     class Meta:
         model = Ownership
         load_instance = True
@@ -48,7 +91,7 @@ class OwnershipSchema(ma.SQLAlchemyAutoSchema):
 
     person = fields.Nested(PersonSchema, dump_only=True, data_key='مالک')
 
-class DocumentSchema(ma.SQLAlchemyAutoSchema):
+class DocumentSchema(ArchivableSchema):
     class Meta:
         model = Document
         load_instance = True
@@ -63,11 +106,17 @@ class DocumentSchema(ma.SQLAlchemyAutoSchema):
     created_at = fields.DateTime(data_key='تاریخ_ثبت')
     created_at_shamsi = fields.Method("get_created_at_shamsi", data_key='تاریخ_ثبت_شمسی')
     document_date = JalaliDateField(data_key='تاریخ_سند', allow_none=True)
+    file_size = fields.Int(data_key='حجم_فایل', dump_only=True)
+    checksum = fields.Str(data_key='هش_فایل', dump_only=True)
+    mime_type = fields.Str(data_key='نوع_فایل', dump_only=True)
+    processing_status = fields.Str(data_key='وضعیت_پردازش', dump_only=True)
+    processing_error = fields.Str(data_key='خطای_پردازش', dump_only=True)
+    thumbnail_path = fields.Str(data_key='مسیر_تصویر_کوچک', dump_only=True)
 
     def get_created_at_shamsi(self, obj):
         return gregorian_datetime_to_jalali_str(obj.created_at)
 
-class CaseSchema(ma.SQLAlchemyAutoSchema):
+class CaseSchema(ArchivableSchema):
     class Meta:
         model = Case
         load_instance = True
@@ -87,7 +136,7 @@ class CaseSchema(ma.SQLAlchemyAutoSchema):
     children = fields.Nested('CaseSchema', many=True, dump_only=True, data_key='زیر_پرونده_ها')
     contracts = fields.Nested('LeaseContractSchema', many=True, dump_only=True, data_key='قراردادها')
 
-class AuditLogSchema(ma.SQLAlchemyAutoSchema):
+class AuditLogSchema(BaseSchema):
     class Meta:
         model = AuditLog
         load_instance = True
@@ -99,8 +148,9 @@ class AuditLogSchema(ma.SQLAlchemyAutoSchema):
     target_id = fields.Int(data_key='شناسه_هدف')
     timestamp = fields.DateTime(data_key='زمان')
     details = fields.Str(data_key='جزئیات')
+    case_id = fields.Int(data_key='شناسه_پرونده', allow_none=True)
 
-class InvoiceSchema(ma.SQLAlchemyAutoSchema):
+class InvoiceSchema(ArchivableSchema):
     class Meta:
         model = Invoice
         load_instance = True
@@ -109,12 +159,12 @@ class InvoiceSchema(ma.SQLAlchemyAutoSchema):
     id = fields.Int(data_key='شناسه')
     contract_id = fields.Int(data_key='شناسه_قرارداد')
     invoice_number = fields.Str(data_key='شماره_صورتحساب')
-    amount = fields.Float(data_key='مبلغ')
+    amount = MoneyField(data_key='مبلغ')
     due_date = JalaliDateField(data_key='تاریخ_سررسید')
     status = fields.Str(data_key='وضعیت')
     created_at = fields.DateTime(data_key='تاریخ_صدور')
 
-class LeaseContractSchema(ma.SQLAlchemyAutoSchema):
+class LeaseContractSchema(ArchivableSchema):
     class Meta:
         model = LeaseContract
         load_instance = True
@@ -125,7 +175,7 @@ class LeaseContractSchema(ma.SQLAlchemyAutoSchema):
     tenant_id = fields.Int(data_key='شناسه_مستاجر')
     start_date = JalaliDateField(data_key='تاریخ_شروع')
     end_date = JalaliDateField(data_key='تاریخ_پایان')
-    base_rent = fields.Float(data_key='مبلغ_اجاره_پایه')
+    base_rent = MoneyField(data_key='مبلغ_اجاره_پایه')
     payment_period = fields.Str(data_key='دوره_پرداخت')
     annual_increase_percent = fields.Float(data_key='درصد_افزایش_سالانه')
 
@@ -0,0 +1,330 @@
+"""
+Where document files live.
+
+Code that reads or writes uploaded files goes through the app's storage
+(`get_storage()`) instead of joining paths under `UPLOAD_FOLDER`. Keys are
+the relative names stored in `مسیر_فایل`. There are two drivers:
+
+- `local` (default): files under `UPLOAD_FOLDER`, as before.
+- `s3`: an S3-compatible bucket (AWS, MinIO, Ceph...). Needs the optional
+  `boto3` package. Several web nodes can share it without NFS. Downloads
+  are redirected to short-lived presigned URLs, so the bytes never pass
+  through a Flask worker (`STORAGE_REDIRECT_DOWNLOADS`).
+
+Steps that need a real file on disk (scanner, parsers) use `local_copies()`.
+With the local driver that is the file itself. Otherwise it is a temp copy
+that lasts as long as the `with` block.
+"""
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import current_app, request, redirect, send_from_directory, Response
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+CHUNK_SIZE = 256 * 1024
+
+class StorageError(Exception):
+    pass
+
+class Storage(ABC):
+    """put/get/stream/range/delete/exists over keys; drivers implement put, stat, stream, delete and _claim."""
+    local = False
+
+    @abstractmethod
+    def put(self, key, chunks):
+        """Stores the bytes yielded by `chunks`. If `chunks` raises, nothing is kept and the error propagates."""
+
+    @abstractmethod
+    def _claim(self, key):
+        """Atomically takes `key` for a new file; False when it is already taken."""
+
+    def reserve(self, key):
+        """Returns a key like `key` that no other file has, adding _1, _2... before the extension."""
+        base, extension = os.path.splitext(key)
+        counter = 1
+        while not self._claim(key):
+            key = f"{base}_{counter}{extension}"
+            counter += 1
+        return key
+
+    @abstractmethod
+    def stat(self, key):
+        """(size, modified datetime in UTC, version tag) or None when the key does not exist."""
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def stream(self, key, start=0, end=None, chunk_size=CHUNK_SIZE):
+        """Yields the bytes from `start` up to (not including) `end`."""
+
+    def get(self, key):
+        return b''.join(self.stream(key))
+
+    def range(self, key, start, end):
+        return b''.join(self.stream(key, start, end))
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes the file; a key that does not exist is not an error."""
+
+    def url(self, key, download_name=None, mimetype=None, expires=300):
+        """A URL the client can fetch the file from directly, or None when the driver has none."""
+        return None
+
+    def fingerprint(self, key):
+        """Changes whenever the file's content is replaced (None when it does not exist)."""
+        stat = self.stat(key)
+        return f"{stat[0]}:{stat[2]}" if stat else None
+
+    @contextmanager
+    def local_copies(self, keys):
+        """{key: path of a readable local file} for the keys that exist, valid inside the block."""
+        directory = tempfile.mkdtemp(prefix='crm-storage-')
+        paths = {}
+        try:
+            for i, key in enumerate(keys):
+                path = os.path.join(directory, f"{i}{os.path.splitext(key)[1]}")
+                try:
+                    with open(path, 'wb') as f:
+                        for chunk in self.stream(key):
+                            f.write(chunk)
+                except StorageError:
+                    continue
+                paths[key] = path
+            yield paths
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+class LocalStorage(Storage):
+    local = True
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise StorageError(f"Invalid key {key!r}")
+        return path
+
+    def _claim(self, key):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # O_EXCL: concurrent uploads never pick the same name
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    def put(self, key, chunks):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path, 'wb') as target:
+                for chunk in chunks:
+                    target.write(chunk)
+        except BaseException:
+            self.delete(key)
+            raise
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.path(key))
+        except OSError:
+            return None
+        return st.st_size, datetime.fromtimestamp(st.st_mtime, timezone.utc), str(st.st_mtime_ns)
+
+    def stream(self, key, start=0, end=None, chunk_size=CHUNK_SIZE):
+        try:
+            source = open(self.path(key), 'rb')
+        except OSError as e:
+            raise StorageError(str(e)) from e
+        with source:
+            source.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = source.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    @contextmanager
+    def local_copies(self, keys):
+        yield {key: self.path(key) for key in keys if os.path.exists(self.path(key))}
+
+class _ChunkReader:
+    """A read()-able file over an iterator of chunks, for boto3's streaming upload."""
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+class S3Storage(Storage):
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise StorageError("STORAGE_BACKEND='s3' needs the boto3 package")
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def _claim(self, key):
+        # No atomic create-if-absent across all S3 implementations; upload names carry a timestamp
+        return not self.exists(key)
+
+    def put(self, key, chunks):
+        # Multipart upload for large files; boto3 aborts it if reading `chunks` fails
+        self.client.upload_fileobj(_ChunkReader(chunks), self.bucket, self._key(key))
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return head['ContentLength'], head['LastModified'], head['ETag'].strip('"')
+
+    def stream(self, key, start=0, end=None, chunk_size=CHUNK_SIZE):
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)['Body']
+        except ClientError as e:
+            raise StorageError(str(e)) from e
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def url(self, key, download_name=None, mimetype=None, expires=300):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = content_disposition(download_name)
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+def run_on_local_copies(storage, jobs, function, pool=None, window=50):
+    """
+    Calls `function(path, *args)` for each `(key, args)` of `jobs` on a local
+    copy of the file, in `pool` when given, `window` files at a time. Yields
+    (key, result) in job order; the result is None when the file is missing.
+    """
+    jobs = list(jobs)
+    for i in range(0, len(jobs), window):
+        part = jobs[i:i + window]
+        with storage.local_copies([key for key, _ in part]) as paths:
+            if pool is None:
+                for key, args in part:
+                    yield key, function(paths[key], *args) if key in paths else None
+                continue
+            futures = [(key, pool.submit(function, paths[key], *args) if key in paths else None) for key, args in part]
+            for key, future in futures:
+                yield key, future.result() if future is not None else None
+
+def content_disposition(filename, fallback='download'):
+    """An attachment header value that keeps non-ASCII (Persian) names, with a plain fallback."""
+    ext = os.path.splitext(filename)[1]
+    ascii_name = filename if filename.isascii() else f"{fallback}{ext if ext.isascii() else ''}"
+    ascii_name = ascii_name.replace('"', '')
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+def send_stored_file(key, download_name=None, mimetype=None, max_age=None):
+    """
+    Answers a download of `key`. Local files go out through send_from_directory
+    (conditional requests and ranges included). With an object store the
+    client is redirected to a presigned URL, or, when redirects are off, the
+    object is streamed through with single-range support.
+    """
+    storage = get_storage()
+    config = current_app.config
+    if storage.local:
+        return send_from_directory(storage.root, key, as_attachment=download_name is not None,
+                                   download_name=download_name, mimetype=mimetype, max_age=max_age)
+    if config.get('STORAGE_REDIRECT_DOWNLOADS', True):
+        url = storage.url(key, download_name, mimetype, expires=config.get('STORAGE_URL_EXPIRES', 300))
+        if url:
+            return redirect(url, code=302)
+
+    stat = storage.stat(key)
+    if stat is None:
+        return Response('Not found', status=404, mimetype='text/plain')
+    size, modified, tag = stat
+    start, stop, status = 0, size, 200
+    if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1:
+        wanted = request.range.range_for_length(size)
+        if wanted is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{size}"
+            return response
+        (start, stop), status = wanted, 206
+    response = Response(storage.stream(key, start, stop), status=status,
+                        mimetype=mimetype or 'application/octet-stream', direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    response.last_modified = modified
+    response.set_etag(tag)
+    if status == 206:
+        response.content_range = f"bytes {start}-{stop - 1}/{size}"
+    if download_name:
+        response.headers['Content-Disposition'] = content_disposition(download_name)
+    if max_age:
+        response.cache_control.max_age = max_age
+    return response
+
+def create_storage(config):
+    backend = config.get('STORAGE_BACKEND', 'local')
+    if backend == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+    if backend == 's3':
+        return S3Storage(config['STORAGE_S3_BUCKET'], prefix=config.get('STORAGE_S3_PREFIX') or '',
+                         endpoint_url=config.get('STORAGE_S3_ENDPOINT_URL'), region=config.get('STORAGE_S3_REGION'))
+    raise StorageError(f"Unknown STORAGE_BACKEND {backend!r}")
+
+def get_storage():
+    return current_app.extensions['storage']
+
+def init_storage(app):
+    app.extensions['storage'] = create_storage(app.config)
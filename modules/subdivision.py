@@ -0,0 +1,125 @@
+"""
+Set-based case subdivision.
+
+Splitting a parcel into hundreds of units costs a fixed number of statements
+whatever its size: the requested case numbers are checked in one query, the
+referenced parent documents are loaded with one `IN` query, and the children,
+their copied documents and (optionally) cloned ownerships are each written
+with one bulk INSERT. Bulk statements skip the ORM audit listeners, so their
+audit rows are written in bulk too.
+"""
+from datetime import datetime
+from sqlalchemy import insert, inspect
+from modules.db import db
+from modules.models import Case, Document, Ownership
+from modules.audit import log_bulk
+
+class SubdivisionError(ValueError):
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details or {}
+
+def _bulk_insert(model, rows):
+    """Inserts `rows` with multi-row INSERTs and audits the rows the database returns.
+
+    Returned rows are not guaranteed to come back in `rows` order, so callers
+    match them up by a natural key.
+    """
+    if not rows:
+        return []
+    keys = [attr.key for attr in inspect(model).column_attrs]
+    result = db.session.execute(insert(model).returning(*(getattr(model, key) for key in keys)), rows)
+    inserted = [dict(zip(keys, row)) for row in result]
+    log_bulk(db.session.connection(), model, inserted)
+    return inserted
+
+def validate_case_numbers(children_data):
+    """Rejects missing, repeated or already used case numbers before anything is written."""
+    numbers = [c.get('شماره_پرونده') for c in children_data]
+    if not all(numbers):
+        raise SubdivisionError('Every child needs a شماره_پرونده')
+    seen, repeated = set(), set()
+    for number in numbers:
+        (repeated if number in seen else seen).add(number)
+    if repeated:
+        raise SubdivisionError('Repeated case numbers', {'duplicates': sorted(repeated)})
+    # Archived cases keep their numbers
+    taken = db.session.scalars(db.select(Case.case_number).where(Case.case_number.in_(numbers))
+                               .execution_options(include_archived=True)).all()
+    if taken:
+        raise SubdivisionError('Case numbers already exist', {'duplicates': sorted(taken)})
+
+def subdivide(parent, children_data, reason='Subdivision', clone_ownership=False):
+    """
+    Creates the child cases of `parent` in the current transaction (not committed).
+
+    Each child may list `docs_to_transfer`: ids of parent documents whose
+    metadata is copied onto the child (the file itself is shared). Ids that do
+    not belong to the parent are ignored. With `clone_ownership` the parent's
+    current owner becomes the current owner of every child.
+    Returns the new child ids in request order.
+    """
+    if not children_data:
+        raise SubdivisionError('children required')
+    validate_case_numbers(children_data)
+
+    doc_ids = {doc_id for c in children_data for doc_id in c.get('docs_to_transfer', [])}
+    parent_docs = {}
+    if doc_ids:
+        parent_docs = {d.id: d for d in Document.query.filter(Document.id.in_(doc_ids), Document.case_id == parent.id)}
+
+    now = datetime.utcnow()
+    inserted = _bulk_insert(Case, [
+        {
+            'parent_id': parent.id,
+            'case_number': c.get('شماره_پرونده'),
+            'classification_number': c.get('شماره_کلاسه'),
+            'status': 'active',
+            'address': c.get('آدرس', parent.address),
+            'description': f"Subdivided from {parent.case_number}. Reason: {reason}. {c.get('توضیحات', '')}",
+            'created_at': now,
+        }
+        for c in children_data
+    ])
+    ids_by_number = {row['case_number']: row['id'] for row in inserted}
+    child_ids = [ids_by_number[c['شماره_پرونده']] for c in children_data]
+
+    document_rows = []
+    for child_id, c in zip(child_ids, children_data):
+        for doc_id in c.get('docs_to_transfer', []):
+            original = parent_docs.get(doc_id)
+            if original is None:
+                continue
+            document_rows.append({
+                'case_id': child_id,
+                'title': original.title,
+                'description': original.description,
+                'file_path': original.file_path,
+                'category': original.category,
+                'document_date': original.document_date,
+                'created_at': now,
+                # Same file: what was learned about it carries over
+                'file_size': original.file_size,
+                'checksum': original.checksum,
+                'mime_type': original.mime_type,
+                'processing_status': original.processing_status,
+                'processing_error': original.processing_error,
+                'thumbnail_path': original.thumbnail_path,
+            })
+    _bulk_insert(Document, document_rows)
+
+    if clone_ownership:
+        current = Ownership.query.filter_by(case_id=parent.id, is_current=True).first()
+        if current is not None:
+            _bulk_insert(Ownership, [
+                {
+                    'case_id': child_id,
+                    'person_id': current.person_id,
+                    'start_date': current.start_date,
+                    'end_date': current.end_date,
+                    'is_current': True,
+                }
+                for child_id in child_ids
+            ])
+
+    return child_ids
@@ -0,0 +1,176 @@
+"""
+Incremental sync for offline field clients.
+
+A client keeps a local copy of some cases, with their ownerships, owners and
+document metadata, plus a watermark: the change feed sequence number (see
+modules/changes.py) that its copy is current to.
+
+- `snapshot()` pages through the current rows of the client's cases for the
+  first download. The watermark is taken before reading, so anything written
+  while the snapshot is paged in is sent again by the next delta.
+- `delta()` reads the change feed after the watermark and returns every
+  changed entity once, as it is now (an upsert), or as a tombstone when it
+  no longer exists. A re-sync costs the changed rows only.
+- `push()` applies edits made offline. Each edit carries the row version the
+  client started from. When the row has moved on since, the edit is not
+  applied and the current row comes back as a conflict for the client to
+  resolve.
+
+Rows are flat dicts keyed by column name, like the change feed data, with
+ISO dates. Responses go through the normal response compression.
+"""
+from datetime import date, datetime
+from sqlalchemy import select, or_, inspect
+from modules.db import db
+from modules.models import Case, Person, Ownership, Document, AuditLog
+
+SYNC_MODELS = {'Case': Case, 'Person': Person, 'Ownership': Ownership, 'Document': Document}
+
+# Columns a field client may change, per model
+EDITABLE_COLUMNS = {
+    'Case': {'شماره_کلاسه', 'وضعیت', 'آدرس', 'توضیحات'},
+    'Person': {'نام_و_نام_خانوادگی', 'تلفن_همراه', 'تلفن_ثابت'},
+    'Document': {'عنوان', 'توضیحات', 'دسته_بندی', 'تاریخ_سند'},
+}
+
+class SyncError(ValueError):
+    pass
+
+def _jsonable(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def row(instance):
+    return {attr.columns[0].name: _jsonable(getattr(instance, attr.key))
+            for attr in inspect(instance).mapper.column_attrs}
+
+def _load(model, ids):
+    if not ids:
+        return []
+    return model.query.filter(model.id.in_(ids)).order_by(model.id).all()
+
+def _owners(ownerships, known=()):
+    person_ids = {o.person_id for o in ownerships} - set(known)
+    return _load(Person, person_ids)
+
+def _pack(groups):
+    """{'Case': [instances]} -> {'Case': [rows]}, leaving out empty models."""
+    return {name: [row(i) for i in instances] for name, instances in groups.items() if instances}
+
+def snapshot(case_ids, after, limit):
+    """Current rows of up to `limit` cases with id > `after` (all cases when `case_ids` is None)."""
+    query = Case.query.filter(Case.id > after)
+    if case_ids is not None:
+        query = query.filter(Case.id.in_(case_ids))
+    cases = query.order_by(Case.id).limit(limit).all()
+    ids = [c.id for c in cases]
+
+    ownerships = Ownership.query.filter(Ownership.case_id.in_(ids)).order_by(Ownership.id).all() if ids else []
+    documents = Document.query.filter(Document.case_id.in_(ids)).order_by(Document.id).all() if ids else []
+    return {
+        'upserts': _pack({'Case': cases, 'Person': _owners(ownerships), 'Ownership': ownerships, 'Document': documents}),
+        'next_after': ids[-1] if ids else after,
+        'has_more': len(ids) == limit,
+    }
+
+def delta(since, case_ids, limit):
+    """Entities changed after change sequence `since`, scanning at most `limit` changes."""
+    query = (select(AuditLog.id, AuditLog.target_model, AuditLog.target_id, AuditLog.action)
+             .where(AuditLog.id > since, AuditLog.target_model.in_(SYNC_MODELS)))
+    if case_ids is not None:
+        # People carry no case: they are matched through ownerships below
+        query = query.where(or_(AuditLog.case_id.in_(case_ids), AuditLog.target_model == 'Person'))
+    entries = db.session.execute(query.order_by(AuditLog.id).limit(limit)).all()
+
+    changed = {name: set() for name in SYNC_MODELS}
+    created = set()
+    for _, model_name, target_id, action in entries:
+        changed[model_name].add(target_id)
+        if action == 'create':
+            created.add((model_name, target_id))
+
+    current = {name: _load(SYNC_MODELS[name], ids) for name, ids in changed.items()}
+    if case_ids is not None and current['Person']:
+        owning = {pid for (pid,) in db.session.query(Ownership.person_id).filter(
+            Ownership.person_id.in_([p.id for p in current['Person']]), Ownership.case_id.in_(case_ids))}
+        current['Person'] = [p for p in current['Person'] if p.id in owning]
+        changed['Person'] &= owning
+    # New ownerships may point at people the client has never seen
+    new_ownerships = [o for o in current['Ownership'] if ('Ownership', o.id) in created]
+    current['Person'] += _owners(new_ownerships, known=[p.id for p in current['Person']])
+
+    tombstones = {}
+    for name, ids in changed.items():
+        gone = sorted(ids - {i.id for i in current[name]})
+        if gone:
+            tombstones[name] = gone
+    return {
+        'upserts': _pack(current),
+        'tombstones': tombstones,
+        'watermark': entries[-1][0] if entries else since,
+        'has_more': len(entries) == limit,
+    }
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def push(changes):
+    """
+    Applies offline edits `[{model, id, version, data}]` without committing.
+
+    Returns (applied, conflicts, rejected). Applied edits report the row's
+    new version. Conflicts carry the current row, or `deleted: true`. A
+    second edit of the same row in one push is rejected: both would pass the
+    version check.
+    """
+    if not isinstance(changes, list):
+        raise SyncError('changes must be a list')
+    targets = {}
+    for name in EDITABLE_COLUMNS:
+        ids = {c.get('id') for c in changes if isinstance(c, dict) and c.get('model') == name and _is_id(c.get('id'))}
+        targets[name] = {i.id: i for i in SYNC_MODELS[name].query.filter(SYNC_MODELS[name].id.in_(ids))
+                         .execution_options(populate_existing=True)} if ids else {}
+
+    applied, conflicts, rejected = [], [], []
+    edited, seen = [], set()
+    for change in changes:
+        name = change.get('model') if isinstance(change, dict) else None
+        data = change.get('data') if name else None
+        if (name not in EDITABLE_COLUMNS or not _is_id(change.get('id')) or not isinstance(data, dict)
+                or not isinstance(change.get('version'), int)):
+            rejected.append({'change': change, 'error': 'model, id, version and data are required; '
+                                                        f"editable models: {', '.join(EDITABLE_COLUMNS)}"})
+            continue
+        not_editable = sorted(set(data) - EDITABLE_COLUMNS[name])
+        if not_editable:
+            rejected.append({'change': change, 'error': f"Columns not editable: {', '.join(not_editable)}"})
+            continue
+        if (name, change['id']) in seen:
+            rejected.append({'change': change, 'error': 'Only one change per row in a push'})
+            continue
+        seen.add((name, change['id']))
+
+        instance = targets[name].get(change.get('id'))
+        if instance is None:
+            conflicts.append({'model': name, 'id': change.get('id'), 'deleted': True})
+            continue
+        if instance.version != change['version']:
+            conflicts.append({'model': name, 'id': instance.id, 'current': row(instance)})
+            continue
+
+        columns = {attr.columns[0].name: attr for attr in inspect(instance).mapper.column_attrs}
+        for column, value in data.items():
+            if value is not None and isinstance(columns[column].columns[0].type, db.Date):
+                try:
+                    value = date.fromisoformat(value)
+                except (TypeError, ValueError):
+                    raise SyncError(f"{column} must be an ISO date")
+            setattr(instance, columns[column].key, value)
+        edited.append(instance)
+
+    # Bumps the versions; a concurrent writer makes this raise StaleDataError
+    db.session.flush()
+    for instance in edited:
+        applied.append({'model': type(instance).__name__, 'id': instance.id, 'version': instance.version})
+    return applied, conflicts, rejected
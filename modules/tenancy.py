@@ -0,0 +1,147 @@
+"""
+Organizations (tenants): one deployment serving several districts.
+
+Cases, people, documents, lease contracts, invoices and audit rows carry
+`شناسه_سازمان`. Each request works inside one organization. It is taken
+from the request's API token, then from the logged-in user, and otherwise
+it is `TENANCY_DEFAULT_ORGANIZATION`. Every ORM SELECT, UPDATE and DELETE
+then gets `شناسه_سازمان = <id>` for all `Tenanted` models, the same way
+modules/archive.py hides archived rows. New rows are stamped with the
+organization. Queries that must see every organization run with
+`execution_options(all_organizations=True)`.
+
+Ownerships and extracted texts have no column of their own. They are
+reached through their case or document, which is already scoped.
+
+Code outside a request (manage.py, background workers) is not scoped, and
+the rows it creates belong to the default organization. Wrap such code in
+`with use_organization(id):` to work as one organization.
+
+Case numbers and national ids are unique per organization. The indexes for
+organization-wide lists lead on the organization id, so a district's
+queries only read its own part of each index.
+
+Schema per tenant (PostgreSQL only): an organization with a `schema_name`
+keeps its own copy of the tenant tables in that schema. Each of its
+transactions starts with `SET LOCAL search_path`, so the same SQL reaches
+its tables. Users, tokens and organizations stay in `public`.
+`python manage.py create_organization CODE NAME --schema S` creates the
+schema and its tables, and `python manage.py migrate` upgrades every schema.
+"""
+import re
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context
+from flask_login import current_user
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import Session, with_loader_criteria
+from modules.db import db
+from modules.models import Organization, Tenanted, DEFAULT_ORGANIZATION_ID, current_organization_id
+
+# Tables each schema tenant gets its own copy of
+TENANT_TABLES = ('cases', 'people', 'ownerships', 'documents', 'document_texts', 'lease_contracts', 'invoices',
+                 'audit_logs')
+
+SCHEMA_NAME = re.compile(r'^[a-z_][a-z0-9_]{0,62}$')
+
+class TenancyError(ValueError):
+    pass
+
+def _organization_rows_only(execute_state):
+    organization_id = current_organization_id()
+    if (organization_id is not None
+            and (execute_state.is_select or execute_state.is_update or execute_state.is_delete)
+            and not execute_state.is_column_load
+            and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get('all_organizations', False)):
+        # Like the archive filter, this reaches the lazy and eager loads of the returned objects
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(Tenanted, lambda cls: cls.organization_id == organization_id, include_aliases=True)
+        )
+
+def _set_search_path(session, transaction, connection):
+    schema = g.get('organization_schema') if has_app_context() else None
+    if schema and connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(f'SET LOCAL search_path TO "{schema}", public')
+
+def _schema_of(organization_id):
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    from modules.cache import get_cache
+    organization = get_cache().get(Organization, 'id', organization_id, attach=False)
+    return organization.schema_name if organization is not None else None
+
+def request_organization_id():
+    """The organization of the current request's API token or user, else the configured default."""
+    api_token = g.get('api_token')
+    if api_token is not None and api_token.organization_id is not None:
+        return api_token.organization_id
+    if api_token is None and current_user.is_authenticated and current_user.organization_id is not None:
+        return current_user.organization_id
+    return current_app.config.get('TENANCY_DEFAULT_ORGANIZATION', DEFAULT_ORGANIZATION_ID)
+
+def _enter_organization():
+    g.organization_id = request_organization_id()
+    g.organization_schema = _schema_of(g.organization_id)
+    session = db.session()
+    if session.info.get('organization_id', g.organization_id) != g.organization_id:
+        # Query.get() answers from the identity map without a query, so without the filter above
+        session.expunge_all()
+    session.info['organization_id'] = g.organization_id
+
+def visible(model, id):
+    """Whether the current organization sees the `model` row `id`: for ids taken from request bodies."""
+    if not isinstance(id, int) or isinstance(id, bool):
+        return False
+    return db.session.query(model.id).filter(model.id == id).first() is not None
+
+@contextmanager
+def use_organization(organization_id):
+    """Scopes the queries and new rows of the block to one organization (for code outside requests)."""
+    previous = g.get('organization_id'), g.get('organization_schema')
+    g.organization_id = organization_id
+    g.organization_schema = _schema_of(organization_id)
+    try:
+        yield
+    finally:
+        g.organization_id, g.organization_schema = previous
+
+def schema_engine(schema):
+    """An engine whose connections see `schema` first, then `public` (PostgreSQL)."""
+    if not SCHEMA_NAME.match(schema or ''):
+        raise TenancyError(f"Invalid schema name {schema!r}")
+    return create_engine(db.engine.url, connect_args={'options': f'-csearch_path={schema},public'})
+
+def tenant_schemas():
+    return [o.schema_name for o in Organization.query.filter(Organization.schema_name.isnot(None))
+            .order_by(Organization.id)]
+
+def create_organization(code, name, schema=None):
+    """Adds an organization; with `schema`, also creates the schema and its tables. The caller commits."""
+    if Organization.query.filter_by(code=code).first() is not None:
+        raise TenancyError(f"Organization {code} already exists")
+    if schema is not None:
+        if db.engine.dialect.name != 'postgresql':
+            raise TenancyError('Schema per organization needs PostgreSQL')
+        engine = schema_engine(schema)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+                if not inspect(conn).has_table('cases', schema=schema):
+                    # Unqualified names go to the first schema of the search path: the new one
+                    tables = [db.metadata.tables[name] for name in TENANT_TABLES]
+                    db.metadata.create_all(conn, tables=tables, checkfirst=False)
+            from modules import migrations
+            migrations.stamp(engine)
+        finally:
+            engine.dispose()
+    organization = Organization(code=code, name=name, schema_name=schema)
+    db.session.add(organization)
+    return organization
+
+def init_tenancy(app):
+    """Scopes every request to its organization (hooks registered once per process)."""
+    if not event.contains(Session, 'do_orm_execute', _organization_rows_only):
+        event.listen(Session, 'do_orm_execute', _organization_rows_only)
+        event.listen(Session, 'after_begin', _set_search_path)
+    # After the API token check, which puts the caller's token on g
+    app.before_request(_enter_organization)
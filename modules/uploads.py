@@ -0,0 +1,122 @@
+"""
+Checks on uploaded files, applied while they are written to disk.
+
+`save_file` copies an upload in chunks. It hashes each chunk (SHA-256) and
+sniffs the real type from the first bytes. It stops as soon as the file is
+over its category's size limit, or when its type is not allowed for the
+category, so a rejected file never ends up in the upload folder.
+
+Limits come from `UPLOAD_LIMITS`: `{category: {'max_size': bytes, 'types':
+[mime types, 'image/*' wildcards]}}`, with `'*'` for categories without
+their own entry. Executables are refused in every category.
+"""
+import os
+
+# Magic numbers at the start of the file
+SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'BM', 'image/bmp'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'MZ', 'application/x-msdownload'),
+    (b'\x7fELF', 'application/x-executable'),
+    (b'\xcf\xfa\xed\xfe', 'application/x-mach-binary'),
+]
+
+# Container formats whose extension tells what is inside
+ZIP_BASED = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.odt': 'application/vnd.oasis.opendocument.text',
+    '.ods': 'application/vnd.oasis.opendocument.spreadsheet',
+}
+OLE_BASED = {'.doc': 'application/msword', '.xls': 'application/vnd.ms-excel'}
+TEXT_TYPES = {'.csv': 'text/csv', '.md': 'text/markdown'}
+
+BLOCKED_TYPES = {'application/x-msdownload', 'application/x-executable', 'application/x-mach-binary'}
+
+class UploadRejected(ValueError):
+    """An upload that breaks its category's limits. `status` is the HTTP status to answer with."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _is_text(head):
+    if b'\x00' in head:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the chunk is fine
+        return e.start >= len(head) - 3 and e.reason == 'unexpected end of data'
+    return True
+
+def sniff(head, filename=''):
+    """The MIME type of a file from its first bytes (and, for containers, its extension)."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:12] in (b'ftypheic', b'ftypheix', b'ftypmif1'):
+        return 'image/heic'
+    for signature, mime in SIGNATURES:
+        if head.startswith(signature):
+            if mime == 'application/zip':
+                return ZIP_BASED.get(ext, mime)
+            if mime == 'application/x-ole-storage':
+                return OLE_BASED.get(ext, mime)
+            return mime
+    if head and _is_text(head):
+        return TEXT_TYPES.get(ext, 'text/plain')
+    return 'application/octet-stream'
+
+def type_allowed(mime, allowed):
+    if mime in BLOCKED_TYPES:
+        return False
+    if allowed is None:
+        return True
+    return any(mime == pattern or (pattern.endswith('*') and mime.startswith(pattern[:-1])) for pattern in allowed)
+
+def limits_for(category, config):
+    """(max size in bytes, allowed types) for uploads of `category`; None where unlimited."""
+    limits = config.get('UPLOAD_LIMITS') or {}
+    entry = limits.get(category) or limits.get('*') or {}
+    return entry.get('max_size'), entry.get('types')
+
+def largest_limit(config):
+    """The biggest size any category allows (None when some category is unlimited)."""
+    sizes = [entry.get('max_size') for entry in (config.get('UPLOAD_LIMITS') or {}).values()]
+    if not sizes or None in sizes:
+        return None
+    return max(sizes)
+
+class UploadCheck:
+    """Fed each chunk of an upload in order; raises UploadRejected as soon as a limit is broken."""
+    def __init__(self, filename, max_size=None, types=None):
+        self.filename = filename
+        self.max_size = max_size
+        self.types = types
+        self.size = 0
+        self.mime_type = None
+
+    def update(self, chunk):
+        if self.mime_type is None:
+            self.mime_type = sniff(chunk, self.filename)
+            if not type_allowed(self.mime_type, self.types):
+                raise UploadRejected(f"File type {self.mime_type} is not allowed here", status=415)
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadRejected(f"File is larger than {self.max_size // (1024 * 1024)} MB", status=413)
+
+    def finish(self):
+        if self.size == 0:
+            raise UploadRejected('File is empty')
@@ -1,11 +1,27 @@
 
 import os
 import uuid
-from flask import current_app
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_request_context
 from datetime import datetime, date
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 import jdatetime
+from modules.uploads import UploadCheck
+from modules.storage import get_storage
 
-def save_file(file, custom_name=None):
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# What save_file wrote: the name relative to the upload folder, and what was learned while writing it
+StoredFile = namedtuple('StoredFile', 'filename size checksum mime_type')
+
+def save_file(file, custom_name=None, storage=None, limits=(None, None)):
+    """
+    Writes an upload to the document storage under a free name. `limits` is
+    (max size, allowed types), see modules/uploads.py; a file breaking them
+    raises UploadRejected and is not kept. Returns a StoredFile.
+    """
     if not file:
         return None
 
@@ -18,22 +34,79 @@ def save_file(file, custom_name=None):
     else:
         filename = f"{uuid.uuid4()}_{file.filename}"
 
-    # Ensure unique if conflict? For now, overwrite or append UUID if critical.
     # User requested specific format: CaseNum-ClassNum-Title.ext
-    # If duplicates exist, maybe append timestamp?
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    file_path = os.path.join(upload_folder, filename)
-
+    # storage must be passed explicitly when called outside a request (e.g. from a worker thread)
+    if storage is None:
+        storage = get_storage()
     # Avoid overwrite by appending counter if exists
-    base, extension = os.path.splitext(filename)
-    counter = 1
-    while os.path.exists(file_path):
-        filename = f"{base}_{counter}{extension}"
-        file_path = os.path.join(upload_folder, filename)
-        counter += 1
+    filename = storage.reserve(filename)
+
+    # Size, type and checksum are worked out while copying, in one pass
+    check = UploadCheck(file.filename, *limits)
+    digest = hashlib.sha256()
+
+    def checked_chunks():
+        while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+            check.update(chunk)
+            digest.update(chunk)
+            yield chunk
+        check.finish()
+
+    try:
+        storage.put(filename, checked_chunks())
+    except BaseException:
+        storage.delete(filename)
+        raise
+    _track_saved([filename])
+    return StoredFile(filename, check.size, digest.hexdigest(), check.mime_type)
+
+def _track_saved(filenames):
+    # Lets a caller that rolls back the request's transaction (e.g. /api/batch) remove what was written
+    if has_request_context() and 'saved_files' in g:
+        g.saved_files.update(filenames)
+
+def batch_drops_body():
+    """Whether this call runs in an /api/batch with `dump_case`, which drops its body: views skip dumping the case."""
+    return has_request_context() and g.get('batch_dump_case') is not None
+
+_staging_pool = None
+
+def stage_files(uploads, storage, max_workers=4):
+    """Saves (file, custom_name, limits) triples to storage in parallel. Returns StoredFiles in the same order.
 
-    file.save(file_path)
-    return filename # Return relative path for DB
+    If any save fails, the files already written are removed and the error is raised.
+    """
+    global _staging_pool
+    if not uploads:
+        return []
+    if len(uploads) == 1:
+        file, custom_name, limits = uploads[0]
+        return [save_file(file, custom_name=custom_name, storage=storage, limits=limits)]
+    if _staging_pool is None:
+        _staging_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-staging')
+
+    futures = [_staging_pool.submit(save_file, file, custom_name, storage, limits)
+               for file, custom_name, limits in uploads]
+    stored, error = [], None
+    for future in futures:
+        try:
+            stored.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error:
+        remove_files([s.filename for s in stored], storage)
+        raise error
+    _track_saved([s.filename for s in stored])
+    return stored
+
+def remove_files(filenames, storage=None):
+    """Best-effort removal of staged files (e.g. after a rolled back transaction)."""
+    storage = storage or get_storage()
+    for filename in filenames:
+        try:
+            storage.delete(filename)
+        except Exception:
+            pass
 
 def gregorian_to_jalali(date_obj):
     """Converts a Gregorian date object to a Jalali string (YYYY/MM/DD)."""
@@ -64,3 +137,30 @@ def jalali_to_gregorian(jalali_str):
         return jdatetime.date(year, month, day).togregorian()
     except Exception:
         return None
+
+def to_rials(value):
+    """Converts a user supplied amount (int, str, float or Decimal) to whole Rials.
+
+    Floats are routed through ``str`` so that ``5000000.1`` does not pick up
+    binary rounding noise. Returns None for empty or invalid values.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        amount = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int(amount.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def compound_rent(base_rent, annual_increase_percent, years):
+    """Applies a yearly percentage increase to a rent with exact decimal arithmetic.
+
+    The result is rounded once, at the end, to whole Rials.
+    """
+    amount = Decimal(int(base_rent or 0))
+    if years > 0 and annual_increase_percent:
+        factor = 1 + Decimal(str(annual_increase_percent)) / 100
+        amount = amount * (factor ** years)
+    return int(amount.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
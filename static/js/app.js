@@ -34,3 +34,21 @@ function showAlert(message, type = 'success') {
         }, 5000);
     }
 }
+
+// Follows the change feed (/api/changes/stream) and hands new changes to onChanges in batches.
+// EventSource reconnects by itself and resumes after the last change it saw.
+function followChanges(params, onChanges, delay = 300) {
+    const source = new EventSource('/api/changes/stream?' + new URLSearchParams(params));
+    let pending = [];
+    let timer = null;
+    source.addEventListener('change', event => {
+        pending.push(JSON.parse(event.data));
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            const changes = pending;
+            pending = [];
+            onChanges(changes);
+        }, delay);
+    });
+    return source;
+}
@@ -0,0 +1,112 @@
+import unittest
+import os
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import update
+from app import create_app
+from modules.db import db
+from modules.api_auth import create_token
+from modules.cache import IdentityCache
+from modules.models import ApiToken
+from modules.ratelimit import MemoryBuckets, SQLiteBuckets
+from tests.test_system import TestConfig
+
+class ApiAuthConfig(TestConfig):
+    API_AUTH_REQUIRED = True
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = {'read': (1, 3), 'heavy': (0.01, 1)}
+
+class TestApiAuth(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(ApiAuthConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.api_token, token = create_token('accounting-sync')
+        db.session.add(self.api_token)
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_token_required(self):
+        res = self.client.get('/api/cases/')
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.headers['WWW-Authenticate'], 'Bearer')
+        self.assertEqual(self.client.get('/api/cases/', headers={'X-API-Key': 'nope'}).status_code, 401)
+        self.assertEqual(self.client.get('/api/cases/', headers=self.headers).status_code, 200)
+        # Every /api/ route is guarded, not only the blueprints known to the guard
+        self.assertEqual(self.client.get('/api/unknown').status_code, 401)
+
+        self.api_token.revoked_at = datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/cases/', headers=self.headers).status_code, 401)
+
+    def test_revocation_reaches_other_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shared = IdentityCache(shared_path=os.path.join(tmp, 'cache.db'), sync_interval=0,
+                                   model_ttls={'ApiToken': 10})
+            self.app.extensions['identity_cache'] = shared
+            self.assertEqual(self.client.get('/api/cases/', headers=self.headers).status_code, 200)
+            # Another worker revokes the token: its commit goes through the shared invalidation log
+            other = IdentityCache(shared_path=os.path.join(tmp, 'cache.db'))
+            db.session.execute(update(ApiToken).values(revoked_at=datetime.utcnow()))
+            db.session.commit()
+            other.invalidate({f"ApiToken:token_hash:{self.api_token.token_hash}"})
+            self.assertEqual(self.client.get('/api/cases/', headers=self.headers).status_code, 401)
+
+    def test_revocation_missed_by_the_cache_expires_quickly(self):
+        self.app.extensions['identity_cache'] = IdentityCache(model_ttls={'ApiToken': 0})
+        self.assertEqual(self.client.get('/api/cases/', headers=self.headers).status_code, 200)
+        # A plain SQL update evicts nothing
+        db.session.execute(update(ApiToken).values(revoked_at=datetime.utcnow()))
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/cases/', headers=self.headers).status_code, 401)
+
+    def test_buckets_per_client_and_endpoint_class(self):
+        statuses = [self.client.get('/api/cases/', headers=self.headers).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        res = self.client.get('/api/cases/', headers=self.headers)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+        # Heavy endpoints have their own, smaller bucket
+        self.assertEqual(self.client.get('/api/invoices/reports/financial', headers=self.headers).status_code, 200)
+        res = self.client.get('/api/invoices/reports/financial', headers=self.headers)
+        self.assertEqual(res.status_code, 429)
+        self.assertGreater(int(res.headers['Retry-After']), 1)
+
+    def test_batch_calls_take_their_own_rate_class(self):
+        call = {'method': 'GET', 'path': '/api/invoices/reports/financial'}
+        res = self.client.post('/api/batch/', headers=self.headers, json={'mode': 'per_item', 'requests': [call] * 3})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r['status'] for r in res.get_json()['results']], [200, 429, 429])
+        self.assertEqual(self.client.get('/api/invoices/reports/financial', headers=self.headers).status_code, 429)
+
+    def test_shared_buckets_across_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ratelimit.db')
+            worker_a, worker_b = SQLiteBuckets(path), SQLiteBuckets(path)
+            self.assertTrue(worker_a.take('token:1:write', 0.001, 2)[0])
+            self.assertTrue(worker_b.take('token:1:write', 0.001, 2)[0])
+            allowed, retry_after = worker_a.take('token:1:write', 0.001, 2)
+            self.assertFalse(allowed)
+            self.assertGreater(retry_after, 0)
+
+    def test_idle_buckets_are_dropped_once_full(self):
+        buckets = MemoryBuckets()
+        buckets.take('token:1:read', 1000, 2)
+        buckets.take('token:2:read', 0.001, 2)
+        buckets.SWEEP_INTERVAL = 0
+        time.sleep(0.01)
+        buckets.take('token:3:read', 1000, 2)
+        # token:1 has refilled, token:2 has not
+        self.assertEqual(set(buckets._state), {'token:2:read', 'token:3:read'})
+
+if __name__ == '__main__':
+    unittest.main()
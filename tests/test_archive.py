@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app
+from modules.db import db
+from modules.archive import archive_closed
+from modules.models import Case, Document, Ownership, AuditLog
+from tests.test_system import TestConfig
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.case_id = self.create_case('A-1', '1000000001')
+        db.session.add(Document(case_id=self.case_id, title='Deed', file_path='deed.pdf'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_case(self, number, national_id, status='active'):
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': number, 'وضعیت': status, 'owner_name': 'Owner', 'owner_national_id': national_id})
+        return res.get_json()['شناسه']
+
+    def test_archive_hides_case_and_children_until_restored(self):
+        other = self.create_case('A-2', '1000000002')
+        self.assertEqual(self.client.delete(f'/api/cases/{self.case_id}').status_code, 200)
+
+        self.assertEqual(self.client.get(f'/api/cases/{self.case_id}').status_code, 404)
+        listed = self.client.get('/api/cases/?view=summary&limit=10').get_json()
+        self.assertEqual(([c['شناسه'] for c in listed['items']], listed['total']), ([other], 1))
+        self.assertEqual(Document.query.count(), 0)
+        self.assertEqual(Ownership.query.filter_by(case_id=self.case_id).count(), 0)
+        archived = self.client.get('/api/cases/?archived=1').get_json()
+        self.assertEqual([c['شناسه'] for c in archived], [self.case_id])
+        self.assertEqual(self.client.delete(f'/api/cases/{self.case_id}').status_code, 404)
+        # Archived numbers stay taken
+        res = self.client.post(f'/api/cases/{other}/subdivide', json={'children': [{'شماره_پرونده': 'A-1'}]})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client.post(f'/api/cases/{self.case_id}/restore')
+        self.assertEqual(res.status_code, 200)
+        case = res.get_json()
+        self.assertEqual((case['تاریخ_بایگانی'], case['نسخه'], len(case['اسناد'])), (None, 3, 1))
+        self.assertEqual(self.client.post(f'/api/cases/{self.case_id}/restore').status_code, 400)
+        actions = db.session.scalars(db.select(AuditLog.action).where(AuditLog.target_model == 'Document')).all()
+        self.assertEqual(actions, ['create', 'archive', 'restore'])
+
+    def test_archiver_only_takes_old_closed_cases(self):
+        old_closed = self.create_case('A-2', '1000000002', status='closed')
+        new_closed = self.create_case('A-3', '1000000003', status='closed')
+        db.session.get(Case, old_closed).updated_at = datetime.utcnow() - timedelta(days=100)
+        db.session.commit()
+
+        self.assertEqual(archive_closed(90, batch_size=1, log=lambda msg: None), 1)
+        live = db.session.scalars(db.select(Case.id).order_by(Case.id)).all()
+        self.assertEqual(live, [self.case_id, new_closed])
+        self.assertEqual(archive_closed(0, batch_size=1, log=lambda msg: None), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import gzip
+import os
+import tempfile
+from app import create_app
+from download_assets import build
+from tests.test_system import TestConfig
+
+class TestAssets(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+        cls.manifest = build(static_dir, cls.tmp.name, font_weights=['Regular', 'Bold'])
+
+        class AssetsConfig(TestConfig):
+            ASSETS_DIST_DIR = cls.tmp.name
+        cls.app = create_app(AssetsConfig)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_build_fingerprints_and_subsets_fonts(self):
+        self.assertNotIn('css/fonts/webfonts/Vazirmatn-Thin.woff2', self.manifest)
+        font_css_path = os.path.join(self.tmp.name, self.manifest['css/Vazirmatn-font-face.css'])
+        with open(font_css_path, encoding='utf-8') as f:
+            font_css = f.read()
+        self.assertIn('/assets/' + self.manifest['css/fonts/webfonts/Vazirmatn-Regular.woff2'], font_css)
+        self.assertEqual(font_css.count('@font-face'), 2)
+
+    def test_serves_precompressed_with_immutable_cache(self):
+        client = self.app.test_client()
+        url = '/assets/' + self.manifest['js/bootstrap.bundle.min.js']
+        res = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        self.assertTrue(res.mimetype.endswith('javascript'))
+        self.assertIn(b'bootstrap', gzip.decompress(res.get_data()))
+
+        plain = client.get(url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(client.get('/assets/../config.py').status_code, 404)
+
+    def test_templates_use_fingerprinted_urls(self):
+        with self.app.test_request_context():
+            html = self.app.jinja_env.get_template('login.html').render()
+        self.assertIn('/assets/' + self.manifest['css/bootstrap.rtl.min.css'], html)
+
+if __name__ == '__main__':
+    unittest.main()
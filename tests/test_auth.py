@@ -0,0 +1,65 @@
+import unittest
+from sqlalchemy import event
+from app import create_app
+from modules.db import db
+from modules.models import User
+from modules.auth import HashPool, AuthBusy, needs_rehash
+from tests.test_system import TestConfig
+
+class AuthTestConfig(TestConfig):
+    SECRET_KEY = 'test'
+
+class TestAuth(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AuthTestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        user = User(username='clerk')
+        user.set_password('secret', method='pbkdf2:sha256:1000')
+        db.session.add(user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_login_rehashes_and_principal_is_cached(self):
+        res = self.client.post('/login', data={'username': 'clerk', 'password': 'wrong'})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(User.query.filter_by(username='clerk').one().password_hash.startswith('pbkdf2'))
+
+        res = self.client.post('/login', data={'username': 'clerk', 'password': 'secret'})
+        self.assertEqual(res.status_code, 302)
+        db.session.remove()
+        stored = User.query.filter_by(username='clerk').one().password_hash
+        self.assertTrue(stored.startswith('scrypt:32768:8:1$'))
+        self.assertFalse(needs_rehash(stored, 'scrypt'))
+
+        queries = []
+        listener = lambda *args, **kwargs: queries.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.client.get('/')
+            queries.clear()
+            res = self.client.get('/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_full_pool_sheds_logins(self):
+        pool = HashPool(workers=1, queue_size=0)
+        pool._slots.acquire()
+        with self.assertRaises(AuthBusy):
+            pool.check('scrypt:32768:8:1$x$y', 'secret')
+
+        self.app.extensions['auth_hash_pool'] = pool
+        res = self.client.post('/login', data={'username': 'clerk', 'password': 'secret'})
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '2')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import base64
+import os
+from unittest.mock import patch
+from app import create_app
+from modules.db import db
+from modules.models import Case, Ownership
+from api.cases import routes as case_routes
+from tests.test_system import TestConfig
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': 'B-1', 'آدرس': 'Old', 'owner_name': 'Owner', 'owner_national_id': '1000000001'})
+        self.case_id = res.get_json()['شناسه']
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_atomic_batch_dumps_case_once(self):
+        res = self.client.post('/api/batch/', json={'dump_case': self.case_id, 'requests': [
+            {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'آدرس': 'New'}},
+            {'method': 'POST', 'path': f'/api/cases/{self.case_id}/owners',
+             'body': {'کد_ملی': '1000000002', 'نام_و_نام_خانوادگی': 'Buyer'}},
+        ]})
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual([r['status'] for r in body['results']], [200, 200])
+        self.assertEqual([r['body'] for r in body['results']], [None, None])
+        self.assertEqual(body['case']['آدرس'], 'New')
+        open_ended = [o['مالک']['کد_ملی'] for o in body['case']['سوابق_مالکیت'] if not o['تاریخ_پایان']]
+        self.assertEqual(open_ended, ['1000000002'])
+
+    def test_calls_skip_the_case_dump_when_the_batch_dumps_it(self):
+        with patch.object(case_routes.case_schema, 'dump', wraps=case_routes.case_schema.dump) as dump:
+            res = self.client.post('/api/batch/', json={'dump_case': self.case_id, 'requests': [
+                {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'آدرس': 'New'}},
+                {'method': 'GET', 'path': f'/api/cases/{self.case_id}'},
+            ]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['case']['آدرس'], 'New')
+        dump.assert_not_called()
+
+    def test_invalid_dump_case_is_refused_before_running(self):
+        res = self.client.post('/api/batch/', json={'dump_case': 'abc', 'requests': [
+            {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'آدرس': 'New'}},
+        ]})
+        self.assertEqual(res.status_code, 400)
+        db.session.remove()
+        self.assertEqual(db.session.get(Case, self.case_id).address, 'Old')
+
+    def test_atomic_batch_rolls_back_everything(self):
+        upload_dir = TestConfig.UPLOAD_FOLDER
+        before = set(os.listdir(upload_dir))
+        res = self.client.post('/api/batch/', json={'requests': [
+            {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'آدرس': 'New'}},
+            {'method': 'POST', 'path': '/api/documents/', 'form': {'case_id': str(self.case_id), 'title': 'Deed'},
+             'files': {'file': {'filename': 'deed.txt', 'content_base64': base64.b64encode(b'deed').decode()}}},
+            {'method': 'PUT', 'path': '/api/cases/9999', 'body': {'آدرس': 'X'}},
+            {'method': 'GET', 'path': f'/api/cases/{self.case_id}'},
+        ]})
+        self.assertEqual(res.status_code, 400)
+        body = res.get_json()
+        self.assertEqual(body['failed_index'], 2)
+        self.assertEqual([r['status'] for r in body['results']], [200, 201, 404, None])
+        self.assertTrue(body['results'][3]['skipped'])
+
+        db.session.remove()
+        case = db.session.get(Case, self.case_id)
+        self.assertEqual(case.address, 'Old')
+        self.assertEqual(case.documents, [])
+        self.assertEqual(set(os.listdir(upload_dir)), before)
+
+    def test_per_item_batch_keeps_successful_calls(self):
+        res = self.client.post('/api/batch/', json={'mode': 'per_item', 'requests': [
+            {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'آدرس': 'New'}},
+            {'method': 'POST', 'path': f'/api/cases/{self.case_id}/owners', 'body': {}},
+            {'method': 'GET', 'path': '/metrics'},
+        ]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r['status'] for r in res.get_json()['results']], [200, 400, 400])
+        db.session.remove()
+        self.assertEqual(db.session.get(Case, self.case_id).address, 'New')
+        self.assertEqual(Ownership.query.filter_by(case_id=self.case_id).count(), 1)
+
+    def test_per_item_batch_recovers_after_a_failed_flush(self):
+        self.client.post('/api/cases/', json={
+            'شماره_پرونده': 'B-2', 'owner_name': 'Owner', 'owner_national_id': '1000000003'})
+        res = self.client.post('/api/batch/', json={'mode': 'per_item', 'requests': [
+            {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'شماره_پرونده': 'B-2'}},
+            {'method': 'PUT', 'path': f'/api/cases/{self.case_id}', 'body': {'آدرس': 'New'}},
+        ]})
+        self.assertEqual([r['status'] for r in res.get_json()['results']], [400, 200])
+        db.session.remove()
+        case = db.session.get(Case, self.case_id)
+        self.assertEqual((case.case_number, case.address), ('B-1', 'New'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import os
+import tempfile
+from sqlalchemy import event
+from app import create_app
+from modules.db import db
+from modules.models import Person, User
+from modules.cache import IdentityCache, get_cache, CACHE_REQUESTS
+from tests.test_system import TestConfig
+
+class TestIdentityCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Person(full_name='Ali', national_id='0011223344'))
+        db.session.commit()
+        db.session.remove()
+
+        self.queries = []
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self.queries.append(args[2])
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_hit_costs_no_sql_and_is_attached(self):
+        cache = get_cache()
+        person = cache.get(Person, 'national_id', '0011223344')
+        self.assertEqual(len(self.queries), 1)
+        db.session.remove()
+
+        hits = CACHE_REQUESTS.values.get(('Person', 'hit'), 0)
+        person = cache.get(Person, 'id', person.id)
+        self.assertEqual(self.queries[1:], [])
+        self.assertEqual(person.full_name, 'Ali')
+        self.assertIn(person, db.session)
+        self.assertEqual(CACHE_REQUESTS.values[('Person', 'hit')], hits + 1)
+
+    def test_commit_evicts_old_and_new_keys(self):
+        cache = get_cache()
+        person = cache.get(Person, 'national_id', '0011223344')
+        person.national_id = '9999999999'
+        db.session.commit()
+        db.session.remove()
+
+        self.assertIsNone(cache.get(Person, 'national_id', '0011223344'))
+        self.assertEqual(cache.get(Person, 'national_id', '9999999999').full_name, 'Ali')
+
+    def test_shared_tier_keeps_workers_coherent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            worker_a = IdentityCache(shared_path=path, sync_interval=0)
+            worker_b = IdentityCache(shared_path=path, sync_interval=0)
+
+            person_id = worker_a.get(Person, 'national_id', '0011223344').id
+            before = len(self.queries)
+            worker_b.get(Person, 'id', person_id)
+            self.assertEqual(len(self.queries), before)  # answered by the shared tier
+
+            # Worker B's next lookup picks up worker A's invalidation
+            worker_a.invalidate({f'Person:id:{person_id}'})
+            self.assertIsNone(worker_b._lookup('Person', f'Person:id:{person_id}'))
+            self.assertIsNone(worker_b._get_local(f'Person:id:{person_id}'))
+
+    def test_users_stay_out_of_the_shared_tier(self):
+        user = User(username='clerk')
+        user.set_password('secret', method='pbkdf2:sha256:1000')
+        db.session.add(user)
+        db.session.commit()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            worker = IdentityCache(shared_path=path, sync_interval=0)
+            self.assertTrue(worker.get(User, 'username', 'clerk', attach=False).check_password('secret'))
+            self.assertIsNotNone(worker._get_local('User:username:clerk'))
+            self.assertIsNone(worker.shared.get('User:username:clerk'))
+
+if __name__ == '__main__':
+    unittest.main()
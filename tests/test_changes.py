@@ -0,0 +1,70 @@
+import unittest
+import json
+from app import create_app
+from modules.db import db
+from tests.test_system import TestConfig
+
+class ChangesTestConfig(TestConfig):
+    CHANGE_FEED_POLL_INTERVAL = 0.05
+    CHANGE_FEED_STREAM_MAX_AGE = 0.3
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(ChangesTestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_case(self, number, national_id):
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': number, 'owner_name': 'Owner', 'owner_national_id': national_id})
+        return res.get_json()['شناسه']
+
+    def test_incremental_sync(self):
+        first = self.create_case('C-1', '1000000001')
+        second = self.create_case('C-2', '1000000002')
+        self.client.put(f'/api/cases/{first}', json={'آدرس': 'New'})
+
+        everything = self.client.get('/api/changes?since=0').get_json()
+        seqs = [c['seq'] for c in everything['changes']]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertFalse(everything['has_more'])
+        self.assertEqual(everything['next'], seqs[-1])
+        self.assertEqual(everything['changes'][-1]['action'], 'update')
+        self.assertEqual(everything['changes'][-1]['data']['آدرس'], 'New')
+
+        # Only the second case's rows: the case, its owner's ownership (the person has no case)
+        per_case = self.client.get(f'/api/changes?since=0&case_id={second}').get_json()['changes']
+        self.assertEqual({c['model'] for c in per_case}, {'Case', 'Ownership'})
+        self.assertTrue(all(c['case_id'] == second for c in per_case))
+
+        cases = self.client.get('/api/changes?since=0&model=Case&limit=2').get_json()
+        self.assertEqual([c['id'] for c in cases['changes']], [first, second])
+        self.assertTrue(cases['has_more'])
+        rest = self.client.get(f"/api/changes?since={cases['next']}&model=Case").get_json()
+        self.assertEqual([(c['id'], c['action']) for c in rest['changes']], [(first, 'update')])
+
+        self.assertEqual(self.client.get(f"/api/changes?since={everything['next']}").get_json()['changes'], [])
+
+    def test_stream_resumes_after_last_event_id(self):
+        case_id = self.create_case('C-1', '1000000001')
+        self.client.put(f'/api/cases/{case_id}', json={'آدرس': 'New'})
+        body = self.client.get(f'/api/changes/stream?since=0&case_id={case_id}').get_data(as_text=True)
+        events = [e for e in body.split('\n\n') if e.startswith('id: ')]
+        self.assertEqual([json.loads(e.split('data: ', 1)[1])['action'] for e in events],
+                         ['create', 'create', 'update'])
+
+        second_id = events[1].split('\n')[0][4:]
+        res = self.client.get(f'/api/changes/stream?case_id={case_id}', headers={'Last-Event-ID': second_id})
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        resumed = [e for e in res.get_data(as_text=True).split('\n\n') if e.startswith('id: ')]
+        self.assertEqual(resumed, events[2:])
+
+if __name__ == '__main__':
+    unittest.main()
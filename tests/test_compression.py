@@ -0,0 +1,64 @@
+import unittest
+import gzip
+import zlib
+from flask import Response
+from app import create_app
+from modules.db import db
+from modules.models import Case
+from modules.compression import negotiate
+from tests.test_system import TestConfig
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+
+        @self.app.route('/_stream')
+        def stream():
+            return Response((f"data: {i}\n\n" for i in range(3)), mimetype='text/event-stream')
+
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for i in range(50):
+            db.session.add(Case(case_number=f"CMP-{i}", address="تهران، خیابان ولیعصر", description="پرونده آزمایشی"))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip, br', ['zstd', 'br', 'gzip']), 'br')
+        self.assertEqual(negotiate('br;q=0, gzip', ['br', 'gzip']), 'gzip')
+        self.assertEqual(negotiate('*', ['gzip']), 'gzip')
+        self.assertIsNone(negotiate('identity', ['gzip']))
+        self.assertIsNone(negotiate(None, ['gzip']))
+
+    def test_large_json_is_gzipped_and_cached(self):
+        plain = self.client.get('/api/cases/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('تهران'.encode('utf-8'), plain.get_data())  # raw UTF-8, not \u escapes
+
+        cache = self.app.extensions['compression_cache']
+        for _ in range(2):
+            res = self.client.get('/api/cases/', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', res.headers['Vary'])
+            self.assertEqual(gzip.decompress(res.get_data()), plain.get_data())
+        self.assertEqual(cache.hits, 1)
+        self.assertIn('cmp;dur=', res.headers['Server-Timing'])
+
+    def test_small_body_untouched(self):
+        res = self.client.get('/api/invoices/reports/financial', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_streamed_response(self):
+        res = self.client.get('/_stream', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        body = zlib.decompress(res.get_data(), 31)
+        self.assertEqual(body, b"data: 0\n\ndata: 1\n\ndata: 2\n\n")
+
+if __name__ == '__main__':
+    unittest.main()
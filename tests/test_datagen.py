@@ -0,0 +1,50 @@
+import unittest
+from app import create_app
+from modules.db import db
+from modules.models import Case, Person, Ownership, LeaseContract, Invoice, AuditLog
+from modules.datagen import generate, national_id
+from tests.test_system import TestConfig
+
+class TestDataGenerator(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_generate_links_rows(self):
+        counts = generate(60, workers=1, chunk_size=25, log=lambda msg: None)
+        self.assertEqual(counts['cases'], 60)
+        self.assertEqual(Case.query.count(), 60)
+        self.assertEqual(Person.query.count(), counts['people'])
+
+        # Every case has exactly one current owner, pointing at a real person
+        self.assertEqual(Ownership.query.filter_by(is_current=True).count(), 60)
+        orphan = Ownership.query.outerjoin(Person).filter(Person.id.is_(None)).count()
+        self.assertEqual(orphan, 0)
+
+        contract_ids = {c.id for c in LeaseContract.query.all()}
+        self.assertTrue(all(i.contract_id in contract_ids for i in Invoice.query.all()))
+        self.assertEqual(AuditLog.query.filter_by(target_model='Case').count(), 60)
+
+        # A second run with the same seed and chunk size appends without key collisions
+        generate(60, workers=1, chunk_size=25, log=lambda msg: None)
+        self.assertEqual(Case.query.count(), 120)
+        self.assertEqual(Invoice.query.count(), len({i.invoice_number for i in Invoice.query.all()}))
+
+    def test_national_id_checksum(self):
+        self.assertEqual(national_id(123), '0000001236')
+        for n in (1, 2, 999, 123456789, 987654321):
+            code = national_id(n)
+            self.assertEqual(len(code), 10)
+            remainder = sum(int(d) * (10 - i) for i, d in enumerate(code[:9])) % 11
+            check = int(code[9])
+            self.assertTrue(check == remainder if remainder < 2 else check == 11 - remainder, code)
+
+if __name__ == '__main__':
+    unittest.main()
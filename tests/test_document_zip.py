@@ -0,0 +1,86 @@
+import unittest
+import io
+import os
+import zipfile
+from urllib.parse import quote
+from app import create_app
+from modules.db import db
+from modules.document_zip import stream_zip, MISSING_FILES_NAME
+from modules.storage import get_storage
+from modules.models import Document
+from tests.test_system import TestConfig
+
+class TestDocumentZip(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': 'پ/۱', 'owner_name': 'Owner', 'owner_national_id': '1000000001'})
+        self.case_id = res.get_json()['شناسه']
+        self.files = []
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def upload(self, case_id, title, filename, content):
+        res = self.client.post('/api/documents/', data={
+            'case_id': str(case_id), 'title': title,
+            'file': (io.BytesIO(content), filename)}, content_type='multipart/form-data')
+        doc_id = res.get_json()['شناسه']
+        self.files.append(os.path.join(TestConfig.UPLOAD_FOLDER, db.session.get(Document, doc_id).file_path))
+        return doc_id
+
+    def test_subtree_zip(self):
+        deed = self.upload(self.case_id, 'سند مالکیت', 'deed.txt', 'متن سند'.encode('utf-8') * 100)
+        self.upload(self.case_id, 'نقشه', 'map.png', b'\x89PNG' + os.urandom(64))
+        res = self.client.post(f'/api/cases/{self.case_id}/subdivide?view=summary', json={'children': [
+            {'شماره_پرونده': 'پ/۱-۱', 'docs_to_transfer': [deed]}]})
+        child = res.get_json()['شناسه_زیر_پرونده_ها'][0]
+        self.upload(child, 'سند مالکیت', 'deed2.txt', b'second')
+        db.session.add(Document(case_id=child, title='Lost', file_path='missing.txt'))
+        db.session.commit()
+
+        res = self.client.get(f'/api/cases/{self.case_id}/documents.zip?include_children=1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/zip')
+        self.assertTrue(res.is_streamed)
+        self.assertIn(f"filename*=UTF-8''{quote('پ_۱.zip')}", res.headers['Content-Disposition'])
+
+        archive = zipfile.ZipFile(io.BytesIO(res.get_data()))
+        self.assertIsNone(archive.testzip())
+        entries = {i.filename: i for i in archive.infolist()}
+        self.assertEqual(sorted(entries), sorted([
+            'پ_۱/سند مالکیت.txt', 'پ_۱/نقشه.png',
+            'پ_۱/پ_۱-۱/سند مالکیت.txt', 'پ_۱/پ_۱-۱/سند مالکیت (2).txt',
+            MISSING_FILES_NAME]))
+        self.assertEqual(archive.read('پ_۱/سند مالکیت.txt').decode('utf-8'), 'متن سند' * 100)
+        self.assertEqual(entries['پ_۱/سند مالکیت.txt'].compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(entries['پ_۱/نقشه.png'].compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.read(MISSING_FILES_NAME).decode('utf-8'), 'پ_۱/پ_۱-۱/Lost.txt\n')
+
+        only_case = zipfile.ZipFile(io.BytesIO(self.client.get(f'/api/cases/{self.case_id}/documents.zip').get_data()))
+        self.assertEqual(len(only_case.namelist()), 2)
+        self.assertEqual(self.client.get('/api/cases/9999/documents.zip').status_code, 404)
+
+    def test_stream_is_built_in_chunks(self):
+        path = os.path.join(TestConfig.UPLOAD_FOLDER, 'zip-chunks.bin')
+        self.files.append(path)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(300_000))
+        chunks = list(stream_zip([('a.jpg', 'zip-chunks.bin')], get_storage(), chunk_size=64 * 1024))
+        self.assertGreater(len(chunks), 4)
+        self.assertLess(max(len(c) for c in chunks), 70_000)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        with open(path, 'rb') as f:
+            self.assertEqual(archive.read('a.jpg'), f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import io
+import os
+from unittest import mock
+from app import create_app
+from modules.db import db
+from modules import extraction
+from modules.extraction import run_extraction, normalize
+from modules.models import Document, DocumentText
+from tests.test_system import TestConfig
+
+class TestExtraction(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': 'E-1', 'owner_name': 'Owner', 'owner_national_id': '1000000001'})
+        self.case_id = res.get_json()['شناسه']
+        self.files = []
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def upload(self, filename, content, case_id=None):
+        res = self.client.post('/api/documents/', data={
+            'case_id': str(case_id or self.case_id), 'title': filename,
+            'file': (io.BytesIO(content), filename)}, content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 201)
+        doc = res.get_json()
+        self.files.append(os.path.join(TestConfig.UPLOAD_FOLDER, db.session.get(Document, doc['شناسه']).file_path))
+        return doc['شناسه']
+
+    def test_extracted_text_is_searchable(self):
+        deed = self.upload('deed.txt', 'سند مالكيت پلاك ثبتي ۱۲۳ بخش يازده'.encode('utf-8'))
+        self.upload('permit.txt', b'building permit, floor plan')
+        self.assertEqual(run_extraction(), {'done': 2})
+
+        # Arabic letter forms in the file match Persian ones in the query, and the last word is a prefix
+        res = self.client.get('/api/documents/search?q=مالکیت پلا')
+        self.assertEqual(res.status_code, 200)
+        results = res.get_json()
+        self.assertEqual([r['شناسه'] for r in results], [deed])
+        self.assertIn('[مالکیت]', results[0]['بخش_متن'])
+        self.assertEqual(self.client.get('/api/documents/search').status_code, 400)
+
+        cases = self.client.get('/api/cases/?search=permit&view=summary').get_json()
+        self.assertEqual([c['شناسه'] for c in cases], [self.case_id])
+        self.assertEqual(self.client.get('/api/cases/?search=missing-word').get_json(), [])
+
+    def test_only_new_or_changed_files_are_extracted(self):
+        doc_id = self.upload('notes.txt', b'first draft')
+        self.assertEqual(run_extraction(), {'done': 1})
+        self.assertEqual(run_extraction(), {})
+
+        path = self.files[0]
+        with open(path, 'wb') as f:
+            f.write(b'second version with more words')
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000_000))
+        self.assertEqual(run_extraction(), {'done': 1})
+        self.assertEqual(db.session.get(DocumentText, doc_id).content, 'second version with more words')
+        self.assertEqual(self.client.get('/api/documents/search?q=draft').get_json(), [])
+
+    def test_subdivided_documents_reuse_the_parent_text(self):
+        deed = self.upload('deed.txt', b'shared deed text')
+        run_extraction()
+        res = self.client.post(f'/api/cases/{self.case_id}/subdivide?view=summary', json={'children': [
+            {'شماره_پرونده': 'E-1-1', 'docs_to_transfer': [deed]},
+            {'شماره_پرونده': 'E-1-2', 'docs_to_transfer': [deed]}]})
+        self.assertEqual(res.status_code, 201)
+
+        self.assertEqual(run_extraction(), {'copied': 1})
+        found = self.client.get('/api/documents/search?q=shared').get_json()
+        self.assertEqual(len(found), 3)
+
+    def test_unsupported_and_missing_files(self):
+        with mock.patch.object(extraction, 'PdfReader', None):
+            pdf = self.upload('scan.pdf', b'%PDF-1.4')
+            db.session.add(Document(case_id=self.case_id, title='Gone', file_path='does-not-exist.txt'))
+            db.session.commit()
+            self.assertEqual(run_extraction(), {'error': 1, 'unsupported': 1})
+        self.assertEqual(db.session.get(DocumentText, pdf).error, 'pypdf is not installed')
+        self.assertEqual(run_extraction(), {})
+
+    def test_normalize(self):
+        self.assertEqual(normalize('كتابِ  علي‌زاده\n\n  ة '), 'کتاب علی زاده\nه')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import json
+import logging
+from app import create_app
+from modules.db import db
+from modules.logger import JsonFormatter, DroppingQueueHandler
+from tests.test_system import TestConfig
+
+class SampledConfig(TestConfig):
+    LOG_2XX_SAMPLE_RATE = 0.0
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(SampledConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_handlers_attached_once(self):
+        create_app(TestConfig)
+        handlers = [h for h in logging.getLogger('api_logger').handlers if isinstance(h, DroppingQueueHandler)]
+        self.assertEqual(len(handlers), 1)
+
+    def test_sampling_keeps_errors(self):
+        with self.assertLogs('api_logger', level='INFO') as logs:
+            ok = self.client.get('/api/invoices/reports/financial', headers={'X-Request-ID': 'abc123'})
+            self.client.get('/api/cases/999999')
+        self.assertEqual(ok.headers['X-Request-ID'], 'abc123')
+        self.assertEqual(len(logs.records), 1)
+        record = logs.records[0]
+        self.assertEqual(record.status, 404)
+
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual(line['path'], '/api/cases/999999')
+        self.assertIn('latency_ms', line)
+        self.assertIn('request_id', line)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import shutil
+from app import create_app
+from modules.db import db
+from tests.test_system import TestConfig
+
+class MetricsConfig(TestConfig):
+    SLOW_QUERY_MS = 0  # every statement counts as slow
+    PROFILE_ON_DEMAND = True
+    PROFILE_DIR = 'tests/profiles'
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(MetricsConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_server_timing_and_metrics(self):
+        self.client.post('/api/cases/', json={"شماره_پرونده": "M-1"})
+        with self.assertLogs('slow_query', level='WARNING') as logs:
+            res = self.client.get('/api/cases/')
+        self.assertIn('SLOW QUERY', logs.output[0])
+
+        timing = res.headers['Server-Timing']
+        self.assertIn('app;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('ser;dur=', timing)
+        self.assertNotIn('desc="0 queries"', timing)
+
+        body = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('crm_http_request_duration_seconds_bucket{endpoint="cases.get_cases",method="GET",le="+Inf"}', body)
+        self.assertIn('crm_db_queries_per_request_count{endpoint="cases.get_cases"}', body)
+
+    def test_profile_on_demand(self):
+        res = self.client.get('/api/invoices/reports/financial', headers={'X-Profile': '1'})
+        self.assertIn('X-Profile-File', res.headers)
+        res = self.client.get('/api/invoices/reports/financial')
+        self.assertNotIn('X-Profile-File', res.headers)
+        shutil.rmtree(MetricsConfig.PROFILE_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
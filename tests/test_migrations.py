@@ -0,0 +1,141 @@
+import unittest
+import os
+import tempfile
+from sqlalchemy import create_engine, text
+from modules import migrations
+from modules.migrations import MigrationContext
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'm.db')}")
+        migrations.applied_revisions(self.engine)  # creates bookkeeping tables
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE items ("شناسه" INTEGER PRIMARY KEY, v INTEGER)'))
+            conn.execute(text('INSERT INTO items (v) VALUES ' + ', '.join(['(0)'] * 25)))
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def test_backfill_resumes_after_interruption(self):
+        messages = []
+
+        def interrupt_once(msg):
+            messages.append(msg)
+            if len(messages) == 1:
+                raise KeyboardInterrupt
+
+        ctx = MigrationContext(self.engine, '9999', log=interrupt_once)
+        with self.assertRaises(KeyboardInterrupt):
+            ctx.backfill('fill', 'items', 'v = 1', batch_size=10)
+
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT COUNT(*) FROM items WHERE v = 1')).scalar(), 10)
+
+        updated = ctx.backfill('fill', 'items', 'v = 1', batch_size=10)
+        self.assertEqual(updated, 15)
+        self.assertTrue(any('resuming' in m for m in messages))
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT COUNT(*) FROM items WHERE v = 1')).scalar(), 25)
+
+    def test_create_index_is_idempotent(self):
+        ctx = MigrationContext(self.engine, '9999', log=lambda msg: None)
+        ctx.create_index('ix_items_v', 'items', ['v'])
+        ctx.create_index('ix_items_v', 'items', ['v'])
+        self.assertTrue(ctx.has_index('items', 'ix_items_v'))
+
+    def test_one_current_owner_archives_duplicates(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE ownerships ("شناسه" INTEGER PRIMARY KEY, "شناسه_پرونده" INTEGER, "فعال" BOOLEAN)'))
+            conn.execute(text('INSERT INTO ownerships ("شناسه_پرونده", "فعال") VALUES (1, 1), (1, 1), (2, 1), (2, 0)'))
+        migrations.upgrade(self.engine, target='0002', log=lambda msg: None)
+        with self.engine.connect() as conn:
+            rows = conn.execute(text('SELECT "شناسه" FROM ownerships WHERE "فعال" = 1 ORDER BY 1')).scalars().all()
+        self.assertEqual(rows, [2, 3])
+        with self.assertRaises(Exception):
+            with self.engine.begin() as conn:
+                conn.execute(text('INSERT INTO ownerships ("شناسه_پرونده", "فعال") VALUES (1, 1)'))
+
+    def test_audit_case_id_backfill(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE audit_logs ("شناسه" INTEGER PRIMARY KEY, "بخش" VARCHAR(50), '
+                              '"شناسه_هدف" INTEGER, "جزئیات" TEXT)'))
+            conn.execute(text('CREATE TABLE lease_contracts ("شناسه" INTEGER PRIMARY KEY, "شناسه_پرونده" INTEGER, '
+                              '"مبلغ_اجاره_پایه" BIGINT)'))
+            conn.execute(text('CREATE TABLE invoices ("شناسه" INTEGER PRIMARY KEY, "شناسه_قرارداد" INTEGER, "مبلغ" BIGINT)'))
+            conn.execute(text('INSERT INTO lease_contracts VALUES (1, 7, 0)'))
+            conn.execute(text('INSERT INTO invoices VALUES (5, 1, 0)'))
+            conn.execute(text(
+                'INSERT INTO audit_logs ("بخش", "شناسه_هدف", "جزئیات") VALUES '
+                '(\'Case\', 7, \'{}\'), (\'Document\', 3, \'{"شناسه_پرونده": "7"}\'), '
+                '(\'Invoice\', 5, \'{}\'), (\'Person\', 2, \'{}\')'))
+        migrations.upgrade(self.engine, target='0003', log=lambda msg: None)
+        with self.engine.connect() as conn:
+            rows = conn.execute(text('SELECT "شناسه_پرونده" FROM audit_logs ORDER BY 1 IS NULL, "شناسه"')).scalars().all()
+        self.assertEqual(rows, [7, 7, 7, None])
+
+    def test_row_versions_start_at_one(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE cases ("شناسه" INTEGER PRIMARY KEY, "آدرس" TEXT)'))
+            conn.execute(text('INSERT INTO cases ("آدرس") VALUES (\'a\'), (\'b\')'))
+        migrations.upgrade(self.engine, target='0004', log=lambda msg: None)
+        with self.engine.connect() as conn:
+            rows = conn.execute(text('SELECT "نسخه", "تاریخ_به_روزرسانی" FROM cases')).all()
+        self.assertEqual([tuple(r) for r in rows], [(1, None), (1, None)])
+
+    def test_archival_adds_live_indexes(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE documents ("شناسه" INTEGER PRIMARY KEY, "شناسه_پرونده" INTEGER)'))
+        migrations.upgrade(self.engine, target='0005', log=lambda msg: None)
+        ctx = MigrationContext(self.engine, '0005', log=lambda msg: None)
+        self.assertTrue(ctx.has_column('documents', 'تاریخ_بایگانی'))
+        self.assertTrue(ctx.has_index('documents', 'ix_documents_live_case'))
+
+    def test_upload_processing_marks_existing_documents_ready(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE documents ("شناسه" INTEGER PRIMARY KEY, "شناسه_پرونده" INTEGER)'))
+            conn.execute(text('INSERT INTO documents ("شناسه_پرونده") VALUES (1)'))
+        migrations.upgrade(self.engine, target='0006', log=lambda msg: None)
+        with self.engine.connect() as conn:
+            row = conn.execute(text('SELECT "وضعیت_پردازش", "هش_فایل" FROM documents')).one()
+        self.assertEqual(tuple(row), ('ready', None))
+        ctx = MigrationContext(self.engine, '0006', log=lambda msg: None)
+        self.assertTrue(ctx.has_index('documents', 'ix_documents_unprocessed'))
+
+    def test_organizations_scope_natural_keys(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE organizations (id INTEGER PRIMARY KEY, code VARCHAR(50), name VARCHAR(100), '
+                              'schema_name VARCHAR(63), created_at DATETIME)'))
+            conn.execute(text('CREATE TABLE cases ("شناسه" INTEGER PRIMARY KEY, "شماره_پرونده" VARCHAR(50), '
+                              '"وضعیت" VARCHAR(20), "تاریخ_بایگانی" DATETIME)'))
+            conn.execute(text('CREATE UNIQUE INDEX "ix_cases_شماره_پرونده" ON cases ("شماره_پرونده")'))
+            conn.execute(text('INSERT INTO cases ("شماره_پرونده") VALUES (\'P-1\')'))
+        migrations.upgrade(self.engine, target='0007', log=lambda msg: None)
+        ctx = MigrationContext(self.engine, '0007', log=lambda msg: None)
+        self.assertFalse(ctx.has_index('cases', 'ix_cases_شماره_پرونده'))
+        self.assertTrue(ctx.has_index('cases', 'ix_cases_org_case_number'))
+        with self.engine.begin() as conn:
+            self.assertEqual(conn.execute(text('SELECT code FROM organizations')).scalars().all(), ['default'])
+            self.assertEqual(conn.execute(text('SELECT "شناسه_سازمان" FROM cases')).scalar(), 1)
+            # The same case number in another organization
+            conn.execute(text('INSERT INTO cases ("شماره_پرونده", "شناسه_سازمان") VALUES (\'P-1\', 2)'))
+
+    def test_hot_query_indexes(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE invoices ("شناسه" INTEGER PRIMARY KEY, "شناسه_قرارداد" INTEGER, '
+                              '"مبلغ" BIGINT, "تاریخ_صدور" DATETIME, "تاریخ_بایگانی" DATETIME)'))
+            conn.execute(text('CREATE INDEX ix_invoices_live_contract ON invoices ("شناسه_قرارداد") '
+                              'WHERE "تاریخ_بایگانی" IS NULL'))
+        migrations.upgrade(self.engine, log=lambda msg: None)
+        ctx = MigrationContext(self.engine, '0008', log=lambda msg: None)
+        self.assertTrue(ctx.has_index('invoices', 'ix_invoices_live_contract_created'))
+        self.assertFalse(ctx.has_index('invoices', 'ix_invoices_live_contract'))
+
+    def test_stamp_marks_all_applied(self):
+        migrations.stamp(self.engine)
+        self.assertTrue(all(applied for _, applied in migrations.status(self.engine)))
+        self.assertEqual(migrations.upgrade(self.engine, log=lambda msg: None), 0)
+
+if __name__ == '__main__':
+    unittest.main()
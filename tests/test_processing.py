@@ -0,0 +1,102 @@
+import unittest
+import hashlib
+import io
+import os
+import sys
+from app import create_app
+from modules.db import db
+from modules.processing import run_processing
+from modules.models import Case, Document, DocumentText
+from tests.test_system import TestConfig
+
+SCANNER = ('import sys; data = open(sys.argv[1], "rb").read(); '
+           'sys.exit(1 if b"EICAR" in data else 2 if b"BROKEN" in data else 0)')
+
+class ProcessingConfig(TestConfig):
+    UPLOAD_LIMITS = {
+        '*': {'max_size': 1000, 'types': ['text/plain', 'application/pdf']},
+        'Map': {'max_size': 10, 'types': ['text/plain']},
+    }
+    UPLOAD_SCAN_COMMAND = f'{sys.executable} -c \'{SCANNER}\''
+    UPLOAD_PROCESSORS = ['scan', 'tests.test_processing:count_words', 'extract_text']
+    UPLOAD_PROCESSING_WORKERS = 0
+
+def count_words(path, info, options):
+    with open(path, 'rb') as f:
+        if not f.read().split():
+            raise ValueError('no words')
+    return {'outcome': 'ok'}
+
+class TestProcessing(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(ProcessingConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': 'P-1', 'owner_name': 'Owner', 'owner_national_id': '1000000001'})
+        self.case_id = res.get_json()['شناسه']
+        self.before = set(os.listdir(TestConfig.UPLOAD_FOLDER))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for name in set(os.listdir(TestConfig.UPLOAD_FOLDER)) - self.before:
+            os.remove(os.path.join(TestConfig.UPLOAD_FOLDER, name))
+
+    def upload(self, filename, content, category=None):
+        data = {'case_id': str(self.case_id), 'title': filename, 'file': (io.BytesIO(content), filename)}
+        if category:
+            data['category'] = category
+        return self.client.post('/api/documents/', data=data, content_type='multipart/form-data')
+
+    def test_checksum_and_type_are_recorded(self):
+        res = self.upload('deed.txt', b'deed text')
+        self.assertEqual(res.status_code, 201)
+        doc = res.get_json()
+        self.assertEqual(doc['هش_فایل'], hashlib.sha256(b'deed text').hexdigest())
+        self.assertEqual((doc['نوع_فایل'], doc['حجم_فایل'], doc['وضعیت_پردازش']), ('text/plain', 9, 'pending'))
+
+    def test_limits_reject_before_anything_is_kept(self):
+        cases = [
+            (self.upload('setup.pdf', b'MZ\x90\x00' + b'\x00' * 20), 415),  # executable whatever its name
+            (self.upload('photo.txt', b'\x89PNG\r\n\x1a\n' + b'\x00' * 20), 415),  # not allowed in '*'
+            (self.upload('plan.txt', b'x' * 20, category='Map'), 413),  # Map allows 10 bytes
+            (self.upload('empty.txt', b''), 400),
+            (self.upload('big.txt', b'x' * 100_000), 413),  # over every limit: refused by Content-Length
+        ]
+        self.assertEqual([res.status_code for res, _ in cases], [status for _, status in cases])
+        self.assertEqual(cases[-1][0].get_json(), {'error': 'Upload is too large'})
+        self.assertEqual(set(os.listdir(TestConfig.UPLOAD_FOLDER)), self.before)
+        self.assertEqual(Document.query.count(), 0)
+
+        res = self.client.post('/api/cases/', data={
+            'شماره_پرونده': 'P-2', 'documents': (io.BytesIO(b'x' * 20), 'plan.txt'), 'doc_titles': 'Plan',
+            'doc_categories': 'Map'}, content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 413)
+        self.assertEqual(Case.query.filter_by(case_number='P-2').count(), 0)
+
+    def test_pipeline_scans_and_quarantines(self):
+        clean = self.upload('clean.txt', b'lease agreement').get_json()['شناسه']
+        infected = self.upload('bad.txt', b'EICAR test').get_json()['شناسه']
+        broken = self.upload('broken.txt', b'BROKEN scan').get_json()['شناسه']
+        blank = self.upload('blank.txt', b'   ').get_json()['شناسه']
+        self.assertEqual(self.client.get(f'/api/documents/{clean}/download').status_code, 409)
+
+        counts, texts = run_processing()
+        self.assertEqual(counts, {'ready': 1, 'quarantined': 1, 'failed': 2})
+        self.assertEqual(texts, {'done': 1})
+        self.assertEqual(self.client.get(f'/api/documents/{clean}/download').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/documents/{infected}/download').status_code, 403)
+        self.assertIn('Scanner exited with 2', db.session.get(Document, broken).processing_error)
+        self.assertEqual(db.session.get(Document, blank).processing_error, 'tests.test_processing:count_words: no words')
+        self.assertIsNone(db.session.get(DocumentText, infected))
+
+        # Nothing left to do unless failed documents are retried
+        self.assertEqual(run_processing(), ({}, {}))
+        self.assertEqual(run_processing(retry_failed=True)[0], {'failed': 2})
+
+if __name__ == '__main__':
+    unittest.main()
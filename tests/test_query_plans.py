@@ -0,0 +1,44 @@
+import unittest
+from sqlalchemy import text
+from app import create_app
+from modules.db import db
+from modules.datagen import generate
+from modules.query_plans import HOT_ENDPOINTS, HOT_WRITE_ENDPOINTS, profile_endpoints, analyze
+from tests.test_system import TestConfig
+
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        generate(120, workers=1, chunk_size=60, log=lambda msg: None)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def scans(self, endpoints):
+        profiles = profile_endpoints(self.app, endpoints)
+        for endpoint, (status, captured) in profiles.items():
+            self.assertLess(status, 400, endpoint)
+            self.assertTrue(captured, endpoint)
+        return [f for f in analyze(profiles) if f.kind == 'scan']
+
+    def test_hot_endpoints_use_indexes(self):
+        scans = self.scans(HOT_ENDPOINTS + HOT_WRITE_ENDPOINTS)
+        self.assertEqual([], [f"{f.endpoints}: {f.detail} -> {f.suggestion}" for f in scans])
+
+    def test_missing_index_is_reported(self):
+        db.session.execute(text('DROP INDEX ix_lease_contracts_live_end'))
+        db.session.execute(text('DROP INDEX ix_cases_live_parent'))
+        db.session.commit()
+        scans = self.scans(HOT_WRITE_ENDPOINTS[:1] + [('GET', '/api/cases/{case_id}', None)])
+        suggestions = {f.table: f.suggestion for f in scans}
+        self.assertEqual(set(suggestions), {'lease_contracts', 'cases'})
+        self.assertIn('("تاریخ_پایان") WHERE "تاریخ_بایگانی" IS NULL', suggestions['lease_contracts'])
+        self.assertIn('("شناسه_والد") WHERE "تاریخ_بایگانی" IS NULL', suggestions['cases'])
+
+if __name__ == '__main__':
+    unittest.main()
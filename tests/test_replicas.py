@@ -0,0 +1,78 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from app import create_app
+from modules.db import db
+from modules.models import Case
+from modules.replicas import READ_YOUR_WRITES_COOKIE
+from tests.test_system import TestConfig
+
+class TestReplicas(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, 'primary.db')
+        self.replica = os.path.join(self.directory, 'replica.db')
+
+        class ReplicaConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{self.primary}'
+            READ_REPLICA_URLS = [f'sqlite:///{self.replica}']
+            REPLICA_CHECK_INTERVAL = 0
+
+        self.app = create_app(ReplicaConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        self.writer = self.app.test_client()
+        res = self.writer.post('/api/cases/', json={'شماره_پرونده': 'R-1'})
+        self.assertEqual(res.status_code, 201)
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def case_numbers(self, client=None):
+        res = (client or self.app.test_client()).get('/api/cases/?view=summary')
+        self.assertEqual(res.status_code, 200)
+        return [case['شماره_پرونده'] for case in res.get_json()]
+
+    def replicate(self):
+        with sqlite3.connect(self.primary) as source, sqlite3.connect(self.replica) as target:
+            source.backup(target)
+
+    def test_lists_read_from_the_replica(self):
+        self.assertEqual(self.case_numbers(), [])
+        self.replicate()
+        self.assertEqual(self.case_numbers(), ['R-1'])
+        # Single-case views are not routed
+        self.assertEqual(self.app.test_client().get('/api/cases/1').status_code, 200)
+
+    def test_read_your_writes(self):
+        self.assertIsNotNone(self.writer.get_cookie(READ_YOUR_WRITES_COOKIE))
+        self.assertEqual(self.case_numbers(self.writer), ['R-1'])
+
+    def test_lagging_replica_is_skipped(self):
+        self.app.extensions['replicas'].lag_query = 'SELECT 60'
+        self.assertEqual(self.case_numbers(), ['R-1'])
+
+    def test_failed_replica_falls_back_to_primary(self):
+        with sqlite3.connect(self.replica) as conn:
+            conn.execute('DROP TABLE cases')
+        self.assertEqual(self.case_numbers(), ['R-1'])
+
+    def test_session_stays_on_primary_after_writing(self):
+        db.session.info['read_replica'] = 'replica_0'
+        self.assertEqual(Case.query.count(), 0)
+        db.session.add(Case(case_number='R-2'))
+        db.session.flush()
+        self.assertNotIn('read_replica', db.session.info)
+        self.assertEqual(Case.query.count(), 2)
+        db.session.rollback()
+
+if __name__ == '__main__':
+    unittest.main()
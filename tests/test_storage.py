@@ -0,0 +1,137 @@
+import unittest
+import io
+import shutil
+import tempfile
+from app import create_app
+from modules.db import db
+from modules.storage import LocalStorage, S3Storage, StorageError, get_storage
+from tests.test_system import TestConfig
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+class ProxiedStorage(LocalStorage):
+    """A driver without direct URLs: downloads are streamed through the app."""
+    local = False
+
+class TestLocalStorage(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.storage = LocalStorage(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_put_get_range_delete(self):
+        self.storage.put('a/b.txt', [b'hello ', b'world'])
+        self.assertEqual(self.storage.get('a/b.txt'), b'hello world')
+        self.assertEqual(self.storage.range('a/b.txt', 6, 11), b'world')
+        self.assertEqual(list(self.storage.stream('a/b.txt', chunk_size=4)), [b'hell', b'o wo', b'rld'])
+        self.assertEqual(self.storage.stat('a/b.txt')[0], 11)
+        self.storage.delete('a/b.txt')
+        self.assertFalse(self.storage.exists('a/b.txt'))
+        self.assertIsNone(self.storage.fingerprint('a/b.txt'))
+        with self.assertRaises(StorageError):
+            self.storage.get('a/b.txt')
+
+    def test_failed_put_keeps_nothing(self):
+        def chunks():
+            yield b'part'
+            raise ValueError('too big')
+        with self.assertRaises(ValueError):
+            self.storage.put('x.txt', chunks())
+        self.assertFalse(self.storage.exists('x.txt'))
+
+    def test_reserve_and_traversal(self):
+        self.assertEqual(self.storage.reserve('doc.pdf'), 'doc.pdf')
+        self.assertEqual(self.storage.reserve('doc.pdf'), 'doc_1.pdf')
+        with self.assertRaises(StorageError):
+            self.storage.put('../outside.txt', [b'x'])
+
+    def test_local_copies(self):
+        self.storage.put('a.txt', [b'a'])
+        with self.storage.local_copies(['a.txt', 'missing.txt']) as paths:
+            self.assertEqual(list(paths), ['a.txt'])
+            with open(paths['a.txt'], 'rb') as f:
+                self.assertEqual(f.read(), b'a')
+
+class TestDownloads(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': 'S-1', 'owner_name': 'Owner', 'owner_national_id': '1000000001'})
+        res = self.client.post('/api/documents/', data={
+            'case_id': str(res.get_json()['شناسه']), 'title': 'سند',
+            'file': (io.BytesIO(b'0123456789'), 'deed.txt')}, content_type='multipart/form-data')
+        self.doc_id = res.get_json()['شناسه']
+        self.file_path = res.get_json()['مسیر_فایل']
+
+    def tearDown(self):
+        get_storage().delete(self.file_path)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_local_download(self):
+        res = self.client.get(f'/api/documents/{self.doc_id}/download')
+        self.assertEqual((res.status_code, res.get_data()), (200, b'0123456789'))
+        res.close()
+
+    def test_streamed_download_with_ranges(self):
+        self.app.extensions['storage'] = ProxiedStorage(TestConfig.UPLOAD_FOLDER)
+        res = self.client.get(f'/api/documents/{self.doc_id}/download')
+        self.assertEqual((res.status_code, res.get_data()), (200, b'0123456789'))
+        self.assertIn("filename*=UTF-8''", res.headers['Content-Disposition'])
+        res = self.client.get(f'/api/documents/{self.doc_id}/download', headers={'Range': 'bytes=2-4'})
+        self.assertEqual((res.status_code, res.get_data()), (206, b'234'))
+        self.assertEqual(res.headers['Content-Range'], 'bytes 2-4/10')
+        res = self.client.get(f'/api/documents/{self.doc_id}/download', headers={'Range': 'bytes=50-'})
+        self.assertEqual(res.status_code, 416)
+
+@unittest.skipIf(mock_aws is None, 'needs boto3 and moto')
+class TestS3Storage(unittest.TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='crm-files')
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_put_stat_range(self):
+        storage = S3Storage('crm-files', prefix='docs', region='us-east-1')
+        storage.put('a/b.txt', [b'hello ', b'world'])
+        self.assertEqual(storage.stat('a/b.txt')[0], 11)
+        self.assertEqual(storage.range('a/b.txt', 6, 11), b'world')
+        self.assertEqual(storage.reserve('a/b.txt'), 'a/b_1.txt')
+        storage.delete('a/b.txt')
+        self.assertIsNone(storage.stat('a/b.txt'))
+
+    def test_download_redirects_to_presigned_url(self):
+        class S3Config(TestConfig):
+            STORAGE_BACKEND = 's3'
+            STORAGE_S3_BUCKET = 'crm-files'
+            STORAGE_S3_REGION = 'us-east-1'
+        app = create_app(S3Config)
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            res = client.post('/api/cases/', json={'شماره_پرونده': 'S-2'})
+            res = client.post('/api/documents/', data={
+                'case_id': str(res.get_json()['شناسه']), 'title': 'سند',
+                'file': (io.BytesIO(b'deed'), 'deed.txt')}, content_type='multipart/form-data')
+            res = client.get(f"/api/documents/{res.get_json()['شناسه']}/download")
+            self.assertEqual(res.status_code, 302)
+            self.assertIn('X-Amz-Signature', res.headers['Location'])
+            db.session.remove()
+            db.drop_all()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from app import create_app
+from modules.db import db
+from modules.models import Document
+from tests.test_system import TestConfig
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.first = self.create_case('S-1', '1000000001')
+        self.second = self.create_case('S-2', '1000000002')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_case(self, number, national_id):
+        res = self.client.post('/api/cases/', json={
+            'شماره_پرونده': number, 'owner_name': 'Owner', 'owner_national_id': national_id})
+        return res.get_json()['شناسه']
+
+    def test_snapshot_then_delta(self):
+        snap = self.client.get(f'/api/sync/snapshot?cases={self.first}').get_json()
+        self.assertEqual([c['شناسه'] for c in snap['upserts']['Case']], [self.first])
+        self.assertEqual([p['کد_ملی'] for p in snap['upserts']['Person']], ['1000000001'])
+        self.assertEqual(snap['upserts']['Case'][0]['نسخه'], 1)
+        self.assertFalse(snap['has_more'])
+
+        self.client.put(f'/api/cases/{self.first}', json={'آدرس': 'New'})
+        self.client.post(f'/api/cases/{self.first}/owners', json={'کد_ملی': '1000000003', 'نام_و_نام_خانوادگی': 'Buyer'})
+        self.client.put(f'/api/cases/{self.second}', json={'آدرس': 'Elsewhere'})
+        doc = Document(case_id=self.first, title='Deed', file_path='deed.pdf')
+        db.session.add(doc)
+        db.session.commit()
+        doc_id = doc.id
+        db.session.delete(doc)
+        db.session.commit()
+
+        delta = self.client.get(f"/api/sync/changes?since={snap['watermark']}&cases={self.first}").get_json()
+        upserts = delta['upserts']
+        self.assertEqual([(c['شناسه'], c['آدرس'], c['نسخه']) for c in upserts['Case']], [(self.first, 'New', 2)])
+        self.assertEqual([p['کد_ملی'] for p in upserts['Person']], ['1000000003'])
+        self.assertEqual(len(upserts['Ownership']), 2)
+        self.assertNotIn('Document', upserts)
+        self.assertEqual(delta['tombstones'], {'Document': [doc_id]})
+
+        again = self.client.get(f"/api/sync/changes?since={delta['watermark']}&cases={self.first}").get_json()
+        self.assertEqual((again['upserts'], again['tombstones']), ({}, {}))
+
+    def test_push_detects_conflicts_by_version(self):
+        res = self.client.post('/api/sync/push', json={'changes': [
+            {'model': 'Case', 'id': self.first, 'version': 1, 'data': {'آدرس': 'Field'}},
+            {'model': 'Case', 'id': self.second, 'version': 0, 'data': {'آدرس': 'Stale'}},
+            {'model': 'Case', 'id': self.first, 'version': 1, 'data': {'شماره_پرونده': 'X'}},
+            {'model': 'Document', 'id': 999, 'version': 1, 'data': {'عنوان': 'Gone'}},
+        ]})
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual(body['applied'], [{'model': 'Case', 'id': self.first, 'version': 2}])
+        self.assertEqual([(c['id'], c.get('deleted')) for c in body['conflicts']], [(self.second, None), (999, True)])
+        self.assertEqual(body['conflicts'][0]['current']['آدرس'], None)
+        self.assertEqual(len(body['rejected']), 1)
+
+        case = self.client.get(f'/api/cases/{self.first}').get_json()
+        self.assertEqual((case['آدرس'], case['نسخه']), ('Field', 2))
+
+    def test_push_rejects_duplicate_rows_and_bad_ids(self):
+        res = self.client.post('/api/sync/push', json={'changes': [
+            {'model': 'Case', 'id': self.first, 'version': 1, 'data': {'آدرس': 'A'}},
+            {'model': 'Case', 'id': self.first, 'version': 1, 'data': {'آدرس': 'B'}},
+            {'model': 'Case', 'id': [self.second], 'version': 1, 'data': {'آدرس': 'C'}},
+        ]})
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual(body['applied'], [{'model': 'Case', 'id': self.first, 'version': 2}])
+        self.assertEqual([r['change']['data']['آدرس'] for r in body['rejected']], ['B', 'C'])
+        self.assertEqual(self.client.get(f'/api/cases/{self.first}').get_json()['آدرس'], 'A')
+
+    def test_update_with_stale_version_is_refused(self):
+        res = self.client.put(f'/api/cases/{self.first}', json={'آدرس': 'A', 'نسخه': 1})
+        self.assertEqual(res.status_code, 200)
+        res = self.client.put(f'/api/cases/{self.first}', json={'آدرس': 'B', 'نسخه': 1})
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.get_json()['current']['آدرس'], 'A')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
+import os
 from app import create_app
 from modules.db import db
-from modules.models import Case, Person, LeaseContract, Invoice, AuditLog
+from modules.models import Case, Person, Ownership, LeaseContract, Invoice, AuditLog
+from sqlalchemy.exc import IntegrityError
 import io
 from datetime import datetime, timedelta
 import jdatetime
@@ -11,6 +13,11 @@ class TestConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = 'tests/uploads'
     TESTING = True
+    # API auth and rate limits have their own tests (test_api_auth.py)
+    API_AUTH_REQUIRED = False
+    RATE_LIMIT_ENABLED = False
+    # Tests run post-upload processing explicitly (test_processing.py, test_extraction.py)
+    UPLOAD_PROCESSING_BACKGROUND = False
 
 class TestSystem(unittest.TestCase):
     def setUp(self):
@@ -19,11 +26,14 @@ class TestSystem(unittest.TestCase):
         self.app_context = self.app.app_context()
         self.app_context.push()
         db.create_all()
+        self.uploads_before = set(os.listdir(TestConfig.UPLOAD_FOLDER))
 
     def tearDown(self):
         db.session.remove()
         db.drop_all()
         self.app_context.pop()
+        for name in set(os.listdir(TestConfig.UPLOAD_FOLDER)) - self.uploads_before:
+            os.remove(os.path.join(TestConfig.UPLOAD_FOLDER, name))
 
     def test_full_workflow(self):
         # 1. Create Case with Initial Owner
@@ -142,5 +152,149 @@ class TestSystem(unittest.TestCase):
         case_creation_log = [l for l in logs if l.target_model == 'Case' and l.action == 'create']
         self.assertTrue(len(case_creation_log) > 0)
 
+    def test_money_is_exact(self):
+        case = Case(case_number="MONEY-001")
+        tenant = Person(full_name="Big Tenant", national_id="5556667778")
+        db.session.add_all([case, tenant])
+        db.session.commit()
+
+        today_j = jdatetime.date.today()
+        contract_data = {
+            "شناسه_پرونده": case.id,
+            "شناسه_مستاجر": tenant.id,
+            "تاریخ_شروع": (today_j - timedelta(days=10)).strftime("%Y/%m/%d"),
+            "تاریخ_پایان": (today_j + timedelta(days=300)).strftime("%Y/%m/%d"),
+            "مبلغ_اجاره_پایه": "123456789012345.5",
+            "دوره_پرداخت": "monthly"
+        }
+        res = self.client.post('/api/contracts/', json=contract_data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.get_json()['مبلغ_اجاره_پایه'], 123456789012346)
+
+        res = self.client.post('/api/contracts/', json=dict(contract_data, مبلغ_اجاره_پایه="abc"))
+        self.assertEqual(res.status_code, 400)
+
+        self.client.post('/api/invoices/generate')
+        data = self.client.get('/api/invoices/reports/financial').get_json()
+        self.assertEqual(data['مجموع_بدهی'], 123456789012346)
+
+    def test_create_case_with_documents_summary(self):
+        data = {
+            'شماره_پرونده': 'BATCH-001',
+            'owner_name': 'Same Person',
+            'owner_national_id': '4445556667',
+            'has_contract': 'on',
+            'tenant_name': 'Same Person',
+            'tenant_national_id': '4445556667',
+            'contract_base_rent': '1000000',
+            'documents': [(io.BytesIO(b"one"), 'a.txt'), (io.BytesIO(b"two"), 'b.txt')],
+            'doc_titles': ['Deed', 'Deed'],
+        }
+        res = self.client.post('/api/cases/?view=summary', data=data, content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 201)
+        body = res.get_json()
+        self.assertEqual(len(body['شناسه_اسناد']), 2)
+        self.assertEqual(len(body['شناسه_قراردادها']), 1)
+        # Owner and tenant share one national id: only one person is created
+        self.assertEqual(Person.query.filter_by(national_id='4445556667').count(), 1)
+
+        case = self.client.get(f"/api/cases/{body['شناسه']}").get_json()
+        paths = {d['مسیر_فایل'] for d in case['اسناد']}
+        self.assertEqual(len(paths), 2)
+
+        # A failing insert leaves no staged files behind
+        before = set(os.listdir(TestConfig.UPLOAD_FOLDER))
+        data['documents'] = [(io.BytesIO(b"three"), 'c.txt')]
+        res = self.client.post('/api/cases/', data=data, content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(set(os.listdir(TestConfig.UPLOAD_FOLDER)), before)
+
+    def test_bulk_owner_transfer(self):
+        ids = []
+        for i in range(3):
+            res = self.client.post('/api/cases/', json={
+                'شماره_پرونده': f'BLOCK-{i}', 'owner_name': 'Developer', 'owner_national_id': '1111111111'})
+            ids.append(res.get_json()['شناسه'])
+        res = self.client.post(f'/api/cases/{ids[0]}/subdivide', json={
+            'reason': 'units', 'children': [{'شماره_پرونده': 'BLOCK-0-A'}]})
+        self.assertEqual(res.status_code, 201)
+
+        for bad in (ids + ['abc'], ids + [None], 'abc', 5):
+            res = self.client.post('/api/cases/transfer-owner', json={'case_ids': bad, 'کد_ملی': '2222222222'})
+            self.assertEqual(res.status_code, 400)
+
+        res = self.client.post('/api/cases/transfer-owner', json={'case_ids': ids + [9999], 'کد_ملی': '2222222222'})
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.get_json()['missing'], [9999])
+
+        res = self.client.post('/api/cases/transfer-owner', json={
+            'case_ids': ids, 'include_children': True,
+            'کد_ملی': '2222222222', 'نام_و_نام_خانوادگی': 'Buyer'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['تعداد'], 4)
+
+        buyer = Person.query.filter_by(national_id='2222222222').one()
+        for case_id in ids:
+            current = Ownership.query.filter_by(case_id=case_id, is_current=True).all()
+            self.assertEqual([o.person_id for o in current], [buyer.id])
+
+        # The database itself refuses a second current owner
+        db.session.add(Ownership(case_id=ids[1], person_id=buyer.id, start_date=datetime.utcnow().date(), is_current=True))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # A failed transfer leaves no half-created person behind
+        res = self.client.post('/api/cases/transfer-owner', json={'case_ids': ids, 'کد_ملی': '3333333333'})
+        self.assertEqual(res.status_code, 400)
+        self.assertIsNone(Person.query.filter_by(national_id='3333333333').first())
+
+    def test_bulk_subdivision(self):
+        res = self.client.post('/api/cases/', data={
+            'شماره_پرونده': 'PARCEL', 'owner_name': 'Developer', 'owner_national_id': '5555555555',
+            'documents': [(io.BytesIO(b"deed"), 'deed.pdf')], 'doc_titles': ['Deed'],
+        }, content_type='multipart/form-data')
+        parent = res.get_json()
+        doc_id = parent['اسناد'][0]['شناسه']
+
+        res = self.client.post(f"/api/cases/{parent['شناسه']}/subdivide", json={
+            'children': [{'شماره_پرونده': 'PARCEL'}, {'شماره_پرونده': 'U-1'}]})
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.get_json()['duplicates'], ['PARCEL'])
+
+        children = [{'شماره_پرونده': f'U-{i}', 'docs_to_transfer': [doc_id, 9999]} for i in range(50)]
+        res = self.client.post(f"/api/cases/{parent['شناسه']}/subdivide?view=summary",
+                               json={'children': children, 'clone_ownership': True})
+        self.assertEqual(res.status_code, 201)
+        child_ids = res.get_json()['شناسه_زیر_پرونده_ها']
+        self.assertEqual(len(child_ids), 50)
+
+        child = self.client.get(f'/api/cases/{child_ids[7]}').get_json()
+        self.assertEqual(child['شماره_پرونده'], 'U-7')
+        self.assertEqual(child['شناسه_والد'], parent['شناسه'])
+        self.assertEqual([d['عنوان'] for d in child['اسناد']], ['Deed'])
+        self.assertEqual(child['سوابق_مالکیت'][0]['مالک']['کد_ملی'], '5555555555')
+        self.assertEqual(AuditLog.query.filter_by(target_model='Case', action='create').count(), 51)
+
+    def test_case_list_pages(self):
+        for i in range(7):
+            db.session.add(Case(case_number=f"PAGE-{i}", address=f"Street {i}"))
+        db.session.commit()
+
+        first = self.client.get('/api/cases/?limit=3&view=summary').get_json()
+        self.assertEqual(first['total'], 7)
+        self.assertEqual([c['شماره_پرونده'] for c in first['items']], ['PAGE-0', 'PAGE-1', 'PAGE-2'])
+        self.assertNotIn('اسناد', first['items'][0])
+
+        last = self.client.get('/api/cases/?limit=3&offset=6&view=summary').get_json()
+        self.assertNotIn('total', last)
+        self.assertEqual(len(last['items']), 1)
+
+        searched = self.client.get('/api/cases/?limit=10&search=Street 4').get_json()
+        self.assertEqual(searched['total'], 1)
+
+        # Without limit the legacy full list is returned
+        self.assertEqual(len(self.client.get('/api/cases/').get_json()), 7)
+
 if __name__ == '__main__':
     unittest.main()
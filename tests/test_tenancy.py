@@ -0,0 +1,120 @@
+import unittest
+from flask import g
+from app import create_app
+from modules.db import db
+from modules.api_auth import create_token
+from modules.cache import get_cache
+from modules.models import Case, Person, AuditLog
+from modules.tenancy import create_organization, use_organization, TenancyError
+from tests.test_system import TestConfig
+
+class TestTenancy(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        north, south = create_organization('north', 'District 1'), create_organization('south', 'District 2')
+        db.session.flush()
+        self.north_id, self.south_id = north.id, south.id
+        self.headers = {}
+        for organization in (north, south):
+            api_token, token = create_token(organization.code, organization_id=organization.id)
+            db.session.add(api_token)
+            self.headers[organization.id] = {'Authorization': f'Bearer {token}'}
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post_case(self, organization_id, case_number, national_id='1000000001'):
+        return self.client.post('/api/cases/', headers=self.headers[organization_id], json={
+            'شماره_پرونده': case_number, 'owner_name': 'Owner', 'owner_national_id': national_id})
+
+    def test_organizations_only_see_their_own_rows(self):
+        # Natural keys repeat across organizations
+        north_case = self.post_case(self.north_id, 'P-1')
+        south_case = self.post_case(self.south_id, 'P-1')
+        self.assertEqual((north_case.status_code, south_case.status_code), (201, 201))
+        self.assertEqual(self.post_case(self.north_id, 'P-1').status_code, 400)
+        north_id, south_id = north_case.get_json()['شناسه'], south_case.get_json()['شناسه']
+
+        res = self.client.get('/api/cases/?view=summary', headers=self.headers[self.south_id])
+        self.assertEqual([c['شناسه'] for c in res.get_json()], [south_id])
+        self.assertEqual(self.client.get(f'/api/cases/{north_id}', headers=self.headers[self.south_id]).status_code,
+                         404)
+        changes = self.client.get('/api/changes?since=0', headers=self.headers[self.north_id]).get_json()
+        self.assertTrue(changes['changes'])
+        self.assertTrue(all(c['case_id'] in (north_id, None) for c in changes['changes']))
+
+        with use_organization(self.south_id):
+            self.assertEqual(Person.query.count(), 1)
+            self.assertEqual(get_cache().get(Case, 'case_number', 'P-1').id, south_id)
+        with use_organization(self.north_id):
+            self.assertEqual(get_cache().get(Case, 'case_number', 'P-1').id, north_id)
+            self.assertTrue(all(a.organization_id == self.north_id for a in AuditLog.query))
+
+        # Outside a request nothing is scoped
+        g.pop('organization_id', None)
+        self.assertEqual(Case.query.count(), 2)
+        self.assertEqual(Case.query.execution_options(all_organizations=True).count(), 2)
+
+    def test_bulk_updates_are_scoped(self):
+        north_id = self.post_case(self.north_id, 'P-1').get_json()['شناسه']
+        res = self.client.delete(f'/api/cases/{north_id}', headers=self.headers[self.south_id])
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/cases/{north_id}', headers=self.headers[self.north_id]).status_code,
+                         200)
+
+    def test_client_supplied_organization_is_ignored(self):
+        res = self.post_case(self.north_id, 'P-1')
+        self.assertEqual(res.get_json()['شناسه_سازمان'], self.north_id)
+        case_id = res.get_json()['شناسه']
+        res = self.client.put(f'/api/cases/{case_id}', headers=self.headers[self.north_id],
+                              json={'شناسه_سازمان': self.south_id, 'آدرس': 'North street'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['شناسه_سازمان'], self.north_id)
+        res = self.client.put(f'/api/cases/{case_id}', headers=self.headers[self.north_id],
+                              json={'organization_id': self.south_id})
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.client.get(f'/api/cases/{case_id}', headers=self.headers[self.south_id]).status_code,
+                         404)
+
+    def test_ids_in_request_bodies_must_be_visible(self):
+        north_case = self.post_case(self.north_id, 'P-1').get_json()
+        north_person = north_case['سوابق_مالکیت'][0]['شناسه_شخص']
+        south_case = self.post_case(self.south_id, 'P-2', national_id='1000000002').get_json()
+        contract = {'شناسه_پرونده': north_case['شناسه'], 'شناسه_مستاجر': north_person, 'تاریخ_شروع': '1403/01/01',
+                    'تاریخ_پایان': '1404/01/01', 'مبلغ_اجاره_پایه': 1000, 'دوره_پرداخت': 'monthly'}
+        res = self.client.post('/api/contracts/', headers=self.headers[self.south_id], json=contract)
+        self.assertEqual(res.status_code, 404)
+        res = self.client.post('/api/contracts/', headers=self.headers[self.south_id],
+                               json=dict(contract, شناسه_پرونده=south_case['شناسه']))
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(self.client.post('/api/contracts/', headers=self.headers[self.north_id],
+                                          json=contract).status_code, 201)
+        # The financial page posts its form fields as strings
+        as_strings = dict(contract, شناسه_پرونده=str(north_case['شناسه']), شناسه_مستاجر=str(north_person))
+        self.assertEqual(self.client.post('/api/contracts/', headers=self.headers[self.north_id],
+                                          json=as_strings).status_code, 201)
+        self.assertEqual(self.client.post('/api/contracts/', headers=self.headers[self.south_id],
+                                          json=as_strings).status_code, 404)
+
+        res = self.client.put(f"/api/cases/{south_case['شناسه']}", headers=self.headers[self.south_id],
+                              json={'شناسه_والد': north_case['شناسه']})
+        self.assertEqual(res.status_code, 404)
+        res = self.client.post('/api/cases/', headers=self.headers[self.south_id],
+                               json={'شماره_پرونده': 'P-3', 'شناسه_والد': north_case['شناسه']})
+        self.assertEqual(res.status_code, 404)
+
+    def test_schema_per_organization_needs_postgresql(self):
+        with self.assertRaises(TenancyError):
+            create_organization('east', 'District 3', schema='east')
+        with self.assertRaises(TenancyError):
+            create_organization('north', 'Again')
+
+if __name__ == '__main__':
+    unittest.main()
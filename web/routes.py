@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from modules.models import User
+from modules.cache import get_cache
+from modules.auth import verify_password, AuthBusy
 
 web_bp = Blueprint('web', __name__, template_folder='../templates', static_folder='../static')
 
@@ -12,8 +14,13 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        user = get_cache().get(User, 'username', username, attach=False)
+        try:
+            ok = verify_password(user, password)
+        except AuthBusy:
+            flash('سرور مشغول است، لطفاً چند لحظه دیگر دوباره تلاش کنید.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '2'}
+        if ok:
             login_user(user)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('web.dashboard'))